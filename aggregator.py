@@ -0,0 +1,491 @@
+'''
+Apache license 2.0
+Version 2.0, January 2004
+Read https://www.apache.org/licenses/LICENSE-2.0
+Full License is in /LICENCE file
+'''
+# 全班排行榜汇总服务：局域网内的一个asyncio TCP服务，各台电脑把每日分数批量推送上来，合并成一个排行榜
+#
+# 协议：每行一个JSON对象（UTF-8，以\n结尾），一个连接上可以连续发送多个请求
+#   推送  {"op": "push", "seq": 7, "base": 739900, "updates": [["pc1", 0, 42], ["pc1/小明", -1, 30]]}
+#         updates里的日期是相对base（date.toordinal()）的天数；回复 {"ack": 7}
+#   查询  {"op": "top", "limit": 10}
+#         回复 {"top": [{"client": "pc1", "date": "2026-10-17", "score": 42}, ...], "count": 123}
+# 服务设置了--token时，每个请求都要带上相同的"token"字段，否则回复 {"error": "unauthorized"}。
+# 同一客户端同一天只保留最高分，所以重复推送（重试）不会出错。
+#
+# 默认只监听本机；在局域网里使用时指定--host，并用--token防止别人写入分数：
+#   python aggregator.py --host 0.0.0.0 --port 8765 --token=口令
+#   python main.py --aggregate=192.168.1.10:8765 --aggregate-token=口令
+import os
+import sys
+import json
+import time
+import hmac
+import bisect
+import socket
+import asyncio
+import argparse
+import datetime
+import threading
+from pathlib import Path
+from storage import APPDATA_PATH, LEADERBOARD_TOP
+
+DEFAULT_PORT = 8765
+AGGREGATE_LOG_FILE = os.path.join(APPDATA_PATH, "class_leaderboard.jsonl")
+PENDING_FILE = os.path.join(APPDATA_PATH, "aggregate_pending.json")
+MAX_LINE = 1 << 20  # 单个请求的最大长度
+
+# ======================
+# 服务端
+# ======================
+class ClassLeaderboard:
+    """合并后的排行榜索引：(客户端, 日期)->分数的字典，加一个按分数从高到低保持有序的列表（bisect维护）
+
+    merge只改内存；有变化的项积攒起来，由服务定期一次追加到日志文件（每行一项），
+    日志里的重复项过多时整体重写一次。
+    """
+    def __init__(self, path=AGGREGATE_LOG_FILE):
+        self.path = path
+        self._scores = {}    # (客户端, 日期) -> 分数
+        self._ordered = []   # (-分数, 日期, 客户端)
+        self._dirty = {}     # 还没写入日志的变化
+        self._lines = 0
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    self._lines += 1
+                    try:
+                        client, date_str, score = json.loads(line)
+                    except (ValueError, TypeError):
+                        continue  # 跳过写了一半的行
+                    key = (client, date_str)
+                    if score > self._scores.get(key, score - 1):
+                        self._scores[key] = score
+        except FileNotFoundError:
+            pass
+        except IOError as e:
+            print(f"Loading class leaderboard failed: {e}")
+        self._ordered = sorted((-score, date_str, client) for (client, date_str), score in self._scores.items())
+
+    def merge(self, client, date_str, score):
+        """同一客户端同一天只保留最高分，返回是否有变化"""
+        key = (client, date_str)
+        old = self._scores.get(key)
+        if old is not None and score <= old:
+            return False
+        if old is not None:
+            del self._ordered[bisect.bisect_left(self._ordered, (-old, date_str, client))]
+        bisect.insort(self._ordered, (-score, date_str, client))
+        self._scores[key] = score
+        self._dirty[key] = score
+        return True
+
+    def top(self, limit):
+        return [{"client": client, "date": date_str, "score": -neg_score}
+                for neg_score, date_str, client in self._ordered[:limit]]
+
+    def __len__(self):
+        return len(self._scores)
+
+    def take_changes(self):
+        """取走积攒的变化，返回要写入的内容（None表示没有变化）；在事件循环线程调用"""
+        if not self._dirty:
+            return None
+        if self._lines > 2 * len(self._scores) + 100:
+            # 重复项太多，整体重写
+            items, rewrite = dict(self._scores), True
+            self._lines = len(items)
+        else:
+            items, rewrite = self._dirty, False
+            self._lines += len(items)
+        self._dirty = {}
+        return items, rewrite
+
+    def write_changes(self, items, rewrite):
+        """把take_changes的结果写入日志（可以在其他线程调用）"""
+        try:
+            Path(os.path.dirname(self.path)).mkdir(parents=True, exist_ok=True)
+            text = "".join(json.dumps([client, date_str, score], ensure_ascii=False) + "\n"
+                           for (client, date_str), score in items.items())
+            if rewrite:
+                temp_file = self.path + '.tmp'
+                with open(temp_file, 'w', encoding='utf-8') as f:
+                    f.write(text)
+                os.replace(temp_file, self.path)
+            else:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(text)
+        except Exception as e:
+            print(f"Saving class leaderboard failed: {e}")
+
+
+class AggregationServer:
+    """排行榜汇总服务（asyncio）；分数只在内存里合并，每flush_interval秒把变化批量写入日志
+
+    token不为None时只接受带有相同token的请求。
+    """
+    def __init__(self, board=None, host="127.0.0.1", port=DEFAULT_PORT, flush_interval=2.0, token=None):
+        self.board = board if board is not None else ClassLeaderboard()
+        self.host = host
+        self.port = port
+        self.flush_interval = flush_interval
+        self.token = token
+        self.rejected = 0
+        self.requests = 0
+        self.updates = 0
+        self._writers = set()
+        self._server = None
+        self._flusher = None
+
+    async def start(self):
+        self.board.load()
+        self._server = await asyncio.start_server(self._handle, self.host, self.port, limit=MAX_LINE)
+        self.port = self._server.sockets[0].getsockname()[1]  # port为0时由系统分配
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._writers):
+                writer.close()
+            await self._server.wait_closed()
+        if self._flusher is not None:
+            self._flusher.cancel()
+        await self._flush()
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self._flush()
+
+    async def _flush(self):
+        changes = self.board.take_changes()
+        if changes is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self.board.write_changes, *changes)
+
+    @property
+    def connections(self):
+        return len(self._writers)
+
+    async def _handle(self, reader, writer):
+        self._writers.add(writer)
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, ConnectionError):
+                    break  # 请求过长或连接断开
+                if not line:
+                    break
+                writer.write(self.handle_request(line))
+                await writer.drain()
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    def handle_request(self, line):
+        """处理一行请求，返回回复（bytes）"""
+        self.requests += 1
+        try:
+            request = json.loads(line)
+            op = request.get("op")
+            if self.token is not None and not hmac.compare_digest(
+                    str(request.get("token", "")).encode('utf-8'), self.token.encode('utf-8')):
+                self.rejected += 1
+                reply = {"error": "unauthorized"}
+            elif op == "push":
+                base = int(request.get("base", 0))
+                for client, offset, score in request["updates"]:
+                    date_str = str(datetime.date.fromordinal(base + int(offset)))
+                    self.board.merge(str(client), date_str, int(score))
+                self.updates += len(request["updates"])
+                reply = {"ack": request.get("seq")}
+            elif op == "top":
+                limit = min(int(request.get("limit", 10)), LEADERBOARD_TOP)
+                reply = {"top": self.board.top(limit), "count": len(self.board)}
+            else:
+                reply = {"error": f"unknown op: {op}"}
+        except (ValueError, KeyError, TypeError, AttributeError, OverflowError) as e:
+            reply = {"error": str(e)}
+        return (json.dumps(reply, ensure_ascii=False) + "\n").encode('utf-8')
+
+
+def serve_in_thread(board=None, host="127.0.0.1", port=0, flush_interval=2.0, token=None):
+    """在后台线程的事件循环里启动服务（port为0时随机端口），返回(服务, 停止函数)；供测试和单机使用"""
+    loop = asyncio.new_event_loop()
+    server = AggregationServer(board, host, port, flush_interval, token)
+    started = threading.Event()
+
+    def run():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(server.start())
+        started.set()
+        loop.run_forever()
+        loop.run_until_complete(server.close())
+        loop.close()
+
+    thread = threading.Thread(target=run, name="PlanTreeAggregator", daemon=True)
+    thread.start()
+    started.wait()
+
+    def stop():
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+    return server, stop
+
+# ======================
+# 客户端
+# ======================
+class AggregatorClient:
+    """把分数批量推送到汇总服务
+
+    submit只更新待发送的字典（同一项只保留最高分），后台线程每flush_interval秒发送一次，
+    只发送服务端还没确认过的变化。服务连不上时数据留在字典里，按指数退避重试；
+    关闭时还没发出去的分数写入pending_file，下次启动时继续发送。
+    全班排行榜也由后台线程查询（每top_interval秒，或request_top之后），界面只读缓存的结果。
+    """
+    def __init__(self, host, port=DEFAULT_PORT, client_id=None, flush_interval=5.0, timeout=3.0,
+                 pending_file=PENDING_FILE, max_backoff=60.0, token=None, top_limit=10, top_interval=60.0):
+        self.host = host
+        self.port = port
+        self.client_id = client_id or socket.gethostname()
+        self.token = token
+        self.top_limit = top_limit
+        self.top_interval = top_interval
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+        self.pending_file = pending_file
+        self.max_backoff = max_backoff
+        self._cond = threading.Condition()
+        self._pending = {}    # (名称, 日期) -> 分数
+        self._acked = {}      # 服务端已确认的分数
+        self._closing = False
+        self._thread = None
+        self._sock = None
+        self._reader = None
+        self._seq = 0
+        self._top = None          # 最近一次查询到的(前top_limit名, 总条数)
+        self._top_fetched = None  # 查询时间（time.monotonic()），None表示还没查过
+        self._top_requested = True
+        self.online = True
+        self.sent_batches = 0
+        self.failures = 0
+
+    def start(self):
+        self._load_pending()
+        self._thread = threading.Thread(target=self._run, name="PlanTreeUploader", daemon=True)
+        self._thread.start()
+
+    def submit(self, key, score):
+        """key为日期，或教室模式的(座位, 日期)"""
+        if isinstance(key, tuple):
+            seat, date_str = key
+            name = f"{self.client_id}/{seat}"
+        else:
+            name, date_str = self.client_id, key
+        item = (name, date_str)
+        with self._cond:
+            if score > max(self._pending.get(item, -1), self._acked.get(item, -1)):
+                self._pending[item] = score
+
+    def cached_top(self):
+        """最近一次查询到的全班排行榜(前top_limit名, 总条数)，还没查到时返回None；不访问网络"""
+        with self._cond:
+            return self._top
+
+    def request_top(self):
+        """让后台线程尽快重新查询全班排行榜（打开排行榜对话框时调用）"""
+        with self._cond:
+            self._top_requested = True
+            self._cond.notify()
+
+    def close(self, timeout=None):
+        """最后尝试发送一次，剩下的写入pending_file"""
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(self.timeout * 2 if timeout is None else timeout)
+        with self._cond:
+            pending = dict(self._pending)
+        self._save_pending(pending)
+
+    def _run(self):
+        backoff = self.flush_interval
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._closing or self._top_requested, backoff)
+                closing = self._closing
+                batch = dict(self._pending)
+                want_top = not closing and (self._top_requested or self._top_fetched is None
+                                            or time.monotonic() - self._top_fetched >= self.top_interval)
+                self._top_requested = False
+            if batch:
+                if self._send(batch):
+                    backoff = self.flush_interval
+                    with self._cond:
+                        for item, score in batch.items():
+                            self._acked[item] = max(score, self._acked.get(item, score))
+                            if self._pending.get(item) == score:
+                                del self._pending[item]
+                else:
+                    self.failures += 1
+                    backoff = min(backoff * 2, self.max_backoff)
+            if want_top:
+                self._fetch_top()
+            if closing:
+                self._disconnect()
+                return
+
+    def _send(self, batch):
+        """发送一批分数并等待确认；失败时断开连接，下次重新连接"""
+        base = max(datetime.date.fromisoformat(date_str).toordinal() for _, date_str in batch)
+        self._seq += 1
+        request = {
+            "op": "push",
+            "seq": self._seq,
+            "base": base,
+            "updates": [[name, datetime.date.fromisoformat(date_str).toordinal() - base, score]
+                        for (name, date_str), score in batch.items()],
+        }
+        try:
+            reply = self._request(request)
+            if reply.get("ack") != self._seq:
+                raise ValueError(f"unexpected reply: {reply}")
+            self.sent_batches += 1
+            self.online = True
+            return True
+        except (OSError, ValueError) as e:
+            if self.online:
+                print(f"Uploading scores failed: {e}, will retry")
+            self.online = False
+            self._disconnect()
+            return False
+
+    def _fetch_top(self):
+        """查询全班排行榜并缓存；失败时保留上一次的结果"""
+        try:
+            reply = self._request({"op": "top", "limit": self.top_limit})
+            top = reply["top"], reply["count"]
+        except (OSError, ValueError, KeyError) as e:
+            if self.online:
+                print(f"Querying class leaderboard failed: {e}")
+            self.online = False
+            self._disconnect()
+            return
+        with self._cond:
+            self._top = top
+            self._top_fetched = time.monotonic()
+
+    def _request(self, request):
+        """在后台线程的长连接上发送一个请求并读取回复（需要时先连接）"""
+        if self._sock is None:
+            self._sock = socket.create_connection((self.host, self.port), self.timeout)
+            self._reader = self._sock.makefile('rb')
+        if self.token is not None:
+            request["token"] = self.token
+        self._sock.sendall((json.dumps(request, ensure_ascii=False) + "\n").encode('utf-8'))
+        reply = json.loads(self._reader.readline())
+        if "error" in reply:
+            raise ValueError(reply["error"])
+        return reply
+
+    def _disconnect(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+        self._reader = None
+
+    def _load_pending(self):
+        if self.pending_file is None:
+            return
+        try:
+            with open(self.pending_file, 'r', encoding='utf-8') as f:
+                for name, date_str, score in json.load(f):
+                    self._pending[(name, date_str)] = max(score, self._pending.get((name, date_str), score))
+        except FileNotFoundError:
+            pass
+        except (ValueError, TypeError, IOError) as e:
+            print(f"Loading pending scores failed: {e}")
+
+    def _save_pending(self, pending):
+        if self.pending_file is None:
+            return
+        try:
+            if not pending:
+                if os.path.exists(self.pending_file):
+                    os.remove(self.pending_file)
+                return
+            Path(os.path.dirname(self.pending_file)).mkdir(parents=True, exist_ok=True)
+            temp_file = self.pending_file + '.tmp'
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump([[name, date_str, score] for (name, date_str), score in pending.items()],
+                          f, ensure_ascii=False)
+            os.replace(temp_file, self.pending_file)
+        except Exception as e:
+            print(f"Saving pending scores failed: {e}")
+
+
+def parse_address(text):
+    """解析 host:port（省略端口时用DEFAULT_PORT）"""
+    host, sep, port = text.rpartition(':')
+    if not sep:
+        return text, DEFAULT_PORT
+    return host, int(port)
+
+def start_uploader(store, aggregate):
+    """按--aggregate=("地址:端口", 本机名称, 口令)创建并启动客户端，挂到存储（BackgroundSaver）上；地址无效时返回None"""
+    address, client_id, token = aggregate
+    try:
+        host, port = parse_address(address)
+    except ValueError as e:
+        print(f"Invalid aggregate address {address}: {e}")
+        return None
+    uploader = AggregatorClient(host, port, client_id, token=token)
+    uploader.start()
+    store.uploader = uploader
+    return uploader
+
+# ======================
+# 命令行
+# ======================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PlanTree class leaderboard aggregation server")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="address to listen on (default: this machine only; 0.0.0.0 for the whole LAN)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--token", help="shared secret clients must send (--aggregate-token)")
+    parser.add_argument("--data", default=AGGREGATE_LOG_FILE, help="leaderboard log file")
+    parser.add_argument("--flush-interval", type=float, default=2.0, help="seconds between log writes")
+    args = parser.parse_args(argv)
+
+    async def run():
+        server = AggregationServer(ClassLeaderboard(args.data), args.host, args.port, args.flush_interval,
+                                   args.token)
+        await server.start()
+        print(f"Aggregating scores on {args.host}:{server.port}, {len(server.board)} entries loaded")
+        if args.token is None and args.host not in ("127.0.0.1", "localhost", "::1"):
+            print("Warning: no --token set, anyone who can reach this port can submit scores")
+        started = time.monotonic()
+        try:
+            while True:
+                await asyncio.sleep(60)
+                print(f"{server.connections} clients, {server.requests} requests, "
+                      f"{server.updates} updates, {server.rejected} rejected in {time.monotonic() - started:.0f}s", file=sys.stderr)
+        finally:
+            await server.close()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
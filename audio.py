@@ -0,0 +1,209 @@
+'''
+Apache license 2.0
+Version 2.0, January 2004
+Read https://www.apache.org/licenses/LICENSE-2.0
+Full License is in /LICENCE file
+'''
+import sys
+import time
+import numpy as np
+from dsp import LoudnessFrontEnd
+from perf import stats as perf_stats
+
+class LoudnessRing:
+    """单生产者/单消费者环形缓冲区：音频线程写入每个block的音量和时间戳，界面线程一次取走
+
+    只有生产者修改_head，只有消费者修改_tail，依靠GIL保证整数赋值的原子性，不需要加锁。
+    width不为None时每个block的音量是长度为width的数组（多声道），drain返回(block数, width)的数组。
+    """
+    def __init__(self, capacity=256, width=None):
+        self.capacity = capacity
+        shape = capacity if width is None else (capacity, width)
+        self._values = np.zeros(shape, dtype=np.int64)
+        self._stamps = np.zeros(capacity, dtype=np.float64)
+        self._head = 0  # 已写入的block总数
+        self._tail = 0  # 已读取的block总数
+        self._wake_pending = False
+        self.notify = None  # 有新数据时调用（合并唤醒，消费者取走之前只调用一次）
+        self.dropped = 0
+
+    def push(self, value, stamp):
+        head = self._head
+        if head - self._tail >= self.capacity:
+            # 缓冲区满（界面线程卡住太久），丢弃最新的block
+            self.dropped += 1
+            perf_stats.count("dropped_blocks")
+            return False
+        i = head % self.capacity
+        self._values[i] = value
+        self._stamps[i] = stamp
+        self._head = head + 1  # 数据写完后再发布
+
+        if self.notify is not None and not self._wake_pending:
+            self._wake_pending = True
+            self.notify()
+        return True
+
+    def drain(self):
+        """取走所有未读的block，返回(音量数组, 时间戳数组)"""
+        self._wake_pending = False
+        head = self._head
+        tail = self._tail
+        count = head - tail
+        start = tail % self.capacity
+        end = start + count
+        if end <= self.capacity:
+            values = self._values[start:end].copy()
+            stamps = self._stamps[start:end].copy()
+        else:
+            end -= self.capacity
+            values = np.concatenate((self._values[start:], self._values[:end]))
+            stamps = np.concatenate((self._stamps[start:], self._stamps[:end]))
+        self._tail = head
+        return values, stamps
+
+loudness_ring = LoudnessRing()
+
+# ======================
+# 采集配置
+# ======================
+# 名称: (采样率, block大小, 样本类型)。省电配置每秒只唤醒约4次，int16样本，不计权时全程整数运算
+CAPTURE_PROFILES = {
+    "standard": (16000, 512, "float32"),
+    "low_power": (8000, 2048, "int16"),
+}
+
+class CaptureStats:
+    """按采集配置统计音频回调的耗时（回调线程的CPU时间和墙钟时间）"""
+    def __init__(self):
+        self._profiles = {}
+
+    def add(self, profile, cpu, wall, audio_seconds):
+        entry = self._profiles.get(profile)
+        if entry is None:
+            entry = self._profiles[profile] = [0, 0.0, 0.0, 0.0]
+        entry[0] += 1
+        entry[1] += cpu
+        entry[2] += wall
+        entry[3] += audio_seconds
+
+    def report(self):
+        """返回{配置名: (回调次数, 每次回调CPU微秒, 每次回调墙钟微秒, CPU占音频时长的比例)}"""
+        result = {}
+        for profile, (calls, cpu, wall, audio_seconds) in self._profiles.items():
+            result[profile] = (calls, cpu / calls * 1e6, wall / calls * 1e6,
+                               cpu / audio_seconds if audio_seconds else 0.0)
+        return result
+
+capture_stats = CaptureStats()
+# 音频线程里使用的音量前端（滤波状态和缓冲区都在里面，只在音频线程调用）
+loudness_front_end = LoudnessFrontEnd()
+capture_profile = "standard"
+
+def count_status(status):
+    """把PortAudio报告的状态（溢出等）计入计数器，同时打印出来"""
+    print(status, file=sys.stderr)
+    perf_stats.count("xruns")
+    for flag in ("input_overflow", "input_underflow"):
+        if getattr(status, flag, False):
+            perf_stats.count(flag)
+
+def audio_callback(indata, frames, time_info, status):
+    cpu_start = time.thread_time()
+    wall_start = time.perf_counter()
+    if status:
+        count_status(status)
+    front_end = loudness_front_end
+    loudness = front_end.process(indata[:, 0])
+    loudness_ring.push(loudness, time.monotonic())
+    wall = time.perf_counter() - wall_start
+    capture_stats.add(capture_profile, time.thread_time() - cpu_start, wall, frames / front_end.samplerate)
+    if perf_stats.enabled:
+        perf_stats.record("audio_callback", wall)
+
+def load_sounddevice():
+    """导入sounddevice（同时初始化PortAudio，比较慢），可以提前在后台线程调用"""
+    import sounddevice
+    return sounddevice
+
+def start_microphone_monitor(front_end=None, profile="standard"):
+    """按采集配置打开默认输入设备；front_end的采样率和block大小应与配置一致
+
+    切换配置时先用stop_microphone_monitor关掉旧的stream，再用新配置调用本函数。
+    """
+    global loudness_front_end, capture_profile
+    samplerate, blocksize, dtype = CAPTURE_PROFILES[profile]
+    if front_end is None:
+        front_end = LoudnessFrontEnd(samplerate, blocksize)
+    loudness_front_end = front_end
+    capture_profile = profile
+    try:
+        sd = load_sounddevice()
+        # 获取默认输入设备信息
+        default_input = sd.query_devices(kind='input')
+        print(f"Using audio device: {default_input['name']} ({profile})")
+
+        stream = sd.InputStream(
+            callback=audio_callback,
+            channels=1,
+            samplerate=samplerate,
+            blocksize=blocksize,
+            dtype=dtype
+        )
+        stream.start()
+        return stream
+    except Exception as e:
+        print(f"Audio initialization error: {e}")
+        # 返回一个模拟的stream对象，避免程序崩溃
+        return MockStream()
+
+def start_multichannel_monitor(front_end, ring, device=None, profile="standard"):
+    """打开一个输入设备的front_end.channels个声道，每个block一次算出所有声道的音量写入ring
+
+    front_end是MultiChannelFrontEnd，ring是LoudnessRing(width=front_end.channels)；
+    每个设备各用一个stream、一个front_end和一个ring，回调之间没有共享状态。
+    """
+    samplerate, blocksize, dtype = CAPTURE_PROFILES[profile]
+    stats_name = f"{profile} @ {device if device is not None else 'default'}"
+
+    def callback(indata, frames, time_info, status):
+        cpu_start = time.thread_time()
+        wall_start = time.perf_counter()
+        if status:
+            count_status(status)
+        ring.push(front_end.process(indata), time.monotonic())
+        wall = time.perf_counter() - wall_start
+        capture_stats.add(stats_name, time.thread_time() - cpu_start, wall, frames / samplerate)
+        if perf_stats.enabled:
+            perf_stats.record("audio_callback", wall)
+
+    try:
+        sd = load_sounddevice()
+        info = sd.query_devices(device, kind='input')
+        print(f"Using audio device: {info['name']} ({front_end.channels} channels, {profile})")
+
+        stream = sd.InputStream(
+            device=device,
+            callback=callback,
+            channels=front_end.channels,
+            samplerate=samplerate,
+            blocksize=blocksize,
+            dtype=dtype
+        )
+        stream.start()
+        return stream
+    except Exception as e:
+        print(f"Audio initialization error ({device}): {e}")
+        return MockStream()
+
+class MockStream:
+    """打不开音频设备时返回的模拟stream对象，避免程序崩溃"""
+    def start(self): pass
+    def stop(self): pass
+    def close(self): pass
+
+def stop_microphone_monitor(stream):
+    if hasattr(stream, 'stop') and callable(stream.stop):
+        stream.stop()
+    if hasattr(stream, 'close') and callable(stream.close):
+        stream.close()
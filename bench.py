@@ -0,0 +1,379 @@
+'''
+Apache license 2.0
+Version 2.0, January 2004
+Read https://www.apache.org/licenses/LICENSE-2.0
+Full License is in /LICENCE file
+'''
+# 核心路径的基准测试：游戏逻辑、排行榜、流式布局、存储读写和音频回调，不需要显示器和音频设备
+#
+# 用法示例：
+#   python bench.py --save-baseline             # 记录基准（bench_baseline.json）
+#   python bench.py                             # 与基准比较，变慢超过容差时返回1
+#   python bench.py --filter leaderboard -o result.json
+import os
+import sys
+import json
+import random
+import timeit
+import argparse
+import platform
+import datetime
+import tempfile
+import statistics
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(HERE, "bench_baseline.json")
+
+BENCHMARKS = []
+
+def benchmark(func):
+    """注册一组基准：func(quick)返回[(名称, 无参函数, 每次调用包含的操作数)]
+
+    无参函数通过默认参数引用它用到的对象（Qt控件等），保证计时期间不被回收。
+    """
+    BENCHMARKS.append(func)
+    return func
+
+def measure(func, ops=1, repeat=5):
+    """多轮计时（每轮至少约0.2秒），返回每次操作的秒数：{"median", "min", "ops"}"""
+    timer = timeit.Timer(func)  # 计时期间关闭垃圾回收
+    number, _ = timer.autorange()
+    times = [t / (number * ops) for t in timer.repeat(repeat, number)]
+    return {"median": statistics.median(times), "min": min(times), "ops": number * ops}
+
+# ======================
+# 游戏逻辑
+# ======================
+@benchmark
+def tree_benchmarks(quick):
+    import numpy as np
+    from tree_manager import TreeManager
+    rng = random.Random(0)
+    values = [rng.randint(0, 120) for _ in range(1000)]
+    batch = np.random.default_rng(0).integers(0, 120, 100000)
+
+    updater = TreeManager()
+    def update():
+        for value in values:
+            updater.update(value, 0.032)
+
+    batcher = TreeManager()
+    def update_batch():
+        batcher.update_batch(batch, 0.032)
+
+    merger = TreeManager()
+    def merge():
+        merger.daily_seedlings += 37
+        merger.total_seedlings += 37
+        merger._merge_trees()
+
+    bulk = TreeManager()
+    def add_bulk():
+        # 一次计入大量树苗（导入、补算），耗时与数量无关
+        bulk.add_seedlings(10 ** 12)
+
+    scorer = TreeManager()
+    scorer.load_from_data({"total_seedlings": 7, "total_trees": 3, "total_giants": 12, "merge_count": 10},
+                          {"seedlings": 4, "trees": 9, "giants": 2})
+    def score():
+        scorer.get_daily_score()
+        scorer.get_total_score()
+
+    # 教室模式：32个座位共用一个设备，一次唤醒取走一批block，每个座位的一列整段更新
+    from audio import LoudnessRing
+    from classroom import CaptureGroup, Seat
+    group = CaptureGroup(None, [Seat(str(i), None, i, None) for i in range(32)])
+    group.ring = LoudnessRing(width=group.channels)
+    blocks = np.random.default_rng(1).integers(0, 120, (16, group.channels))
+    block_stamps = [0.0]
+    def classroom_process():
+        for row in blocks:
+            block_stamps[0] += 0.032
+            group.ring.push(row, block_stamps[0])
+        group.process()
+
+    return [
+        ("tree_update", update, len(values)),
+        ("tree_update_batch", update_batch, len(batch)),
+        ("classroom_process/32", classroom_process, blocks.size),
+        ("merge_trees", merge, 1),
+        ("add_seedlings_bulk", add_bulk, 1),
+        ("score", score, 1),
+    ]
+
+# ======================
+# 排行榜
+# ======================
+def random_board(n, rng):
+    start = datetime.date(2000, 1, 1)
+    return [{"date": str(start + datetime.timedelta(days=i)), "score": rng.randint(0, 5000)} for i in range(n)]
+
+@benchmark
+def leaderboard_benchmarks(quick):
+    from storage import Leaderboard, bubble_sort_leaderboard
+    rng = random.Random(0)
+    cases = []
+    for n in (10, 100) if quick else (10, 100, 1000):
+        board = random_board(n, rng)
+        cases.append((f"bubble_sort/{n}", lambda board=board: bubble_sort_leaderboard(list(board)), 1))
+        cases.append((f"sorted/{n}", lambda board=board: sorted(board, key=lambda item: item["score"], reverse=True), 1))
+
+    for n in (100, 10000) if quick else (100, 10000, 100000):
+        directory = tempfile.mkdtemp(prefix="plantree-bench-")
+        history = os.path.join(directory, "history.jsonl")
+        with open(history, 'w', encoding='utf-8') as f:
+            for item in random_board(n, rng):
+                f.write(json.dumps(item) + "\n")
+        index = Leaderboard(history, os.path.join(directory, "leaderboard.json"))
+        index.top(1)  # 先读入
+        counter = iter(range(10 ** 9))
+        # 低分不进入前30名，只追加历史，不重写视图文件
+        cases.append((f"leaderboard_submit/{n}",
+                      lambda index=index, counter=counter: index.submit(f"bench-{next(counter)}", rng.randint(0, 50)), 1))
+        cases.append((f"leaderboard_top10/{n}", lambda index=index: index.top(10), 1))
+    return cases
+
+# ======================
+# 流式布局（offscreen Qt）
+# ======================
+@benchmark
+def layout_benchmarks(quick):
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    try:
+        from PySide6 import QtCore, QtWidgets
+    except ImportError:
+        print("PySide6 not installed, skipping layout benchmarks", file=sys.stderr)
+        return []
+    from main import FlowLayout, TIER_STYLES, TREE_TIERS
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    cases = []
+    for n in (10, 100, 500) if quick else (10, 100, 500, 2000):
+        host = QtWidgets.QWidget()
+        layout = FlowLayout(host, spacing=8)
+        for i in range(n):
+            tier = i % len(TREE_TIERS)
+            label = QtWidgets.QLabel(TREE_TIERS[tier][0], host)
+            label.setStyleSheet(TIER_STYLES[tier])
+            layout.addWidget(label)
+        host.show()
+        app.processEvents()
+        rect = QtCore.QRect(0, 0, 460, 100000)
+
+        def relayout(layout=layout, host=host):
+            # 宽度变化：丢掉换行缓存，全部重新排并重新设置每一项的几何
+            layout._lines.clear()
+            layout._applied_rect = None
+            layout.setGeometry(rect)
+
+        def append(layout=layout, host=host):
+            # 增加一棵树（复用刚移除的标签）：只排新增的一项，应该远快于flow_relayout
+            label = layout.takeAt(layout.count() - 1).widget()
+            layout.addWidget(label)
+            layout.setGeometry(rect)
+
+        cases.append((f"flow_relayout/{n}", relayout, 1))
+        cases.append((f"flow_append/{n}", append, 1))
+    return cases
+
+# ======================
+# 存储
+# ======================
+@benchmark
+def storage_benchmarks(quick):
+    import storage
+    from storage import ClassroomStore, ProgressJournal, SqliteStore
+    directory = storage.get_app_data_path()  # main()已经把数据目录指向临时目录
+
+    today = datetime.date.today()
+    main_data = {"total_seedlings": 7, "total_trees": 3, "total_giants": 12, "merge_count": 10}
+    daily_data = {"date": str(today), "progress": 42.5, "seedlings": 4, "trees": 9, "giants": 2,
+                  "score": 294, "focus_seconds": 1234.5}
+    storage.save_progress(main_data)
+    storage.save_leaderboard([])
+    # 一周的每日进度（save_daily_progress只保留最近7天）
+    for days in range(7, 0, -1):
+        storage.save_daily_progress(dict(daily_data, date=str(today - datetime.timedelta(days=days))))
+
+    def progress_roundtrip():
+        storage.save_progress(main_data)
+        storage.load_progress()
+
+    def daily_roundtrip():
+        storage.save_daily_progress(daily_data)
+        storage.load_daily_progress()
+
+    journal = ProgressJournal(os.path.join(directory, "progress.journal"), compact_every=10 ** 9)
+    journal.load()
+
+    database = SqliteStore(os.path.join(directory, "plantree.db"))
+    database.load()
+
+    seats = [str(i) for i in range(32)]
+    classroom = ClassroomStore(seats, os.path.join(directory, "classroom.db"))
+    classroom.load()
+    mains = {seat: main_data for seat in seats}
+    dailies = {seat: daily_data for seat in seats}
+
+    return [
+        ("progress_roundtrip", progress_roundtrip, 1),
+        ("daily_roundtrip", daily_roundtrip, 1),
+        ("journal_save", lambda: journal.save(main_data, daily_data), 1),
+        ("sqlite_save", lambda: database.save(main_data, daily_data), 1),
+        ("classroom_save/32", lambda: classroom.save(mains, dailies), 1),
+    ]
+
+# ======================
+# 多实例
+# ======================
+@benchmark
+def shared_benchmarks(quick):
+    from shared import SharedState
+    from storage import Leaderboard
+    from tree_manager import TreeManager
+    if not SharedState.available():
+        print("No fcntl, skipping multi-instance benchmarks", file=sys.stderr)
+        return []
+    directory = tempfile.mkdtemp(prefix="plantree-bench-")
+    state = SharedState(directory)
+    state.attach()
+    manager = TreeManager()
+    state.join(manager)
+
+    def sync_add(manager=manager):
+        manager.add_seedlings(1)
+        state.sync(manager)
+
+    def sync_focus(manager=manager):
+        manager.daily_focus_seconds += 0.032
+        state.sync(manager)
+
+    board = Leaderboard(os.path.join(directory, "history.jsonl"), os.path.join(directory, "leaderboard.json"),
+                        shared=True)
+    board.top(1)
+    rng = random.Random(0)
+    counter = iter(range(10 ** 9))
+    return [
+        ("shared_sync_idle", lambda: state.sync(manager), 1),   # 没有变化：只读一次修改序号
+        ("shared_sync_add", sync_add, 1),                         # 加锁、写共享段
+        ("shared_sync_focus", sync_focus, 1),                     # 只有专注时间变化：不加锁
+        ("shared_leaderboard_submit", lambda: board.submit(f"bench-{next(counter)}", rng.randint(0, 50)), 1),
+        ("shared_leaderboard_top10", lambda: board.top(10), 1),
+    ]
+
+# ======================
+# 音频回调
+# ======================
+@benchmark
+def audio_benchmarks(quick):
+    import numpy as np
+    import audio
+    from dsp import LoudnessFrontEnd, MultiChannelFrontEnd
+    rng = np.random.default_rng(0)
+    ring = audio.loudness_ring
+    ring.notify = None
+    cases = []
+    for profile, (samplerate, blocksize, dtype) in audio.CAPTURE_PROFILES.items():
+        block = rng.standard_normal((blocksize, 1)) * 0.1
+        block = (block * 32767).astype(np.int16) if dtype == "int16" else block.astype(np.float32)
+        front_end = LoudnessFrontEnd(samplerate, blocksize)
+
+        def callback(block=block, front_end=front_end, profile=profile, blocksize=blocksize):
+            audio.loudness_front_end = front_end
+            audio.capture_profile = profile
+            audio.audio_callback(block, blocksize, None, None)
+            ring._tail = ring._head  # 相当于界面线程取走了数据
+
+        cases.append((f"audio_callback/{profile}", callback, 1))
+
+    for channels in (8, 32):
+        front_end = MultiChannelFrontEnd(channels)
+        block = (rng.standard_normal((512, channels)) * 0.1).astype(np.float32)
+        cases.append((f"multichannel_block/{channels}", lambda front_end=front_end, block=block: front_end.process(block), 1))
+    return cases
+
+# ======================
+# 命令行
+# ======================
+def run(quick=False, patterns=(), repeat=5):
+    results = {}
+    for group in BENCHMARKS:
+        for name, func, ops in group(quick):
+            if patterns and not any(p in name for p in patterns):
+                continue
+            results[name] = measure(func, ops, repeat)
+            print(f"{name:28s} {format_time(results[name]['median']):>10}", file=sys.stderr)
+    return results
+
+
+def format_time(seconds):
+    if seconds < 1e-6:
+        return f"{seconds * 1e9:.0f} ns"
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.1f} us"
+    return f"{seconds * 1e3:.2f} ms"
+
+
+def environment():
+    import numpy
+    return {
+        "python": platform.python_version(),
+        "numpy": numpy.__version__,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "date": datetime.datetime.now().isoformat(timespec='seconds'),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PlanTree core benchmarks")
+    parser.add_argument("--filter", action="append", default=[], help="only run benchmarks whose name contains this")
+    parser.add_argument("--quick", action="store_true", help="smaller sizes and fewer repeats")
+    parser.add_argument("--repeat", type=int, default=5, help="timing rounds per benchmark (median is reported)")
+    parser.add_argument("-o", "--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown vs the baseline (default 20%%)")
+    args = parser.parse_args(argv)
+
+    # 在导入storage之前把数据目录指向临时目录，不碰真实存档
+    data_home = tempfile.mkdtemp(prefix="plantree-bench-")
+    os.environ["XDG_DATA_HOME"] = data_home
+    os.environ["APPDATA"] = data_home
+    if platform.system() == "Darwin":
+        os.environ["HOME"] = data_home
+
+    report = {"environment": environment(),
+              "results": run(args.quick, args.filter, 3 if args.quick else args.repeat)}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    try:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)["results"]
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        for name, result in report["results"].items():
+            print(f"{name:28s} {format_time(result['median']):>10}")
+        return 0
+
+    regressed = False
+    for name, result in report["results"].items():
+        base = baseline.get(name, {}).get("median")
+        if not base:
+            print(f"{name:28s} {format_time(result['median']):>10}  (no baseline)")
+            continue
+        change = result["median"] / base - 1
+        status = "REGRESSION" if change > args.tolerance else "ok"
+        regressed |= change > args.tolerance
+        print(f"{name:28s} {format_time(result['median']):>10}  {change:+7.1%} vs {format_time(base)}  {status}")
+    return 1 if regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
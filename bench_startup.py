@@ -0,0 +1,115 @@
+'''
+Apache license 2.0
+Version 2.0, January 2004
+Read https://www.apache.org/licenses/LICENSE-2.0
+Full License is in /LICENCE file
+'''
+# 冷启动基准测试：多次启动main.py，测量从启动进程到第一次绘制窗口、到后台加载完成的时间和峰值内存
+#
+# 用法示例：
+#   python bench_startup.py --runs 7 --save-baseline       # 记录基准
+#   python bench_startup.py --runs 7                        # 与基准比较，变慢超过容差时返回1
+#   python bench_startup.py --runs 7 --headless             # 无界面模式（基准单独存放）
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(HERE, "startup_baseline.json")
+HEADLESS_BASELINE = os.path.join(HERE, "startup_baseline_headless.json")
+
+def measure_once(extra_args, offscreen, headless=False, timeout=60.0):
+    """启动一次，返回{"first_paint": 秒, "ready": 秒, "peak_rss": 字节}（无界面模式没有first_paint，没有resource模块时没有peak_rss）"""
+    env = dict(os.environ)
+    if offscreen:
+        env["QT_QPA_PLATFORM"] = "offscreen"
+    start = time.time()
+    if headless:
+        extra_args = ["--headless", *extra_args]
+    proc = subprocess.Popen([sys.executable, os.path.join(HERE, "main.py"), "--startup-probe", *extra_args],
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, env=env)
+    stamps = {}
+    try:
+        for line in proc.stdout:
+            parts = line.split()
+            if len(parts) == 2 and parts[0] == "rss":
+                stamps["peak_rss"] = int(parts[1])
+            elif len(parts) == 2 and parts[0] in ("first_paint", "ready"):
+                stamps[parts[0]] = float(parts[1]) - start
+                if parts[0] == "ready":
+                    break
+        proc.wait(timeout)
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+    if "ready" not in stamps or ("first_paint" not in stamps and not headless):
+        raise RuntimeError("main.py exited before reporting startup times")
+    return stamps
+
+
+def format_value(name, value):
+    if name == "peak_rss":
+        return f"{value / 2**20:.1f} MB"
+    return f"{value * 1000:.0f} ms"
+
+
+def summarize(values):
+    return {"median": statistics.median(values), "min": min(values), "max": max(values)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PlanTree cold-start benchmark")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--offscreen", action="store_true", help="use the offscreen Qt platform (CI without a display)")
+    parser.add_argument("--headless", action="store_true", help="measure the headless mode (main.py --headless)")
+    parser.add_argument("--baseline", default=None, help="baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown vs the baseline (default 20%%)")
+    parser.add_argument("main_args", nargs="*", help="extra arguments for main.py (after --)")
+    args = parser.parse_args(argv)
+    if args.baseline is None:
+        args.baseline = HEADLESS_BASELINE if args.headless else DEFAULT_BASELINE
+
+    samples = {}
+    for i in range(args.runs):
+        stamps = measure_once(args.main_args, args.offscreen, args.headless)
+        for name, value in stamps.items():
+            samples.setdefault(name, []).append(value)
+        print(f"run {i + 1}: " + ", ".join(f"{name} {format_value(name, value)}" for name, value in stamps.items()),
+              file=sys.stderr)
+
+    result = {name: summarize(values) for name, values in samples.items()}
+    for name, stats in result.items():
+        print(f"{name:12s} median {format_value(name, stats['median']):>9s}  "
+              f"(min {format_value(name, stats['min'])}, max {format_value(name, stats['max'])})")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    try:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return 0
+
+    regressed = False
+    for name, stats in result.items():
+        base = baseline.get(name, {}).get("median")
+        if not base:
+            continue
+        change = stats["median"] / base - 1
+        status = "REGRESSION" if change > args.tolerance else "ok"
+        regressed |= change > args.tolerance
+        print(f"{name:12s} {change:+.1%} vs baseline ({format_value(name, base)})  {status}")
+    return 1 if regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+'''
+Apache license 2.0
+Version 2.0, January 2004
+Read https://www.apache.org/licenses/LICENSE-2.0
+Full License is in /LICENCE file
+'''
+# 阈值自动校准：用P²算法在线估计音量的分位数（固定内存），得到底噪和说话音量，再据此设置阈值
+import math
+
+class P2Quantile:
+    """P²算法（Jain & Chlamtac, 1985）：只保存5个标记点，在线估计第p分位数"""
+    def __init__(self, p):
+        self.p = p
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self._heights = []
+        self._positions = [1, 2, 3, 4, 5]
+        p = self.p
+        self._desired = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self._increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, x):
+        self.count += 1
+        heights = self._heights
+        if self.count <= 5:
+            heights.append(x)
+            if self.count == 5:
+                heights.sort()
+            return
+
+        # 找到x所在的区间，更新两端的标记
+        if x < heights[0]:
+            heights[0] = x
+            k = 0
+        elif x >= heights[4]:
+            heights[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= heights[k + 1]:
+                k += 1
+
+        positions = self._positions
+        for i in range(k + 1, 5):
+            positions[i] += 1
+        desired = self._desired
+        for i in range(5):
+            desired[i] += self._increments[i]
+
+        # 中间三个标记偏离理想位置超过1时，用抛物线（不合适时用线性）插值调整高度
+        for i in (1, 2, 3):
+            d = desired[i] - positions[i]
+            if (d >= 1 and positions[i + 1] - positions[i] > 1) or (d <= -1 and positions[i - 1] - positions[i] < -1):
+                step = 1 if d > 0 else -1
+                height = self._parabolic(i, step)
+                if not heights[i - 1] < height < heights[i + 1]:
+                    height = heights[i] + step * (heights[i + step] - heights[i]) / (positions[i + step] - positions[i])
+                heights[i] = height
+                positions[i] += step
+
+    def _parabolic(self, i, step):
+        q = self._heights
+        n = self._positions
+        return q[i] + step / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + step) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - step) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+
+    def value(self):
+        """当前估计值，没有数据时返回None"""
+        if self.count == 0:
+            return None
+        if self.count < 5:
+            ordered = sorted(self._heights)
+            return ordered[min(len(ordered) - 1, int(round(self.p * (len(ordered) - 1))))]
+        return self._heights[2]
+
+
+class AutoCalibrator:
+    """根据音量流估计底噪（低分位数）和说话音量（高分位数），自动设置安静/朗读阈值
+
+    分位数按窗口估计：每个窗口结束时把结果按smoothing并入长期估计，然后重新开始，
+    这样房间噪声变化后能跟上，运行多久内存都不变。
+    阈值只有偏离目标超过hysteresis（比例）时才改动，避免来回跳。
+    enabled为False时只估计不改阈值；auto_low / auto_high为False时对应的阈值由用户手动设置。
+    """
+    def __init__(self, floor_quantile=0.2, speech_quantile=0.9, window_seconds=600.0, warmup_seconds=9.6,
+                 block_seconds=512 / 16000, smoothing=0.3, hysteresis=0.15, min_gap=10):
+        self.window_seconds = window_seconds  # 每个窗口的时长（秒）
+        self.warmup_seconds = warmup_seconds  # 第一个窗口里至少有这么长的数据才开始给出估计
+        self.set_block_duration(block_seconds)
+        self.smoothing = smoothing
+        self.hysteresis = hysteresis
+        self.min_gap = min_gap        # 说话音量和底噪之间至少相差多少
+        self.enabled = False
+        self.auto_low = True
+        self.auto_high = True
+        self.noise_floor = None
+        self.speech_level = None
+        self._floor = P2Quantile(floor_quantile)
+        self._speech = P2Quantile(speech_quantile)
+
+    def set_block_duration(self, seconds):
+        """按每个block的时长（blocksize / samplerate）把窗口和预热时间换算成block数，切换采集配置时调用"""
+        self.window = max(1, round(self.window_seconds / seconds))
+        self.warmup = max(1, round(self.warmup_seconds / seconds))
+
+    def add(self, values):
+        """加入一批block的音量"""
+        floor = self._floor
+        speech = self._speech
+        for value in values:
+            floor.add(value)
+            speech.add(value)
+            if floor.count >= self.window:
+                self._fold(floor.value(), speech.value())
+                floor.reset()
+                speech.reset()
+
+    def _fold(self, floor, speech):
+        if self.noise_floor is None:
+            self.noise_floor, self.speech_level = floor, speech
+            return
+        a = self.smoothing
+        self.noise_floor += a * (floor - self.noise_floor)
+        self.speech_level += a * (speech - self.speech_level)
+
+    def estimates(self):
+        """返回(底噪, 说话音量)，数据不够时返回None"""
+        if self.noise_floor is not None:
+            return self.noise_floor, self.speech_level
+        if self._floor.count >= self.warmup:
+            return self._floor.value(), self._speech.value()
+        return None
+
+    def targets(self):
+        """返回(安静阈值, 朗读阈值)的目标值，数据不够时返回None
+
+        安静阈值放在底噪之上、离说话音量较远的位置；朗读阈值放在两者中间。
+        """
+        estimates = self.estimates()
+        if estimates is None:
+            return None
+        floor, speech = estimates
+        gap = max(speech - floor, self.min_gap)
+        return int(math.ceil(floor + 0.35 * gap)), int(math.ceil(floor + 0.5 * gap))
+
+    def apply(self, tree_manager):
+        """按目标值调整tree_manager的阈值，返回是否有改动"""
+        if not self.enabled:
+            return False
+        targets = self.targets()
+        if targets is None:
+            return False
+        low, high = targets
+        changed = False
+        if self.auto_low and self._outside_band(tree_manager.threshold_low, low):
+            tree_manager.threshold_low = low
+            changed = True
+        if self.auto_high and self._outside_band(tree_manager.threshold_high, high):
+            tree_manager.threshold_high = high
+            changed = True
+        return changed
+
+    def _outside_band(self, current, target):
+        return abs(target - current) > max(1, self.hysteresis * current)
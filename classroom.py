@@ -0,0 +1,178 @@
+'''
+Apache license 2.0
+Version 2.0, January 2004
+Read https://www.apache.org/licenses/LICENSE-2.0
+Full License is in /LICENCE file
+'''
+# 教室模式：一个进程带多个座位（每个座位是一个麦克风或多声道设备的一个声道），
+# 每个座位有自己的TreeManager和存档，界面、NumPy和PortAudio只加载一份
+#
+# 座位描述（--classroom=...）：
+#   4                        默认输入设备的前4个声道，座位名为1~4
+#   小明:0,小红:1            默认输入设备的第0、1个声道
+#   A@2,B@2,C@USB Mic:1      设备2的第0、1个声道，名字里带"USB Mic"的设备的第1个声道
+#
+# ClassroomCore继承单人模式的MonitorCore（monitor.py），界面是main.py里的ClassroomWindow
+from storage import ClassroomStore
+from tree_manager import SimClock, TreeManager
+from monitor import MonitorCore
+from perf import record_wake_latency, stats as perf_stats, timed
+
+def parse_classroom_spec(spec):
+    """解析座位描述，返回[(座位名, 设备, 声道)]；设备为None表示默认输入设备，没写声道时按顺序分配"""
+    spec = spec.strip()
+    if spec.isdigit():
+        return [(str(i + 1), None, i) for i in range(int(spec))]
+
+    seats = []
+    names = set()
+    used = set()
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        channel = None
+        head, sep, tail = part.rpartition(':')
+        if sep and tail.isdigit():
+            part, channel = head, int(tail)
+        name, _, device = part.partition('@')
+        device = device.strip() or None
+        if device is not None and device.isdigit():
+            device = int(device)
+        if channel is None:
+            channel = max((c + 1 for d, c in used if d == device), default=0)
+        name = name.strip()
+        if not name or name in names:
+            raise ValueError(f"Invalid or duplicate seat name: {part!r}")
+        if (device, channel) in used:
+            raise ValueError(f"Channel {channel} of device {device} is used by two seats")
+        names.add(name)
+        used.add((device, channel))
+        seats.append((name, device, channel))
+    if not seats:
+        raise ValueError(f"No seats in classroom spec: {spec!r}")
+    return seats
+
+class SeatScores:
+    """给TreeManager用的分数接口：把某个座位的分数交给共用的存储，键为(座位, 日期)"""
+    def __init__(self, store, seat):
+        self.store = store
+        self.seat = seat
+
+    def submit_score(self, date_str, score):
+        self.store.submit_score((self.seat, date_str), score)
+
+class Seat:
+    """一个座位：所在设备和声道、进度，以及最近一个block的音量"""
+    def __init__(self, name, device, channel, store):
+        self.name = name
+        self.device = device
+        self.channel = channel
+        self.tree_manager = TreeManager(SeatScores(store, name))
+        self.loudness = None
+        self.trees_dirty = True
+
+class CaptureGroup:
+    """同一个输入设备上的所有座位：共用一个stream、一个多声道音量前端、一个环形缓冲区和一个模拟时钟"""
+    def __init__(self, device, seats):
+        self.device = device
+        self.seats = seats
+        self.channels = max(seat.channel for seat in seats) + 1
+        self.clock = SimClock()
+        self.front_end = None
+        self.ring = None
+        self.stream = None
+
+    def start(self, profile="standard", notify=None, front_end_options=None):
+        """按采集配置打开设备；ValueError（计权不支持该采样率）交给调用方处理"""
+        from audio import CAPTURE_PROFILES, LoudnessRing, start_multichannel_monitor
+        from dsp import MultiChannelFrontEnd
+        samplerate, blocksize, _ = CAPTURE_PROFILES[profile]
+        self.front_end = MultiChannelFrontEnd(self.channels, samplerate, blocksize, **(front_end_options or {}))
+        self.ring = LoudnessRing(width=self.channels)
+        self.ring.notify = notify
+        self.clock.reset()
+        self.stream = start_multichannel_monitor(self.front_end, self.ring, self.device, profile)
+
+    def stop(self):
+        from audio import stop_microphone_monitor
+        if self.stream is None:
+            return
+        self.ring.notify = None
+        stop_microphone_monitor(self.stream)
+        self.stream = None
+
+    def process(self):
+        """取走缓冲区里的所有block，推进这个设备上每个座位的进度，返回(是否有座位长出了新树, 模拟经过的秒数)"""
+        import numpy as np
+        values, stamps = self.ring.drain()
+        if len(values) == 0:
+            return False, 0.0
+        if perf_stats.enabled:
+            record_wake_latency(float(stamps[0]))
+        # 所有座位共用同一组block间隔；每个座位的一列音量整段交给update_batch
+        dts = np.array([self.clock.tick(stamp) for stamp in stamps.tolist()])
+        latest = values[-1].tolist()
+        changed = False
+        for seat in self.seats:
+            if seat.tree_manager.update_batch(values[:, seat.channel], dts):
+                seat.trees_dirty = changed = True
+            seat.loudness = latest[seat.channel]
+        return changed, float(dts.sum())
+
+def build_classroom(seat_specs, store):
+    """按parse_classroom_spec的结果创建座位，并按设备分组，返回(座位列表, 设备分组列表)"""
+    seats = [Seat(name, device, channel, store) for name, device, channel in seat_specs]
+    by_device = {}
+    for seat in seats:
+        by_device.setdefault(seat.device, []).append(seat)
+    groups = [CaptureGroup(device, members) for device, members in by_device.items()]
+    return seats, groups
+
+class ClassroomCore(MonitorCore):
+    """教室模式的种树核心：启动、自动保存、切换采集配置和退出都与单人模式相同，
+    这里只把载入、采集、推进和保存换成按座位进行
+
+    所有座位的进度存在同一个ClassroomStore里；设置（早读模式、阈值等）以第一个座位为准，对所有座位统一生效。
+    不支持自动校准、音量记录和多实例。
+    """
+    def __init__(self, seat_specs, front_end_options=None, low_power=False, aggregate=None):
+        super().__init__(ClassroomStore([name for name, _, _ in seat_specs]), front_end_options,
+                         low_power=low_power, aggregate=aggregate)
+        self.seats, self.groups = build_classroom(seat_specs, self.store)
+        self.tree_manager = self.seats[0].tree_manager
+
+    def tree_managers(self):
+        return [seat.tree_manager for seat in self.seats]
+
+    def load_saved(self, mains, dailies):
+        for seat in self.seats:
+            seat.tree_manager.load_from_data(mains.get(seat.name, {}), dailies.get(seat.name, {}))
+
+    def open_capture(self, profile):
+        for group in self.groups:
+            group.start(profile, self.notify, self.front_end_options)
+
+    def close_capture(self):
+        for group in self.groups:
+            group.stop()
+
+    def advance(self):
+        """每个设备取走自己的block；各设备并行采集，经过的时间取最长的一个"""
+        changed = False
+        elapsed = 0.0
+        for group in self.groups:
+            group_changed, group_elapsed = group.process()
+            changed = changed or group_changed
+            elapsed = max(elapsed, group_elapsed)
+        return changed, elapsed
+
+    @timed("save_current_progress")
+    def save_current_progress(self):
+        """把所有座位的进度作为一份快照交给后台保存（所有座位都没有变化时跳过）"""
+        mains = {seat.name: seat.tree_manager.save_main_progress() for seat in self.seats}
+        dailies = {seat.name: seat.tree_manager.save_daily_progress() for seat in self.seats}
+        self.store.save(mains, dailies, tuple(seat.tree_manager.generation for seat in self.seats))
+        if self.uploader is not None:
+            for name, daily_data in dailies.items():
+                self.uploader.submit((name, daily_data["date"]), daily_data["score"])
@@ -0,0 +1,400 @@
+'''
+Apache license 2.0
+Version 2.0, January 2004
+Read https://www.apache.org/licenses/LICENSE-2.0
+Full License is in /LICENCE file
+'''
+# 音量计算前端：频率计权滤波、能量、dBFS和起落平滑，所有缓冲区预先分配，音频线程里不分配数组
+#
+# 用法示例（测量每个block的耗时）：
+#   python dsp.py
+import math
+import time
+import numpy as np
+
+# 每次矩阵运算处理的样本数，block更大时分段处理，状态在段之间传递
+CHUNK = 128
+# int16样本的满幅值
+INT16_FULL_SCALE = 32768
+# dBFS模式下输出 dBFS + DBFS_OFFSET，保持和RMS模式一样是非负整数（-100 dBFS及以下为0）
+DBFS_OFFSET = 100
+# A计权的模拟极点（Hz），零点是s=0处的4重零点（IEC 61672）
+A_WEIGHTING_POLES = (20.598997, 20.598997, 107.65265, 737.86223, 12194.217, 12194.217)
+# 语音频带：300 Hz一阶高通 + 3400 Hz一阶低通
+SPEECH_BAND_POLES = (300.0, 3400.0)
+
+WEIGHTINGS = ("a", "speech", "none")
+
+# ======================
+# 滤波器设计
+# ======================
+def _bilinear(zeros, poles, samplerate):
+    """模拟零极点（rad/s）经双线性变换得到数字滤波器，按二阶节返回[(b, a), ...]
+
+    高阶多项式在极点靠近z=1时数值很差（48 kHz下20 Hz的极点），所以每两个零极点组成一节，
+    总增益放在第一节，在1 kHz处归一化为0 dB。
+    """
+    fs2 = 2.0 * samplerate
+    zeros = np.asarray(zeros, dtype=complex)
+    poles = np.asarray(poles, dtype=complex)
+    digital_zeros = np.concatenate(((fs2 + zeros) / (fs2 - zeros),
+                                    -np.ones(len(poles) - len(zeros))))  # 无穷远处的零点映射到z=-1
+    digital_poles = (fs2 + poles) / (fs2 - poles)
+
+    sections = []
+    for i in range(0, len(digital_poles), 2):
+        b = np.real(np.poly(digital_zeros[i:i + 2]))
+        a = np.real(np.poly(digital_poles[i:i + 2]))
+        sections.append((b, a))
+
+    z = np.exp(-1j * 2 * math.pi * 1000.0 / samplerate * np.arange(3))
+    gain = 1.0
+    for b, a in sections:
+        gain *= abs(np.dot(b, z[:len(b)]) / np.dot(a, z[:len(a)]))
+    sections[0] = (sections[0][0] / gain, sections[0][1])
+    return sections
+
+
+def design_weighting(weighting, samplerate):
+    """返回计权滤波器的二阶节列表[(b, a), ...]；weighting为"none"时返回None"""
+    if weighting == "none":
+        return None
+    if weighting == "a":
+        poles = [-2 * math.pi * f for f in A_WEIGHTING_POLES]
+        return _bilinear([0.0] * 4, poles, samplerate)
+    if weighting == "speech":
+        low, high = SPEECH_BAND_POLES
+        return _bilinear([0.0], [-2 * math.pi * low, -2 * math.pi * high], samplerate)
+    raise ValueError(f"Unknown weighting: {weighting}")
+
+
+def _state_space(b, a):
+    """传递函数转成可控标准型状态空间 (A, B, C, D)"""
+    order = len(a) - 1
+    b = np.concatenate((np.zeros(len(a) - len(b)), b)) / a[0]
+    a = a / a[0]
+    A = np.zeros((order, order))
+    A[0, :] = -a[1:]
+    A[1:, :-1] = np.eye(order - 1)
+    B = np.zeros(order)
+    B[0] = 1.0
+    C = b[1:] - b[0] * a[1:]
+    D = b[0]
+    return A, B, C, D
+
+
+def _cascade(sections):
+    """把各节串联成一个状态空间模型，每节的状态各自独立，不合成高阶多项式"""
+    A, B, C, D = _state_space(*sections[0])
+    for b, a in sections[1:]:
+        A2, B2, C2, D2 = _state_space(b, a)
+        n1, n2 = len(B), len(B2)
+        combined = np.zeros((n1 + n2, n1 + n2))
+        combined[:n1, :n1] = A
+        combined[n1:, :n1] = np.outer(B2, C)
+        combined[n1:, n1:] = A2
+        A = combined
+        B = np.concatenate((B, B2 * D))
+        C = np.concatenate((D2 * C, C2))
+        D = D2 * D
+    return A, B, C, D
+
+
+class _BlockFilter:
+    """长度为n的一段输入的分块形式：y = H x + O s，s' = P s + G x
+
+    H是冲激响应组成的下三角Toeplitz矩阵，O把段开始时的状态映射到输出，
+    P、G把状态推进到段结束，都是和原递推完全等价的线性变换。
+    """
+    def __init__(self, A, B, C, D, n):
+        order = len(B)
+        impulse = np.empty(n)
+        impulse[0] = D
+        O = np.empty((n, order))
+        G = np.empty((order, n))
+        row = C.copy()      # C A^k
+        column = B.copy()   # A^k B
+        for k in range(n):
+            O[k] = row
+            if k + 1 < n:
+                impulse[k + 1] = np.dot(row, B)
+            G[:, n - 1 - k] = column
+            row = row @ A
+            column = A @ column
+        index = np.arange(n)
+        lag = index[:, None] - index[None, :]
+        self.H = np.where(lag >= 0, impulse[np.clip(lag, 0, None)], 0.0).astype(np.float32)
+        self.O = O
+        self.G = G
+        self.P = np.linalg.matrix_power(A, n)
+
+# ======================
+# 前端
+# ======================
+class LoudnessFrontEnd:
+    """把一个音频block换算成音量值
+
+    weighting：计权滤波（"a"为A计权，"speech"为语音频带，"none"为不计权）；
+    dbfs：为True时输出dBFS + DBFS_OFFSET，否则输出RMS*1000；
+    attack / release：能量上升和下降时的平滑时间常数（秒），0表示不平滑。
+    滤波器状态在block之间保持，同一个实例只能由一个线程使用。
+    """
+    def __init__(self, samplerate=16000, blocksize=512, weighting="none", dbfs=False,
+                 attack=0.0, release=0.0):
+        self.samplerate = samplerate
+        self.blocksize = blocksize
+        self.weighting = weighting
+        self.dbfs = dbfs
+        self.attack = attack
+        self.release = release
+        self.level = 0.0  # 平滑后的均方能量
+
+        sections = design_weighting(weighting, samplerate)
+        self._model = _cascade(sections) if sections is not None else None
+        self._filters = {}
+        self._state = np.zeros(len(self._model[1]) if self._model else 0)
+        self._next_state = np.empty_like(self._state)
+        self._state_term = np.empty_like(self._state)
+        self._y = np.empty(CHUNK, dtype=np.float32)
+        self._from_state = np.empty(CHUNK)
+        self._x64 = np.empty(CHUNK)
+        self._prepare(blocksize)
+
+    def _prepare(self, blocksize):
+        """预先计算整段和尾段的矩阵，运行时不再分配"""
+        self.blocksize = blocksize
+        self._smoothing = (self._coefficient(self.attack), self._coefficient(self.release))
+        self._wide = np.empty(blocksize, dtype=np.int64)      # int16整数能量的累加缓冲区
+        self._scaled = np.empty(blocksize, dtype=np.float32)  # int16转成[-1, 1)的浮点样本
+        if self._model is None:
+            return
+        for n in {min(CHUNK, blocksize), blocksize % CHUNK}:
+            if n and n not in self._filters:
+                self._filters[n] = _BlockFilter(*self._model, n)
+
+    def _coefficient(self, tau):
+        if tau <= 0:
+            return 0.0
+        return math.exp(-self.blocksize / self.samplerate / tau)
+
+    def reset(self):
+        self._state[:] = 0.0
+        self.level = 0.0
+
+    def mean_square(self, samples):
+        """一个block（一维float32或int16数组）经过计权后的均方能量（满幅为1），不做平滑"""
+        frames = len(samples)
+        if frames == 0:
+            return 0.0
+        if frames != self.blocksize:
+            self._prepare(frames)
+        if samples.dtype == np.int16:
+            if self._model is None:
+                # 不计权时全程整数运算：int64下每个block最多约2^30*frames，不会溢出
+                wide = self._wide[:frames]
+                np.copyto(wide, samples)
+                return int(np.dot(wide, wide)) / frames / (INT16_FULL_SCALE * INT16_FULL_SCALE)
+            scaled = self._scaled[:frames]
+            np.copyto(scaled, samples)
+            np.multiply(scaled, 1.0 / INT16_FULL_SCALE, out=scaled)
+            samples = scaled
+        if self._model is None:
+            return float(np.dot(samples, samples)) / frames
+        if samples.dtype != np.float32:
+            samples = samples.astype(np.float32)  # 只有离线工具会传入其它类型
+
+        energy = 0.0
+        state = self._state
+        for start in range(0, frames, CHUNK):
+            x = samples[start:start + CHUNK]
+            n = len(x)
+            f = self._filters[n]
+            y = self._y[:n]
+            from_state = self._from_state[:n]
+            x64 = self._x64[:n]
+            np.dot(f.H, x, out=y)
+            np.dot(f.O, state, out=from_state)
+            np.add(y, from_state, out=y, casting='unsafe')
+            energy += float(np.dot(y, y))
+
+            np.copyto(x64, x)
+            np.dot(f.P, state, out=self._state_term)
+            np.dot(f.G, x64, out=self._next_state)
+            np.add(self._next_state, self._state_term, out=state)
+        return energy / frames
+
+    def process(self, samples):
+        """计算一个block的音量值（整数）"""
+        energy = self.mean_square(samples)
+        attack, release = self._smoothing
+        coefficient = attack if energy > self.level else release
+        self.level = energy + coefficient * (self.level - energy)
+
+        if self.dbfs:
+            return max(0, int(round(self.level_dbfs())) + DBFS_OFFSET)
+        return int(math.sqrt(self.level) * 1000)
+
+    def level_dbfs(self):
+        """当前平滑后的电平（dBFS，满幅方波为0 dBFS）"""
+        return 10 * math.log10(self.level) if self.level > 1e-20 else -200.0
+
+class MultiChannelFrontEnd:
+    """多声道版本的LoudnessFrontEnd：一个block里所有声道的滤波和能量在同一次矩阵运算里完成
+
+    输入是(帧数, 声道数)的float32或int16数组（sounddevice回调的indata），参数含义与LoudnessFrontEnd相同。
+    process返回每个声道的音量（int64数组，每次调用复用同一个数组），与每个声道单独用
+    LoudnessFrontEnd计算的结果相同。
+    """
+    def __init__(self, channels, samplerate=16000, blocksize=512, weighting="none", dbfs=False,
+                 attack=0.0, release=0.0):
+        self.channels = channels
+        self.samplerate = samplerate
+        self.weighting = weighting
+        self.dbfs = dbfs
+        self.attack = attack
+        self.release = release
+        self.level = np.zeros(channels)  # 每个声道平滑后的均方能量
+
+        sections = design_weighting(weighting, samplerate)
+        self._model = _cascade(sections) if sections is not None else None
+        self._filters = {}
+        order = len(self._model[1]) if self._model else 0
+        self._state = np.zeros((order, channels))
+        self._next_state = np.empty_like(self._state)
+        self._state_term = np.empty_like(self._state)
+        self._y = np.empty((CHUNK, channels), dtype=np.float32)
+        self._from_state = np.empty((CHUNK, channels))
+        self._x64 = np.empty((CHUNK, channels))
+        self._energy = np.empty(channels)
+        self._chunk_energy = np.empty(channels)
+        self._wide_energy = np.empty(channels, dtype=np.int64)
+        self._rising = np.empty(channels, dtype=bool)
+        self._coefficients = np.empty(channels)
+        self._scratch = np.empty(channels)
+        self._loudness = np.empty(channels, dtype=np.int64)
+        self._prepare(blocksize)
+
+    def _prepare(self, blocksize):
+        self.blocksize = blocksize
+        self._smoothing = (self._coefficient(self.attack), self._coefficient(self.release))
+        self._wide = np.empty((blocksize, self.channels), dtype=np.int64)
+        self._scaled = np.empty((blocksize, self.channels), dtype=np.float32)
+        if self._model is None:
+            return
+        for n in {min(CHUNK, blocksize), blocksize % CHUNK}:
+            if n and n not in self._filters:
+                self._filters[n] = _BlockFilter(*self._model, n)
+
+    def _coefficient(self, tau):
+        if tau <= 0:
+            return 0.0
+        return math.exp(-self.blocksize / self.samplerate / tau)
+
+    def mean_square(self, samples):
+        """每个声道经过计权后的均方能量（满幅为1），返回内部数组，不做平滑"""
+        frames = len(samples)
+        energy = self._energy
+        if frames == 0:
+            energy.fill(0.0)
+            return energy
+        if frames != self.blocksize:
+            self._prepare(frames)
+        if samples.dtype == np.int16:
+            if self._model is None:
+                wide = self._wide[:frames]
+                np.copyto(wide, samples)
+                np.multiply(wide, wide, out=wide)
+                np.add.reduce(wide, axis=0, out=self._wide_energy)
+                np.divide(self._wide_energy, frames * INT16_FULL_SCALE * INT16_FULL_SCALE, out=energy)
+                return energy
+            scaled = self._scaled[:frames]
+            np.copyto(scaled, samples)
+            np.multiply(scaled, 1.0 / INT16_FULL_SCALE, out=scaled)
+            samples = scaled
+        elif samples.dtype != np.float32:
+            samples = samples.astype(np.float32)  # 只有离线工具会传入其它类型
+
+        if self._model is None:
+            squares = self._scaled[:frames]
+            np.multiply(samples, samples, out=squares)
+            np.add.reduce(squares, axis=0, dtype=np.float64, out=energy)
+            np.divide(energy, frames, out=energy)
+            return energy
+
+        energy.fill(0.0)
+        state = self._state
+        for start in range(0, frames, CHUNK):
+            x = samples[start:start + CHUNK]
+            n = len(x)
+            f = self._filters[n]
+            y = self._y[:n]
+            from_state = self._from_state[:n]
+            x64 = self._x64[:n]
+            np.dot(f.H, x, out=y)
+            np.dot(f.O, state, out=from_state)
+            np.add(y, from_state, out=y, casting='unsafe')
+            np.multiply(y, y, out=y)
+            np.add.reduce(y, axis=0, dtype=np.float64, out=self._chunk_energy)
+            np.add(energy, self._chunk_energy, out=energy)
+
+            np.copyto(x64, x)
+            np.dot(f.P, state, out=self._state_term)
+            np.dot(f.G, x64, out=self._next_state)
+            np.add(self._next_state, self._state_term, out=state)
+        np.divide(energy, frames, out=energy)
+        return energy
+
+    def process(self, samples):
+        """计算一个block里每个声道的音量值"""
+        energy = self.mean_square(samples)
+        level = self.level
+        scratch = self._scratch
+        attack, release = self._smoothing
+        np.greater(energy, level, out=self._rising)
+        self._coefficients.fill(release)
+        np.copyto(self._coefficients, attack, where=self._rising)
+        np.subtract(level, energy, out=scratch)
+        np.multiply(scratch, self._coefficients, out=scratch)
+        np.add(energy, scratch, out=level)
+
+        if self.dbfs:
+            np.maximum(level, 1e-20, out=scratch)
+            np.log10(scratch, out=scratch)
+            np.multiply(scratch, 10, out=scratch)
+            np.add(scratch, DBFS_OFFSET, out=scratch)
+            np.rint(scratch, out=scratch)
+            np.maximum(scratch, 0, out=scratch)
+        else:
+            np.sqrt(level, out=scratch)
+            np.multiply(scratch, 1000, out=scratch)
+        np.copyto(self._loudness, scratch, casting='unsafe')  # 向零取整，与int()一致
+        return self._loudness
+
+# ======================
+# 基准测试
+# ======================
+def benchmark(samplerate, blocksize, weighting, dtype="float32", blocks=2000):
+    """返回每个block的平均处理时间（毫秒）"""
+    front_end = LoudnessFrontEnd(samplerate, blocksize, weighting, attack=0.05, release=0.3)
+    rng = np.random.default_rng(0)
+    data = rng.standard_normal((blocks, blocksize)) * 0.05
+    if dtype == "int16":
+        data = (data * INT16_FULL_SCALE).astype(np.int16)
+    else:
+        data = data.astype(np.float32)
+    for block in data[:50]:
+        front_end.process(block)
+    start = time.perf_counter()
+    for block in data:
+        front_end.process(block)
+    return (time.perf_counter() - start) / blocks * 1000
+
+
+if __name__ == "__main__":
+    print(f"{'rate':>6} {'block':>6} {'dtype':>8} {'budget ms':>10} {'weighting':>9} {'ms/block':>9} {'load':>7}")
+    for samplerate, blocksize, dtype in ((8000, 2048, "int16"), (16000, 512, "float32"),
+                                         (44100, 1024, "float32"), (48000, 1536, "float32")):
+        budget = blocksize / samplerate * 1000
+        for weighting in WEIGHTINGS:
+            cost = benchmark(samplerate, blocksize, weighting, dtype)
+            print(f"{samplerate:>6} {blocksize:>6} {dtype:>8} {budget:>10.1f} {weighting:>9} {cost:>9.4f} {cost / budget:>7.2%}")
@@ -0,0 +1,129 @@
+'''
+Apache license 2.0
+Version 2.0, January 2004
+Read https://www.apache.org/licenses/LICENSE-2.0
+Full License is in /LICENCE file
+'''
+# 无界面模式（python main.py --headless）：给信息亭和通过SSH管理、从不显示界面的机器用，不导入Qt
+#
+# 进度、采集、保存和退出都在MonitorCore（monitor.py）里，与窗口版相同。音频线程把每个block的音量写入
+# LoudnessRing，唤醒通过call_soon_threadsafe放进asyncio.Queue；一个协程取走block推进进度，
+# 自动保存和状态输出是两个周期任务。Ctrl+C或SIGTERM时提交分数、保存进度后退出。
+# 命令行参数与窗口版相同（见monitor.py），另有--morning和--status-interval=秒。
+import os
+import sys
+import time
+import signal
+import asyncio
+from storage import APPDATA_PATH
+from monitor import (AUTOSAVE_INTERVAL, STATUS_INTERVAL, MonitorCore, apply_options, core_arguments,
+                     parse_options, print_run_report)
+from perf import peak_rss
+
+class HeadlessMonitor(MonitorCore):
+    """无界面的种树进程：状态打印到标准输出，事件循环是asyncio"""
+    def __init__(self, morning_mode=False, status_interval=STATUS_INTERVAL, **options):
+        super().__init__(**options)
+        self.tree_manager.morning_mode = morning_mode
+        self.status_interval = status_interval
+        self.autosave_with_audio = False  # 由_autosave任务定时保存
+        self.startup_seconds = None
+        self._stop = None
+
+    async def run(self, probe=False):
+        """启动并一直运行，直到收到SIGINT/SIGTERM或stop()"""
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self._stop.set)
+            except (NotImplementedError, RuntimeError):
+                pass  # Windows：Ctrl+C以KeyboardInterrupt结束事件循环
+
+        # 读取存档和导入音频库同时进行
+        (main_saved, daily_saved), _ = await asyncio.gather(
+            loop.run_in_executor(None, self.load_progress),
+            loop.run_in_executor(None, self.load_audio))
+        # 音频线程 -> 事件循环：环形缓冲区在被取走之前只唤醒一次
+        wakeups = asyncio.Queue()
+        self.start_monitoring(main_saved, daily_saved,
+                              lambda: loop.call_soon_threadsafe(wakeups.put_nowait, None))
+        self.startup_seconds = time.perf_counter() - started
+        if probe:
+            rss = peak_rss()
+            if rss is not None:
+                print(f"rss {rss}", flush=True)
+            print(f"ready {time.time():.6f}", flush=True)
+            os._exit(0)  # 与窗口版的--startup-probe相同，不写存档
+        print(f"Headless monitor ready in {self.startup_seconds:.2f} s, data directory: {APPDATA_PATH}", flush=True)
+
+        tasks = [loop.create_task(self._consume(wakeups)), loop.create_task(self._autosave())]
+        if self.status_interval > 0:
+            tasks.append(loop.create_task(self._report_status()))
+        try:
+            await self._stop.wait()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.shutdown()
+
+    def stop(self):
+        if self._stop is not None:
+            self._stop.set()
+
+    async def _consume(self, wakeups):
+        while True:
+            await wakeups.get()
+            self.process_audio()
+
+    async def _autosave(self):
+        while True:
+            await asyncio.sleep(AUTOSAVE_INTERVAL)
+            self.save_current_progress()
+
+    async def _report_status(self):
+        while True:
+            await asyncio.sleep(self.status_interval)
+            print(self.status_line(), flush=True)
+
+    def status_line(self):
+        """一行状态：音量和目标、当日进度、当日三级树数量和分数、总分、当日专注时间"""
+        manager = self.tree_manager
+        if manager.morning_mode:
+            target = f">{manager.threshold_high}"
+        else:
+            target = f"<{manager.threshold_low}"
+        loudness = "--" if self.current_loudness is None else self.current_loudness
+        return (f"{time.strftime('%H:%M:%S')}  loudness {loudness} (target {target})  "
+                f"progress {min(100.0, manager.daily_progress):.0f}%  "
+                f"today {manager.daily_seedlings}/{manager.daily_trees}/{manager.daily_giants} "
+                f"score {manager.get_daily_score()}  total {manager.get_total_score()}  "
+                f"focus {manager.daily_focus_seconds / 60:.1f} min")
+
+    def shutdown(self):
+        super().shutdown()
+        print(self.status_line())
+        print_run_report()
+
+# ======================
+# 命令行
+# ======================
+def main(argv=None):
+    options = parse_options(sys.argv[1:] if argv is None else argv)
+    if options["classroom"] is not None:
+        print("--classroom needs the window, ignoring it in headless mode")
+        options["classroom"] = None
+    apply_options(options)
+    monitor = HeadlessMonitor(morning_mode=options["morning"], status_interval=options["status_interval"],
+                              **core_arguments(options))
+    try:
+        asyncio.run(monitor.run(probe=options["startup_probe"]))
+    except KeyboardInterrupt:
+        print("\nApplication terminated by user")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
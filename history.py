@@ -0,0 +1,143 @@
+'''
+Apache license 2.0
+Version 2.0, January 2004
+Read https://www.apache.org/licenses/LICENSE-2.0
+Full License is in /LICENCE file
+'''
+# 长期的每日历史记录：定长二进制记录，追加写入，查询时用NumPy直接在内存映射上计算
+import os
+import datetime
+from pathlib import Path
+import numpy as np
+
+# 每天一条记录（32字节），按日期递增追加
+HISTORY_RECORD = np.dtype([
+    ('day', '<i4'),            # date.toordinal()
+    ('seedlings', '<i4'),
+    ('trees', '<i4'),
+    ('giants', '<i4'),
+    ('score', '<i8'),
+    ('focus_seconds', '<f8'),
+])
+
+def daily_score(data, merge_count=10):
+    """一天的分数（折算成树苗的数量）；旧版本的每日进度没有score字段，按三级数量和合并数量计算"""
+    if "score" in data:
+        return data["score"]
+    return (data.get("seedlings", 0) + data.get("trees", 0) * merge_count
+            + data.get("giants", 0) * merge_count * merge_count)
+
+class HistoryArchive:
+    """每日历史档案
+
+    append是O(1)的文件追加；records返回只读的内存映射，各列是对同一块内存的视图，
+    范围查询用searchsorted定位后直接切片，不复制数据。
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def records(self):
+        """所有记录（只读内存映射，按日期排序）"""
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            size = 0
+        count = size // HISTORY_RECORD.itemsize
+        if count == 0:
+            return np.zeros(0, dtype=HISTORY_RECORD)
+        # 末尾写了一半的记录不映射
+        return np.memmap(self.path, dtype=HISTORY_RECORD, mode='r', shape=(count,))
+
+    def last_day(self):
+        """最后一条记录的日期，没有记录时返回None"""
+        records = self.records()
+        if len(records) == 0:
+            return None
+        return datetime.date.fromordinal(int(records['day'][-1]))
+
+    def append(self, date, seedlings, trees, giants, score, focus_seconds=0.0):
+        """追加一天的记录；日期不晚于最后一条记录时忽略（已经归档过）"""
+        last = self.last_day()
+        if last is not None and date <= last:
+            return False
+        record = np.array([(date.toordinal(), seedlings, trees, giants, score, focus_seconds)],
+                          dtype=HISTORY_RECORD)
+        Path(os.path.dirname(self.path)).mkdir(parents=True, exist_ok=True)
+        with open(self.path, 'ab') as f:
+            size = f.tell()
+            aligned = size - size % HISTORY_RECORD.itemsize
+            if aligned != size:
+                f.truncate(aligned)  # 丢掉写了一半的记录
+            f.write(record.tobytes())
+        return True
+
+    def append_days(self, all_daily, before, merge_count=10):
+        """把字典{日期字符串: 每日进度}中早于before、还没归档的日子按日期顺序追加
+
+        没有score字段的日子按merge_count从三级数量计算分数。
+        """
+        last = self.last_day()
+        days = []
+        for date_str, data in all_daily.items():
+            try:
+                date = datetime.date.fromisoformat(date_str)
+            except ValueError:
+                continue
+            if date < before and (last is None or date > last):
+                days.append((date, data))
+
+        for date, data in sorted(days, key=lambda item: item[0]):
+            self.append(date, data.get("seedlings", 0), data.get("trees", 0), data.get("giants", 0),
+                        daily_score(data, merge_count), data.get("focus_seconds", 0.0))
+        return len(days)
+
+    def range(self, start, end):
+        """[start, end]（含两端）之间的记录，是records()的切片视图"""
+        records = self.records()
+        days = records['day']
+        lo = np.searchsorted(days, start.toordinal(), side='left')
+        hi = np.searchsorted(days, end.toordinal(), side='right')
+        return records[lo:hi]
+
+    def last_days(self, count, today=None):
+        """最近count天（不含今天）的记录"""
+        today = today or datetime.date.today()
+        return self.range(today - datetime.timedelta(days=count), today - datetime.timedelta(days=1))
+
+    def monthly_totals(self):
+        """按月汇总，返回结构化数组：year, month, days, seedlings, trees, giants, score, focus_seconds"""
+        records = self.records()
+        result_dtype = np.dtype([
+            ('year', '<i4'), ('month', '<i4'), ('days', '<i4'),
+            ('seedlings', '<i8'), ('trees', '<i8'), ('giants', '<i8'),
+            ('score', '<i8'), ('focus_seconds', '<f8'),
+        ])
+        if len(records) == 0:
+            return np.zeros(0, dtype=result_dtype)
+
+        # ordinal转成datetime64[D]再截到月（0001-01-01的ordinal为1）
+        epoch = datetime.date(1970, 1, 1).toordinal()
+        months = (records['day'].astype('i8') - epoch).astype('datetime64[D]').astype('datetime64[M]')
+        starts = np.flatnonzero(np.concatenate(([True], months[1:] != months[:-1])))
+
+        result = np.zeros(len(starts), dtype=result_dtype)
+        month_index = months[starts].astype('i8')
+        result['year'] = 1970 + month_index // 12
+        result['month'] = month_index % 12 + 1
+        result['days'] = np.diff(np.concatenate((starts, [len(records)])))
+        for field in ('seedlings', 'trees', 'giants', 'score', 'focus_seconds'):
+            result[field] = np.add.reduceat(records[field], starts)
+        return result
+
+    def best_week(self):
+        """分数最高的连续7天（没有记录的日子算0分），返回(开始日期, 总分)，没有记录时返回None"""
+        records = self.records()
+        if len(records) == 0:
+            return None
+        days = records['day'].astype('i8')
+        first = int(days[0])
+        daily = np.zeros(int(days[-1]) - first + 7, dtype='i8')
+        daily[days - first] = records['score']
+        window = np.convolve(daily, np.ones(7, dtype='i8'), mode='valid')
+        start = int(np.argmax(window))
+        return datetime.date.fromordinal(first + start), int(window[start])
@@ -6,265 +6,87 @@ Full License is in /LICENCE file
 '''
 import sys
 import os
-import json
 import datetime
-import sounddevice as sd
-import numpy as np
-from PySide6 import QtCore, QtWidgets, QtGui
 import platform
-import tempfile
-from pathlib import Path
-
-result_sound = 0
-
-def audio_callback(indata, frames, time_info, status):
-    global result_sound
-    if status:
-        print(status, file=sys.stderr)
-    rms = np.sqrt(np.mean(indata ** 2))
-    loudness = int(rms * 1000)
-    result_sound = loudness
-
-def start_microphone_monitor():
-    try:
-        # 获取默认输入设备信息
-        default_input = sd.query_devices(kind='input')
-        print(f"Using audio device: {default_input['name']}")
-
-        stream = sd.InputStream(
-            callback=audio_callback,
-            channels=1,
-            samplerate=16000,
-            blocksize=512,
-            dtype='float32'
-        )
-        stream.start()
-        return stream
-    except Exception as e:
-        print(f"Audio initialization error: {e}")
-        # 返回一个模拟的stream对象，避免程序崩溃
-        class MockStream:
-            def __init__(self): pass
-            def start(self): pass
-            def stop(self): pass
-            def close(self): pass
-        return MockStream()
-
-# ======================
-# POSIX兼容的数据路径处理
-# ======================
-def get_app_data_path():
-    """获取跨平台的应用数据目录"""
-    system = platform.system()
-
-    if system == "Windows":
-        # Windows: APPDATA
-        base_path = os.getenv('APPDATA', os.path.expanduser('~'))
-        app_data_path = os.path.join(base_path, "PlanTree")
-
-    elif system == "Linux":
-        # Linux: 遵循XDG规范
-        xdg_data_home = os.getenv('XDG_DATA_HOME')
-        if xdg_data_home:
-            base_path = xdg_data_home
-        else:
-            base_path = os.path.join(os.path.expanduser('~'), '.local', 'share')
-        app_data_path = os.path.join(base_path, "plantree")
-
-    elif system == "Darwin":  # macOS
-        base_path = os.path.join(os.path.expanduser('~'), 'Library', 'Application Support')
-        app_data_path = os.path.join(base_path, "PlanTree")
-
-    else:  # 其他Unix-like系统
-        base_path = os.path.expanduser('~')
-        app_data_path = os.path.join(base_path, ".plantree")
-
-    # 创建目录（递归创建）
-    Path(app_data_path).mkdir(parents=True, exist_ok=True)
-
-    # 设置适当的权限（仅限Unix-like系统）
-    if system != "Windows":
-        try:
-            os.chmod(app_data_path, 0o755)  # rwxr-xr-x
-        except:
-            pass
-
-    return app_data_path
-
-# 初始化数据路径
-APPDATA_PATH = get_app_data_path()
-SAVE_FILE = os.path.join(APPDATA_PATH, "progress.json")
-LEADERBOARD_FILE = os.path.join(APPDATA_PATH, "leaderboard.json")
-DAILY_PROGRESS_FILE = os.path.join(APPDATA_PATH, "daily_progress.json")
-
-def load_progress():
-    """加载主进度（永久积累）"""
-    try:
-        with open(SAVE_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-
-            # 向后兼容性检查
-            if "merge_count" not in data:
-                data["merge_count"] = 10
-            if "total_seedlings" not in data:
-                data["total_seedlings"] = 0
-            if "total_trees" not in data:
-                data["total_trees"] = 0
-            if "total_giants" not in data:
-                data["total_giants"] = 0
-
-            return data
-    except (FileNotFoundError, json.JSONDecodeError, IOError) as e:
-        print(f"Loading progress failed: {e}, using defaults")
-        return {
-            "total_seedlings": 0,
-            "total_trees": 0,
-            "total_giants": 0,
-            "merge_count": 10
-        }
-
-def save_progress(data):
-    """保存主进度"""
-    try:
-        # 确保目录存在
-        Path(APPDATA_PATH).mkdir(parents=True, exist_ok=True)
-
-        # 原子写入（使用临时文件）
-        temp_file = SAVE_FILE + '.tmp'
-        with open(temp_file, 'w', encoding='utf-8', errors='replace') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-
-        # POSIX兼容的原子重命名
-        os.replace(temp_file, SAVE_FILE)
-
-        # 设置适当的文件权限（仅限Unix-like系统）
-        if platform.system() != "Windows":
-            try:
-                os.chmod(SAVE_FILE, 0o644)  # rw-r--r--
-            except:
-                pass
-
-    except Exception as e:
-        print(f"Saving progress failed: {e}")
-
-def load_daily_progress():
-    """加载每日独立进度"""
-    today = str(datetime.date.today())
-
-    try:
-        with open(DAILY_PROGRESS_FILE, 'r', encoding='utf-8') as f:
-            all_data = json.load(f)
-
-            # 获取今天的数据，如果不存在则创建新的
-            if today in all_data:
-                return all_data[today]
-    except (FileNotFoundError, json.JSONDecodeError, IOError) as e:
-        print(f"Loading daily progress failed: {e}")
-
-    # 返回今天的初始数据
-    return {
-        "date": today,
-        "progress": 0.0,
-        "seedlings": 0,
-        "trees": 0,
-        "giants": 0
+import math
+import time
+import threading
+if __name__ == "__main__" and "--headless" in sys.argv:
+    # 无界面模式不导入Qt（headless.py）
+    import headless
+    sys.exit(headless.main(sys.argv[1:]))
+from PySide6 import QtCore, QtWidgets, QtGui
+from storage import APPDATA_PATH
+from perf import peak_rss, stats as perf_stats, timed
+from monitor import MonitorCore, apply_options, core_arguments, parse_options, print_run_report
+from classroom import ClassroomCore, parse_classroom_spec
+# audio / dsp / recorder 依赖NumPy和PortAudio，在窗口显示之后由后台线程导入
+
+RENDER_FPS = 20           # 界面刷新的最高帧率
+
+# 树的三个等级：(图标, 字号px)，同一等级的标签共用一份样式
+TREE_TIERS = [("🌱", 24), ("🌳", 28), ("🎄", 32)]
+TIER_STYLES = [f"font-size: {size}px; margin: 2px;" for _, size in TREE_TIERS]
+# 主窗口和教室模式窗口共用的暗色主题
+DARK_STYLE = """
+    QWidget {
+        background-color: #1e1e1e;
+        color: #e0e0e0;
     }
+    QProgressBar {
+        border: 1px solid #444;
+        border-radius: 5px;
+        text-align: center;
+        font-weight: bold;
+    }
+    QProgressBar::chunk {
+        background-color: #0078d4;
+        border-radius: 4px;
+    }
+    QPushButton {
+        background-color: #3c3c3c;
+        color: white;
+        border: 1px solid #555;
+        padding: 8px 16px;
+        border-radius: 4px;
+    }
+    QPushButton:hover {
+        background-color: #4c4c4c;
+    }
+    QCheckBox {
+        spacing: 8px;
+    }
+    QCheckBox::indicator {
+        width: 20px;
+        height: 20px;
+    }
+"""
+TREE_DISPLAY_STYLE = """
+    background-color: #2d2d2d;
+    border: 2px solid #444;
+    border-radius: 15px;
+    padding: 10px;
+"""
 
-def save_daily_progress(data):
-    """保存每日进度"""
-    try:
-        today = str(datetime.date.today())
-        all_data = {}
-
-        # 读取现有数据
-        try:
-            with open(DAILY_PROGRESS_FILE, 'r', encoding='utf-8') as f:
-                all_data = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            pass
-
-        # 更新今天的数据
-        all_data[today] = data
-
-        # 清理旧数据（保留最近7天）
-        today_date = datetime.date.today()
-        to_delete = []
-        for date_str in list(all_data.keys()):
-            try:
-                date_obj = datetime.datetime.strptime(date_str, "%Y-%m-%d").date()
-                if (today_date - date_obj).days > 7:
-                    to_delete.append(date_str)
-            except ValueError:
-                to_delete.append(date_str)
-
-        for key in to_delete:
-            all_data.pop(key, None)
-
-        # 确保目录存在
-        Path(APPDATA_PATH).mkdir(parents=True, exist_ok=True)
-
-        # 原子写入
-        temp_file = DAILY_PROGRESS_FILE + '.tmp'
-        with open(temp_file, 'w', encoding='utf-8', errors='replace') as f:
-            json.dump(all_data, f, ensure_ascii=False, indent=2)
-
-        os.replace(temp_file, DAILY_PROGRESS_FILE)
-
-        # 设置文件权限（仅限Unix-like系统）
-        if platform.system() != "Windows":
-            try:
-                os.chmod(DAILY_PROGRESS_FILE, 0o644)
-            except:
-                pass
-
-    except Exception as e:
-        print(f"Saving daily progress failed: {e}")
-
-def load_leaderboard():
-    try:
-        with open(LEADERBOARD_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError, IOError) as e:
-        print(f"Loading leaderboard failed: {e}")
-        return []
-
-def save_leaderboard(board):
-    try:
-        # 确保目录存在
-        Path(APPDATA_PATH).mkdir(parents=True, exist_ok=True)
-
-        # 原子写入
-        temp_file = LEADERBOARD_FILE + '.tmp'
-        with open(temp_file, 'w', encoding='utf-8', errors='replace') as f:
-            json.dump(board, f, ensure_ascii=False, indent=2)
-
-        os.replace(temp_file, LEADERBOARD_FILE)
-
-        # 设置文件权限
-        if platform.system() != "Windows":
-            try:
-                os.chmod(LEADERBOARD_FILE, 0o644)
-            except:
-                pass
-
-    except Exception as e:
-        print(f"Saving leaderboard failed: {e}")
+class FlowLayout(QtWidgets.QLayout):
+    """流式布局
 
-def bubble_sort_leaderboard(board):
-    n = len(board)
-    for i in range(n):
-        for j in range(0, n - i - 1):
-            if board[j]["score"] < board[j + 1]["score"]:
-                board[j], board[j + 1] = board[j + 1], board[j]
-    return board
+    缓存每个布局项的sizeHint和按宽度计算出的换行结果，只在增删布局项时失效；
+    在末尾追加时只计算新增的部分。子控件的sizeHint改变后需要重新加入布局。
+    """
+    MAX_CACHED_WIDTHS = 8
 
-class FlowLayout(QtWidgets.QLayout):
     def __init__(self, parent=None, margin=0, spacing=-1):
         super().__init__(parent)
         if parent is not None:
             self.setContentsMargins(margin, margin, margin, margin)
         self.setSpacing(spacing if spacing >= 0 else 6)
         self._item_list = []
+        self._hints = []        # 每个布局项的(宽, 高)，None表示还没缓存
+        self._lines = {}        # (宽度, 间距) -> 每个布局项的(x, y, 下一个x, 当前行高)，相对坐标
+        self._min_size = None
+        self._applied_rect = None
+        self._applied_count = 0  # 在_applied_rect下已经设置好几何的前缀项数
 
     def __del__(self):
         while self.count():
@@ -272,6 +94,19 @@ class FlowLayout(QtWidgets.QLayout):
 
     def addItem(self, item):
         self._item_list.append(item)
+        self._hints.append(None)
+        if self._min_size is not None:
+            if item.isEmpty():
+                self._min_size = None  # 隐藏控件的最小尺寸为0，显示后再重新计算
+            else:
+                self._min_size = self._min_size.expandedTo(item.minimumSize())
+
+    def insertWidget(self, index, widget):
+        # 由addWidget创建布局项（追加到末尾），再移动到指定位置
+        self.addWidget(widget)
+        self._item_list.insert(index, self._item_list.pop())
+        self._hints.insert(index, self._hints.pop())
+        self._truncate_from(index)
 
     def count(self):
         return len(self._item_list)
@@ -283,7 +118,19 @@ class FlowLayout(QtWidgets.QLayout):
 
     def takeAt(self, index):
         if 0 <= index < len(self._item_list):
-            return self._item_list.pop(index)
+            self._hints.pop(index)
+            self._truncate_from(index)
+            item = self._item_list.pop(index)
+            if self._min_size is not None and not item.isEmpty():
+                # 只有移除的是最宽或最高的一项时，最小尺寸才可能变小
+                size = item.minimumSize()
+                if size.width() >= self._min_size.width() or size.height() >= self._min_size.height():
+                    self._min_size = None
+            widget = item.widget()
+            if widget is not None:
+                # 标记为不在布局里，再次加入时Qt不用逐项查找它原来在哪个布局
+                widget.setAttribute(QtCore.Qt.WidgetAttribute.WA_LaidOut, False)
+            return item
         return None
 
     def expandingDirections(self):
@@ -293,191 +140,240 @@ class FlowLayout(QtWidgets.QLayout):
         return True
 
     def heightForWidth(self, width):
-        return self._do_layout(QtCore.QRect(0, 0, width, 0), test=True)
+        lines = self._layout_lines(width)
+        if not lines:
+            return 0
+        _, y, _, line_height = lines[-1]
+        return y + line_height
 
     def setGeometry(self, rect):
         super().setGeometry(rect)
-        self._do_layout(rect, test=False)
+        if rect != self._applied_rect:
+            self._applied_rect = QtCore.QRect(rect)
+            self._applied_count = 0
+
+        lines = self._layout_lines(rect.width())
+        start = self._applied_count
+        self._applied_count = len(lines)
+        for index in range(start, len(lines)):
+            item = self._item_list[index]
+            if item.isEmpty() and self._applied_count > index:
+                # 隐藏的控件设置几何不生效，显示后需要重新设置
+                self._applied_count = index
+            x, y, _, _ = lines[index]
+            width, height = self._hint(index)
+            item.setGeometry(QtCore.QRect(rect.x() + x, rect.y() + y, width, height))
 
     def sizeHint(self):
         return self.minimumSize()
 
     def minimumSize(self):
-        size = QtCore.QSize()
-        for item in self._item_list:
-            size = size.expandedTo(item.minimumSize())
+        if self._min_size is None:
+            size = QtCore.QSize()
+            for item in self._item_list:
+                size = size.expandedTo(item.minimumSize())
+            self._min_size = size
         left, top, right, bottom = self.getContentsMargins()
-        size += QtCore.QSize(left + right, top + bottom)
-        return size
-
-    def _do_layout(self, rect, test=False):
-        x = rect.x()
-        y = rect.y()
-        line_height = 0
+        return self._min_size + QtCore.QSize(left + right, top + bottom)
+
+    def _hint(self, index):
+        hint = self._hints[index]
+        if hint is None:
+            item = self._item_list[index]
+            size = item.sizeHint()
+            hint = (size.width(), size.height())
+            if not item.isEmpty():  # 隐藏控件的sizeHint为0，显示后会变，不缓存
+                self._hints[index] = hint
+        return hint
+
+    def _truncate_from(self, index):
+        """index及之后的布局项发生变化，丢弃它们的换行结果"""
+        for lines in self._lines.values():
+            del lines[index:]
+        self._applied_count = min(self._applied_count, index)
+
+    def _layout_lines(self, width):
+        """返回指定宽度下每个布局项的位置，接着上次算好的前缀继续计算"""
         spacing = self.spacing()
-
-        for item in self._item_list:
-            next_x = x + item.sizeHint().width() + spacing
-            if next_x - spacing > rect.right() and line_height > 0:
-                x = rect.x()
+        key = (width, spacing)
+        lines = self._lines.get(key)
+        if lines is None:
+            if len(self._lines) >= self.MAX_CACHED_WIDTHS:
+                self._lines.clear()
+            lines = self._lines[key] = []
+
+        if lines:
+            _, y, x, line_height = lines[-1]
+        else:
+            x = y = line_height = 0
+        right = width - 1
+        uncached = None
+
+        for index in range(len(lines), len(self._item_list)):
+            item_width, item_height = self._hint(index)
+            if uncached is None and self._hints[index] is None:
+                uncached = index
+            next_x = x + item_width + spacing
+            if next_x - spacing > right and line_height > 0:
+                x = 0
                 y = y + line_height + spacing
-                next_x = x + item.sizeHint().width() + spacing
+                next_x = x + item_width + spacing
                 line_height = 0
-
-            if not test:
-                item.setGeometry(QtCore.QRect(QtCore.QPoint(x, y), item.sizeHint()))
+            line_height = max(line_height, item_height)
+            lines.append((x, y, next_x, line_height))
             x = next_x
-            line_height = max(line_height, item.sizeHint().height())
-
-        return y + line_height - rect.y()
-
-class TreeManager:
-    def __init__(self):
-        self.morning_mode = False
-        self.threshold_low = 60
-        self.threshold_high = 60
-        self.growth_speed = 25.0  # %/秒
-        self.merge_count = 10
-
-        # 每日独立进度
-        self.daily_progress = 0.0
-        self.daily_seedlings = 0
-        self.daily_trees = 0
-        self.daily_giants = 0
-
-        # 总进度（永久积累）
-        self.total_seedlings = 0
-        self.total_trees = 0
-        self.total_giants = 0
-
-    def load_from_data(self, main_data, daily_data):
-        # 加载主进度
-        self.merge_count = main_data.get("merge_count", 10)
-        self.total_seedlings = main_data.get("total_seedlings", 0)
-        self.total_trees = main_data.get("total_trees", 0)
-        self.total_giants = main_data.get("total_giants", 0)
-
-        # 加载每日进度
-        self.daily_progress = daily_data.get("progress", 0.0)
-        self.daily_seedlings = daily_data.get("seedlings", 0)
-        self.daily_trees = daily_data.get("trees", 0)
-        self.daily_giants = daily_data.get("giants", 0)
-
-    def save_main_progress(self):
-        """保存主进度"""
-        return {
-            "total_seedlings": self.total_seedlings,
-            "total_trees": self.total_trees,
-            "total_giants": self.total_giants,
-            "merge_count": self.merge_count
-        }
-
-    def save_daily_progress(self):
-        """保存每日进度"""
-        return {
-            "date": str(datetime.date.today()),
-            "progress": self.daily_progress,
-            "seedlings": self.daily_seedlings,
-            "trees": self.daily_trees,
-            "giants": self.daily_giants
-        }
-
-    def update(self, loudness):
-        time_step = 0.01
-        growth_increment = self.growth_speed * time_step
-
-        if self.morning_mode:
-            if loudness > self.threshold_high:
-                self.daily_progress += growth_increment
-            else:
-                self.daily_progress = max(0.0, self.daily_progress - 0.1)
-        else:
-            if loudness < self.threshold_low:
-                self.daily_progress += growth_increment
-            else:
-                self.daily_progress *= 0.92
-
-        tree_changed = False
-        if self.daily_progress >= 100:
-            self.daily_progress = 0
-            self.daily_seedlings += 1
-            self.total_seedlings += 1  # 添加到总进度
-            self._merge_trees()
-            tree_changed = True
-
-        return tree_changed
-
-    def _merge_trees(self):
-        # 处理每日进度的合并
-        if self.daily_seedlings >= self.merge_count:
-            new_trees = self.daily_seedlings // self.merge_count
-            self.daily_trees += new_trees
-            self.daily_seedlings %= self.merge_count
-            if self.daily_trees >= self.merge_count:
-                new_giants = self.daily_trees // self.merge_count
-                self.daily_giants += new_giants
-                self.daily_trees %= self.merge_count
-
-        # 处理总进度的合并
-        if self.total_seedlings >= self.merge_count:
-            new_trees = self.total_seedlings // self.merge_count
-            self.total_trees += new_trees
-            self.total_seedlings %= self.merge_count
-            if self.total_trees >= self.merge_count:
-                new_giants = self.total_trees // self.merge_count
-                self.total_giants += new_giants
-                self.total_trees %= self.merge_count
-
-    def submit_daily_score(self):
-        daily_score = self.get_daily_score()
-        if daily_score == 0:
-            return
 
-        board = load_leaderboard()
-        today_str = str(datetime.date.today())
-
-        # 检查今天是否已有记录
-        existing_index = -1
-        for i, item in enumerate(board):
-            if item["date"] == today_str:
-                existing_index = i
-                break
+        if uncached is not None:
+            # 用到了没法缓存的sizeHint，下次从这里重新计算
+            result = list(lines)
+            del lines[uncached:]
+            return result
+        return lines
+
+class GlyphAtlas:
+    """把每个等级的图标预先渲染到同一张pixmap上，绘制时只做贴图"""
+    _cache = {}
+
+    @classmethod
+    def get(cls, device_ratio):
+        atlas = cls._cache.get(device_ratio)
+        if atlas is None:
+            atlas = cls._cache[device_ratio] = cls(device_ratio)
+        return atlas
+
+    def __init__(self, device_ratio):
+        # 每个图标占一个正方形格子，边长为字号+4（与标签的2px边距一致）
+        self.cells = [size + 4 for _, size in TREE_TIERS]
+        width = sum(self.cells)
+        height = max(self.cells)
+        self.pixmap = QtGui.QPixmap(int(width * device_ratio), int(height * device_ratio))
+        self.pixmap.setDevicePixelRatio(device_ratio)
+        self.pixmap.fill(QtCore.Qt.GlobalColor.transparent)
+
+        self.sources = []
+        painter = QtGui.QPainter(self.pixmap)
+        x = 0
+        for (icon, size), cell in zip(TREE_TIERS, self.cells):
+            font = painter.font()
+            font.setPixelSize(size)
+            painter.setFont(font)
+            rect = QtCore.QRectF(x, 0, cell, cell)
+            painter.drawText(rect, QtCore.Qt.AlignmentFlag.AlignCenter, icon)
+            self.sources.append(QtCore.QRectF(x * device_ratio, 0, cell * device_ratio, cell * device_ratio))
+            x += cell
+        painter.end()
+
+    def draw(self, painter, tier, x, y):
+        cell = self.cells[tier]
+        painter.drawPixmap(QtCore.QRectF(x, y, cell, cell), self.pixmap, self.sources[tier])
+
+
+class ForestView(QtWidgets.QWidget):
+    """自绘的树木显示区，控件数量固定
+
+    所有图标能放下时逐个绘制（排列方式同FlowLayout）；放不下时每个等级只画一个图标加“×N”。
+    """
+    SPACING = 8
+    MARGIN = 12  # 边框2px + 内边距10px
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setAttribute(QtCore.Qt.WidgetAttribute.WA_StyledBackground, True)
+        self.setStyleSheet(TREE_DISPLAY_STYLE)
+        self._counts = (0, 0, 0)
+        self._positions = None  # 逐个绘制时每个图标的(等级, x, y)；None表示需要聚合显示
+        self._layout_key = None
+        self._count_font = QtGui.QFont(self.font())
+        self._count_font.setPixelSize(16)
+        self._count_font.setBold(True)
+        self._empty_font = QtGui.QFont(self.font())
+        self._empty_font.setPixelSize(13)
+        self._empty_font.setItalic(True)
+
+    def set_counts(self, seedlings, trees, giants):
+        counts = (seedlings, trees, giants)
+        if counts != self._counts:
+            self._counts = counts
+            self.update()
+
+    def _layout(self, atlas, rect):
+        """计算逐个绘制时的位置；放不下时返回None"""
+        key = (self._counts, rect.width(), rect.height())
+        if key == self._layout_key:
+            return self._positions
+        self._layout_key = key
+
+        # 先按数量估算，明显放不下就不用逐个排列
+        smallest = min(atlas.cells) + self.SPACING
+        capacity = ((rect.width() + self.SPACING) // smallest) * ((rect.height() + self.SPACING) // smallest)
+        if sum(self._counts) > capacity:
+            self._positions = None
+            return None
+
+        positions = []
+        x = y = line_height = 0
+        for tier, count in enumerate(self._counts):
+            cell = atlas.cells[tier]
+            for _ in range(count):
+                if x + cell > rect.width() and line_height > 0:
+                    x = 0
+                    y += line_height + self.SPACING
+                    line_height = 0
+                if y + cell > rect.height():
+                    self._positions = None
+                    return None
+                positions.append((tier, rect.x() + x, rect.y() + y))
+                x += cell + self.SPACING
+                line_height = max(line_height, cell)
+        self._positions = positions
+        return positions
+
+    def paintEvent(self, event):
+        painter = QtGui.QPainter(self)
+        # 按样式表绘制背景和边框
+        option = QtWidgets.QStyleOption()
+        option.initFrom(self)
+        self.style().drawPrimitive(QtWidgets.QStyle.PrimitiveElement.PE_Widget, option, painter, self)
+
+        rect = self.rect().adjusted(self.MARGIN, self.MARGIN, -self.MARGIN, -self.MARGIN)
+        if not any(self._counts):
+            painter.setFont(self._empty_font)
+            painter.setPen(QtGui.QColor("#888"))
+            painter.drawText(rect, QtCore.Qt.AlignmentFlag.AlignLeft | QtCore.Qt.AlignmentFlag.AlignTop,
+                             "饿啊！这还没树")
+            return
 
-        if existing_index >= 0:
-            # 更新已有记录（如果分数更高）
-            if daily_score > board[existing_index]["score"]:
-                board[existing_index]["score"] = daily_score
-        else:
-            # 添加新记录
-            board.append({"date": today_str, "score": daily_score})
-
-        # 排序并保留前30
-        board = bubble_sort_leaderboard(board)
-        board = board[:30]
-        save_leaderboard(board)
-
-    def get_daily_score(self):
-        """返回当日分数"""
-        return (
-            self.daily_seedlings * 1 +
-            self.daily_trees * self.merge_count +
-            self.daily_giants * (self.merge_count ** 2)
-        )
+        atlas = GlyphAtlas.get(self.devicePixelRatioF())
+        positions = self._layout(atlas, rect)
+        if positions is not None:
+            for tier, x, y in positions:
+                atlas.draw(painter, tier, x, y)
+            return
 
-    def get_total_score(self):
-        """返回总分数"""
-        return (
-            self.total_seedlings * 1 +
-            self.total_trees * self.merge_count +
-            self.total_giants * (self.merge_count ** 2)
-        )
+        # 聚合显示：🌱 ×N  🌳 ×N  🎄 ×N
+        painter.setFont(self._count_font)
+        painter.setPen(QtGui.QColor("#e0e0e0"))
+        metrics = painter.fontMetrics()
+        x = rect.x()
+        for tier, count in enumerate(self._counts):
+            if count == 0:
+                continue
+            cell = atlas.cells[tier]
+            y = rect.y() + (max(atlas.cells) - cell) // 2
+            atlas.draw(painter, tier, x, y)
+            x += cell + 2
+            text = f"×{count}"
+            painter.drawText(QtCore.QRect(x, rect.y(), metrics.horizontalAdvance(text), max(atlas.cells)),
+                             QtCore.Qt.AlignmentFlag.AlignVCenter, text)
+            x += metrics.horizontalAdvance(text) + self.SPACING * 2
 
 class SettingsDialog(QtWidgets.QDialog):
-    def __init__(self, tree_manager, parent=None):
+    def __init__(self, tree_manager, parent=None, calibrator=None):
         super().__init__(parent)
         self.setWindowTitle("设置")
         self.resize(400, 300)
         self.tree_manager = tree_manager
+        self.calibrator = calibrator
 
         layout = QtWidgets.QVBoxLayout()
 
@@ -563,6 +459,19 @@ class SettingsDialog(QtWidgets.QDialog):
         merge_layout.addWidget(self.merge_slider)
         merge_layout.addWidget(self.merge_value_label)
 
+        # 自动校准：拖动阈值滑块即改为手动设置该阈值
+        if calibrator is not None:
+            self.auto_check = QtWidgets.QCheckBox("自动校准阈值")
+            self.auto_check.setChecked(calibrator.enabled)
+            self.auto_check.stateChanged.connect(self.toggle_auto_calibration)
+            self.calibration_label = QtWidgets.QLabel()
+            self.calibration_label.setStyleSheet("color: #888; font-size: 11px;")
+            self.low_slider.actionTriggered.connect(lambda _: self.set_manual(low=True))
+            self.high_slider.actionTriggered.connect(lambda _: self.set_manual(high=True))
+            layout.addWidget(self.auto_check)
+            layout.addWidget(self.calibration_label)
+            self.update_calibration_label()
+
         layout.addLayout(low_layout)
         layout.addLayout(high_layout)
         layout.addLayout(speed_layout)
@@ -621,51 +530,239 @@ class SettingsDialog(QtWidgets.QDialog):
         layout.addLayout(btn_layout)
         self.setLayout(layout)
 
-class LoudnessMonitor(QtWidgets.QWidget):
-    def __init__(self):
-        super().__init__()
+    def toggle_auto_calibration(self, state):
+        calibrator = self.calibrator
+        calibrator.enabled = (state == QtCore.Qt.CheckState.Checked.value)
+        if calibrator.enabled:
+            calibrator.auto_low = calibrator.auto_high = True
+            calibrator.apply(self.tree_manager)
+            self.low_slider.setValue(self.tree_manager.threshold_low)
+            self.high_slider.setValue(self.tree_manager.threshold_high)
+        self.update_calibration_label()
+
+    def set_manual(self, low=False, high=False):
+        if low:
+            self.calibrator.auto_low = False
+        if high:
+            self.calibrator.auto_high = False
+        self.update_calibration_label()
+
+    def update_calibration_label(self):
+        calibrator = self.calibrator
+        estimates = calibrator.estimates()
+        if estimates is None:
+            text = "正在采集环境音量..."
+        else:
+            text = f"底噪约 {estimates[0]:.0f}，说话约 {estimates[1]:.0f}"
+        if calibrator.enabled:
+            manual = [name for name, auto in (("安静", calibrator.auto_low), ("朗读", calibrator.auto_high)) if not auto]
+            if manual:
+                text += f"（{'、'.join(manual)}阈值为手动设置）"
+        self.calibration_label.setText(text)
+
+class AudioNotifier(QtCore.QObject):
+    """把音频线程的唤醒转成界面线程的排队信号"""
+    blocks_ready = QtCore.Signal()
+
+class PerfOverlay(QtWidgets.QLabel):
+    """性能浮层：按F12显示/隐藏，显示期间开启统计并每秒刷新一次"""
+    def __init__(self, window):
+        super().__init__(window)
+        self.setStyleSheet("background-color: rgba(0, 0, 0, 210); color: #7CFC00; "
+                           "font-family: monospace; font-size: 10px; padding: 4px;")
+        self.setAttribute(QtCore.Qt.WidgetAttribute.WA_TransparentForMouseEvents)
+        self.hide()
+        self.keep_enabled = perf_stats.enabled  # --stats开启的统计在浮层关闭后继续
+        self._timer = QtCore.QTimer(self)
+        self._timer.setInterval(1000)
+        self._timer.timeout.connect(self.refresh)
+        self._shortcut = QtGui.QShortcut(QtGui.QKeySequence("F12"), window)
+        self._shortcut.activated.connect(self.toggle)
+
+    def toggle(self):
+        if self.isVisible():
+            self._timer.stop()
+            self.hide()
+            perf_stats.enabled = self.keep_enabled
+            return
+        perf_stats.enabled = True
+        self.refresh()
+        self.show()
+        self.raise_()
+        self._timer.start()
+
+    def refresh(self):
+        self.setText(perf_stats.report())
+        self.adjustSize()
+        self.move(4, 4)
+
+class StartupNotifier(QtCore.QObject):
+    """后台启动线程完成后通知界面线程：(主进度, 当日进度)"""
+    ready = QtCore.Signal(object, object)
+
+class StartupProbe(QtCore.QObject):
+    """--startup-probe：打印第一次绘制和后台启动完成的时间（time.time()）以及峰值内存，然后直接退出，供bench_startup.py计时"""
+    def __init__(self, window):
+        super().__init__(window)
+        self.painted = False
+        window.installEventFilter(self)
+        # 在finish_startup之后连接，所以会在它之后调用
+        window.startup_notifier.ready.connect(self.on_ready, QtCore.Qt.ConnectionType.QueuedConnection)
+
+    def eventFilter(self, obj, event):
+        if not self.painted and event.type() == QtCore.QEvent.Type.Paint:
+            self.painted = True
+            print(f"first_paint {time.time():.6f}", flush=True)
+        return False
+
+    def on_ready(self, *_):
+        rss = peak_rss()
+        if rss is not None:
+            print(f"rss {rss}", flush=True)
+        print(f"ready {time.time():.6f}", flush=True)
+        os._exit(0)  # 不走closeEvent，测量时不写存档
+
+def class_leaderboard_text(uploader, limit=5):
+    """排行榜对话框里附加的全班排行榜（没有开启或还没查到时说明情况）
+
+    只读客户端缓存的结果，同时让它的后台线程重新查询，界面线程不访问网络。
+    """
+    if uploader is None:
+        return ""
+    uploader.request_top()
+    result = uploader.cached_top()
+    if result is None:
+        return "\n🌐 全班排行榜暂时连不上" if not uploader.online else "\n🌐 全班排行榜正在获取，稍后再打开"
+    board, count = result
+    text = "\n🌐 全 班 排 行 🌐\n"
+    for i, item in enumerate(board[:limit], 1):
+        text += f"{i}. {item['client']}  {item['date']} — {item['score']} 分\n"
+    if count > limit:
+        text += f"... 共 {count} 条记录\n"
+    return text
+
+class MonitorWindow:
+    """单人和教室两种窗口共用的部分：后台启动、音频唤醒、限制帧率的刷新、最小化时换省电配置和关闭
+
+    放在MonitorCore（或ClassroomCore）和QWidget前面一起继承；子类在__init__最后调用start_window，
+    并实现render_frame画一帧。
+    """
+    def start_window(self, startup_widgets):
+        # 音频线程有新block时通过信号唤醒界面线程，不再定时轮询
+        self.audio_notifier = AudioNotifier()
+        self.audio_notifier.blocks_ready.connect(
+            self.process_audio, QtCore.Qt.ConnectionType.QueuedConnection)
+        # 界面刷新和模拟分开：限制帧率，窗口不可见时不刷新
+        self.frames_rendered = 0
+        self.frames_skipped = 0
+        self._last_render = 0.0
+        self._trees_dirty = False  # 有新树，下一帧更新树和分数
+        self._render_timer = QtCore.QTimer(self)
+        self._render_timer.setSingleShot(True)
+        self._render_timer.timeout.connect(self.render)
+        # 读取进度、加载音频库都在后台线程进行，完成之前禁用依赖它们的控件
+        self.ready = False
+        self.startup_started = time.perf_counter()
+        self.startup_seconds = None
+        self._startup_widgets = startup_widgets
+        for widget in startup_widgets:
+            widget.setEnabled(False)
+        self.startup_notifier = StartupNotifier()
+        self.startup_notifier.ready.connect(
+            self.finish_startup, QtCore.Qt.ConnectionType.QueuedConnection)
+        self.perf_overlay = PerfOverlay(self)
+        self._loader = threading.Thread(target=self._load_backend, name="PlanTreeStartup", daemon=True)
+        self._loader.start()
+
+    def _load_backend(self):
+        """后台线程：读取进度，导入NumPy和音频库（初始化PortAudio）"""
+        main_saved, daily_saved = self.load_progress()
+        self.load_audio()
+        self.startup_notifier.ready.emit(main_saved, daily_saved)
+
+    def finish_startup(self, main_saved, daily_saved):
+        """界面线程：载入进度，打开麦克风（窗口已最小化时直接用省电配置）"""
+        self.start_monitoring(main_saved, daily_saved, self.audio_notifier.blocks_ready.emit,
+                              "low_power" if self.isMinimized() else None)
+        for widget in self._startup_widgets:
+            widget.setEnabled(True)
+        self.ready = True
+        self.startup_seconds = time.perf_counter() - self.startup_started
+        self._trees_dirty = True
+        self.request_render()
+
+    def toggle_morning_mode(self, state):
+        for manager in self.tree_managers():
+            manager.morning_mode = (state == QtCore.Qt.CheckState.Checked.value)
+        self.save_current_progress()
+        self.request_render()
+
+    def process_audio(self):
+        """模拟步（MonitorCore，按音频时间自动保存）之后请求刷新界面；模拟本身不碰界面"""
+        if super().process_audio():
+            self._trees_dirty = True
+        self.request_render()
+
+    def request_render(self):
+        """请求刷新界面：窗口不可见时不画，两帧之间至少间隔1/RENDER_FPS秒，多次请求合并成一帧"""
+        if not self.ready:
+            return
+        if not self.isVisible() or self.isMinimized():
+            self.frames_skipped += 1
+            return
+        if self._render_timer.isActive():
+            self.frames_skipped += 1
+            return
+        wait = self._last_render + 1.0 / RENDER_FPS - time.monotonic()
+        if wait > 0:
+            self.frames_skipped += 1
+            self._render_timer.start(max(1, int(wait * 1000)))
+            return
+        self.render()
+
+    @timed("render")
+    def render(self):
+        if not self.isVisible() or self.isMinimized():
+            self.frames_skipped += 1  # 定时器触发前窗口被最小化了
+            return
+        self._last_render = time.monotonic()
+        self.frames_rendered += 1
+        self.render_frame()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.request_render()  # 隐藏期间积累的变化
+
+    def changeEvent(self, event):
+        if event.type() == QtCore.QEvent.Type.WindowStateChange and self.ready:
+            self.set_capture_profile("low_power" if self.isMinimized() else self.preferred_profile)
+            if not self.isMinimized():
+                self.request_render()
+        super().changeEvent(event)
+
+    def closeEvent(self, event):
+        if not self.ready:
+            # 还没读完进度就关闭：等后台线程结束，不保存（避免用空进度覆盖存档）
+            self._loader.join(self.store.close_timeout)
+            self.store.close()
+            event.accept()
+            return
+        # 关闭时提交当日分数、保存进度，关闭麦克风和后台线程
+        self.shutdown()
+        print_run_report(f"Frames: {self.frames_rendered} rendered, {self.frames_skipped} skipped")
+        event.accept()
+
+class LoudnessMonitor(MonitorWindow, MonitorCore, QtWidgets.QWidget):
+    """窗口版：进度、采集和保存在MonitorCore（monitor.py）里，这里只负责界面"""
+    def __init__(self, forest_view=True, **options):
+        QtWidgets.QWidget.__init__(self)
+        # 存储、进度、校准和采集配置；读取进度在窗口显示后由后台线程完成
+        MonitorCore.__init__(self, **options)
         self.setWindowTitle("种 树 游 戏")
         self.resize(480, 420)
 
         # 应用暗色主题
-        self.setStyleSheet("""
-            QWidget {
-                background-color: #1e1e1e;
-                color: #e0e0e0;
-            }
-            QProgressBar {
-                border: 1px solid #444;
-                border-radius: 5px;
-                text-align: center;
-                font-weight: bold;
-            }
-            QProgressBar::chunk {
-                background-color: #0078d4;
-                border-radius: 4px;
-            }
-            QPushButton {
-                background-color: #3c3c3c;
-                color: white;
-                border: 1px solid #555;
-                padding: 8px 16px;
-                border-radius: 4px;
-            }
-            QPushButton:hover {
-                background-color: #4c4c4c;
-            }
-            QCheckBox {
-                spacing: 8px;
-            }
-            QCheckBox::indicator {
-                width: 20px;
-                height: 20px;
-            }
-        """)
-
-        self.tree_manager = TreeManager()
-        main_saved = load_progress()
-        daily_saved = load_daily_progress()
-        self.tree_manager.load_from_data(main_saved, daily_saved)
+        self.setStyleSheet(DARK_STYLE)
 
         # ===== 顶部区域 =====
         topLayout = QtWidgets.QHBoxLayout()
@@ -715,7 +812,7 @@ class LoudnessMonitor(QtWidgets.QWidget):
         topLayout.addWidget(self.setButton)
 
         # ===== 主标题和音量显示 =====
-        self.titleLabel = QtWidgets.QLabel("-- 正在监听 --")
+        self.titleLabel = QtWidgets.QLabel("-- 正在加载 --")
         self.titleLabel.setAlignment(QtCore.Qt.AlignmentFlag.AlignCenter)
         self.titleLabel.setStyleSheet("font-size: 20px; font-weight: bold; margin: 10px 0; color: #4CAF50;")
 
@@ -746,15 +843,16 @@ class LoudnessMonitor(QtWidgets.QWidget):
         tree_label = QtWidgets.QLabel("R a i n f o r e s t")
         tree_label.setStyleSheet("font-size: 14px; font-weight: bold; color: #4CAF50; margin-top: 10px;")
 
-        self.treeDisplay = QtWidgets.QWidget()
+        if forest_view:
+            # 单个自绘控件，树再多控件数量也不变
+            self.forestView = ForestView()
+            self.treeDisplay = self.forestView
+        else:
+            self.forestView = None
+            self.treeDisplay = QtWidgets.QWidget()
+            self.treeDisplay.setStyleSheet(TREE_DISPLAY_STYLE)
+            self.treeLayout = FlowLayout(self.treeDisplay, spacing=8)
         self.treeDisplay.setFixedHeight(130)
-        self.treeDisplay.setStyleSheet("""
-            background-color: #2d2d2d;
-            border: 2px solid #444;
-            border-radius: 15px;
-            padding: 10px;
-        """)
-        self.treeLayout = FlowLayout(self.treeDisplay, spacing=8)
 
         # ===== 按钮区域 =====
         buttonLayout = QtWidgets.QHBoxLayout()
@@ -785,68 +883,89 @@ class LoudnessMonitor(QtWidgets.QWidget):
         self.setLayout(mainLayout)
 
         # ===== 启动 =====
-        self.stream = start_microphone_monitor()
-        self.timer = QtCore.QTimer()
-        self.timer.timeout.connect(self.update_display)
-        self.timer.start(10)
-        self._last_icons = None
+        self._shown_title = None
+        # 每个等级当前显示的标签，以及被移除后留着复用的标签
+        self._tier_labels = [[] for _ in TREE_TIERS]
+        self._tier_pools = [[] for _ in TREE_TIERS]
+        self._last_counts = None
+        if self.forestView is None:
+            self.empty_label = QtWidgets.QLabel("饿啊！这还没树")
+            self.empty_label.setStyleSheet("color: #888; font-size: 13px; font-style: italic;")
+            self.treeLayout.addWidget(self.empty_label)
         self.update_tree_display()
         self.update_score_display()
-
-    def toggle_morning_mode(self, state):
-        self.tree_manager.morning_mode = (state == QtCore.Qt.CheckState.Checked.value)
-        self.save_current_progress()
-
-    def update_display(self):
-        global result_sound
-
-        # 更新标题显示
-        mode_text = "（早毒模式）" if self.tree_manager.morning_mode else "（静以修身）"
-        threshold = self.tree_manager.threshold_high if self.tree_manager.morning_mode else self.tree_manager.threshold_low
-        self.titleLabel.setText(f"当前音量: {result_sound}  目标: {'>' if self.tree_manager.morning_mode else '<'}{threshold} {mode_text}")
-
-        # 更新进度
-        tree_changed = self.tree_manager.update(result_sound)
-        self.progressBar.setValue(int(min(100, self.tree_manager.daily_progress)))
-
-        if tree_changed:
+        self.start_window((self.morningCheckBox, self.setButton, self.rankButton, self.resetButton))
+
+    def finish_startup(self, main_saved, daily_saved):
+        super().finish_startup(main_saved, daily_saved)
+        self.titleLabel.setText("-- 正在监听 --")
+
+    def render_frame(self):
+        """只更新显示内容真正变化了的控件"""
+        manager = self.tree_manager
+        title = (self.current_loudness, manager.morning_mode,
+                 manager.threshold_high if manager.morning_mode else manager.threshold_low)
+        if title != self._shown_title and self.current_loudness is not None:
+            self._shown_title = title
+            loudness, morning, threshold = title
+            mode_text = "（早毒模式）" if morning else "（静以修身）"
+            self.titleLabel.setText(f"当前音量: {loudness}  目标: {'>' if morning else '<'}{threshold} {mode_text}")
+
+        progress = int(min(100, manager.daily_progress))
+        if progress != self.progressBar.value():
+            self.progressBar.setValue(progress)
+
+        if self._trees_dirty:
+            self._trees_dirty = False
             self.update_tree_display()
             self.update_score_display()
 
-        # 每5秒自动保存一次
-        if getattr(self, '_save_counter', 0) % 500 == 0:
-            self.save_current_progress()
-        self._save_counter = getattr(self, '_save_counter', 0) + 1
-
+    @timed("update_tree_display")
     def update_tree_display(self):
-        new_icons = ["🌱"] * self.tree_manager.daily_seedlings + \
-                    ["🌳"] * self.tree_manager.daily_trees + \
-                    ["🎄"] * self.tree_manager.daily_giants
-
-        if self._last_icons == new_icons:
+        counts = (self.tree_manager.daily_seedlings,
+                  self.tree_manager.daily_trees,
+                  self.tree_manager.daily_giants)
+        if self._last_counts == counts:
             return
-        self._last_icons = new_icons
+        self._last_counts = counts
 
-        while self.treeLayout.count():
-            item = self.treeLayout.takeAt(0)
-            if item.widget():
-                item.widget().deleteLater()
+        if self.forestView is not None:
+            self.forestView.set_counts(*counts)
+            return
 
-        if not new_icons:
-            label = QtWidgets.QLabel("饿啊！这还没树")
-            label.setStyleSheet("color: #888; font-size: 13px; font-style: italic;")
-            self.treeLayout.addWidget(label)
-        else:
-            for icon in new_icons:
-                label = QtWidgets.QLabel(icon)
-                if icon == "🌲":
-                    label.setStyleSheet("font-size: 32px; margin: 2px;")
-                elif icon == "🌳":
-                    label.setStyleSheet("font-size: 28px; margin: 2px;")
+        # 只增删数量变化的图标，布局顺序为：树苗、大树、巨型树
+        self.treeDisplay.setUpdatesEnabled(False)
+        has_empty = self.treeLayout.count() and self.treeLayout.itemAt(0).widget() is self.empty_label
+        offset = 1 if has_empty else 0
+        for tier, count in enumerate(counts):
+            labels = self._tier_labels[tier]
+            pool = self._tier_pools[tier]
+            while len(labels) > count:
+                label = labels.pop()
+                self.treeLayout.takeAt(offset + len(labels))
+                label.hide()
+                pool.append(label)
+            while len(labels) < count:
+                if pool:
+                    label = pool.pop()
                 else:
-                    label.setStyleSheet("font-size: 24px; margin: 2px;")
-                self.treeLayout.addWidget(label)
-
+                    label = QtWidgets.QLabel(TREE_TIERS[tier][0], self.treeDisplay)
+                    label.setStyleSheet(TIER_STYLES[tier])
+                # 先显示再加入布局，布局可以直接缓存它的尺寸
+                label.show()
+                self.treeLayout.insertWidget(offset + len(labels), label)
+                labels.append(label)
+            offset += count
+
+        if any(counts) and has_empty:
+            self.treeLayout.takeAt(0)
+            self.empty_label.hide()
+        elif not any(counts) and not has_empty:
+            self.empty_label.show()
+            self.treeLayout.insertWidget(0, self.empty_label)
+        self.treeDisplay.setUpdatesEnabled(True)
+
+    @timed("update_score_display")
     def update_score_display(self):
         """更新分数显示"""
         daily_score = self.tree_manager.get_daily_score()
@@ -854,24 +973,15 @@ class LoudnessMonitor(QtWidgets.QWidget):
         self.daily_score_label.setText(f"当日: {daily_score}")
         self.total_score_label.setText(f"总计: {total_score}")
 
-    def save_current_progress(self):
-        """保存所有进度"""
-        # 保存主进度
-        main_data = self.tree_manager.save_main_progress()
-        save_progress(main_data)
-
-        # 保存当日进度
-        daily_data = self.tree_manager.save_daily_progress()
-        save_daily_progress(daily_data)
-
     def open_settings(self):
-        dialog = SettingsDialog(self.tree_manager, self)
+        dialog = SettingsDialog(self.tree_manager, self, self.calibrator)
         if dialog.exec() == QtWidgets.QDialog.DialogCode.Accepted:
             self.save_current_progress()
             self.update_tree_display()
+            self.request_render()
 
     def show_leaderboard(self):
-        board = load_leaderboard()
+        board = self.store.top_scores(10)
         if not board:
             QtWidgets.QMessageBox.information(self, "排行榜", "还没有排行榜数据")
             return
@@ -890,7 +1000,7 @@ class LoudnessMonitor(QtWidgets.QWidget):
         """)
 
         msg = "🏆 近 期 排 行 榜 🏆\n\n"
-        for i, item in enumerate(board[:10], 1):
+        for i, item in enumerate(board, 1):
             try:
                 date_obj = datetime.datetime.strptime(item["date"], "%Y-%m-%d")
                 readable_date = date_obj.strftime("%m月%d日")
@@ -902,8 +1012,10 @@ class LoudnessMonitor(QtWidgets.QWidget):
             except:
                 msg += f"{i}. {item['date']} — {item['score']} 分\n"
 
-        if len(board) > 10:
-            msg += f"\n... 共 {len(board)} 条记录"
+        count = self.store.score_count()
+        if count > 10:
+            msg += f"\n... 共 {count} 条记录"
+        msg += class_leaderboard_text(self.uploader)
 
         msg_box.setText(msg)
         msg_box.exec()
@@ -926,6 +1038,7 @@ class LoudnessMonitor(QtWidgets.QWidget):
             self.tree_manager.daily_seedlings = 0
             self.tree_manager.daily_trees = 0
             self.tree_manager.daily_giants = 0
+            self.tree_manager.daily_focus_seconds = 0.0
 
             # 更新显示
             self.progressBar.setValue(0)
@@ -935,16 +1048,155 @@ class LoudnessMonitor(QtWidgets.QWidget):
 
             QtWidgets.QMessageBox.information(self, "提示", "当日进度已重置！")
 
-    def closeEvent(self, event):
-        # 关闭时提交当日分数
-        self.tree_manager.submit_daily_score()
-        self.save_current_progress()
-        self.timer.stop()
-        if hasattr(self.stream, 'stop') and callable(self.stream.stop):
-            self.stream.stop()
-        if hasattr(self.stream, 'close') and callable(self.stream.close):
-            self.stream.close()
-        event.accept()
+# ======================
+# 教室模式
+# ======================
+class SeatTile(QtWidgets.QFrame):
+    """教室模式里一个座位的卡片：座位名、音量、当日进度和三级树的数量"""
+    def __init__(self, name, parent=None):
+        super().__init__(parent)
+        self.setStyleSheet("SeatTile { background-color: #2d2d2d; border: 1px solid #444; border-radius: 8px; }")
+        layout = QtWidgets.QVBoxLayout(self)
+        layout.setContentsMargins(8, 6, 8, 6)
+        layout.setSpacing(4)
+        header = QtWidgets.QHBoxLayout()
+        name_label = QtWidgets.QLabel(name)
+        name_label.setStyleSheet("font-size: 13px; font-weight: bold; color: #4CAF50; background: transparent;")
+        self.loudness_label = QtWidgets.QLabel("--")
+        self.loudness_label.setStyleSheet("font-size: 12px; color: #aaa; background: transparent;")
+        header.addWidget(name_label)
+        header.addStretch()
+        header.addWidget(self.loudness_label)
+        layout.addLayout(header)
+
+        self.progressBar = QtWidgets.QProgressBar()
+        self.progressBar.setRange(0, 100)
+        self.progressBar.setTextVisible(False)
+        self.progressBar.setFixedHeight(10)
+        layout.addWidget(self.progressBar)
+
+        self.counts_label = QtWidgets.QLabel()
+        self.counts_label.setStyleSheet("font-size: 14px; background: transparent;")
+        layout.addWidget(self.counts_label)
+        self._shown_loudness = None
+        self._shown_counts = None
+
+    def show_seat(self, seat):
+        """只更新变化了的子控件"""
+        manager = seat.tree_manager
+        if seat.loudness is not None and seat.loudness != self._shown_loudness:
+            self._shown_loudness = seat.loudness
+            self.loudness_label.setText(str(seat.loudness))
+        progress = int(min(100, manager.daily_progress))
+        if progress != self.progressBar.value():
+            self.progressBar.setValue(progress)
+        if seat.trees_dirty:
+            seat.trees_dirty = False
+            counts = (manager.daily_seedlings, manager.daily_trees, manager.daily_giants)
+            if counts != self._shown_counts:
+                self._shown_counts = counts
+                self.counts_label.setText("  ".join(f"{icon}{count}" for (icon, _), count in zip(TREE_TIERS, counts)))
+
+class ClassroomWindow(MonitorWindow, ClassroomCore, QtWidgets.QWidget):
+    """教室模式：一个窗口里用网格显示所有座位
+
+    每个输入设备一个stream和一个多声道音量前端，所有座位的进度存在同一个数据库里（ClassroomCore，classroom.py）；
+    早读模式、阈值等设置对所有座位统一生效。
+    """
+    def __init__(self, seat_specs, front_end_options=None, low_power=False, aggregate=None):
+        QtWidgets.QWidget.__init__(self)
+        ClassroomCore.__init__(self, seat_specs, front_end_options, low_power, aggregate)
+        self.setWindowTitle(f"种 树 游 戏 · 教室（{len(seat_specs)}个座位）")
+        self.setStyleSheet(DARK_STYLE)
+
+        # ===== 顶部：日期、模式、设置和排行榜 =====
+        topLayout = QtWidgets.QHBoxLayout()
+        today = datetime.date.today()
+        date_label = QtWidgets.QLabel(f"{today.month}月{today.day}日")
+        date_label.setStyleSheet("font-size: 14px; font-weight: bold; color: #4CAF50;")
+        topLayout.addWidget(date_label)
+
+        self.morningCheckBox = QtWidgets.QCheckBox("早读模式")
+        self.morningCheckBox.stateChanged.connect(self.toggle_morning_mode)
+        self.morningCheckBox.setStyleSheet("font-size: 13px; font-weight: bold;")
+        topLayout.addWidget(self.morningCheckBox)
+
+        self.titleLabel = QtWidgets.QLabel("-- 正在加载 --")
+        self.titleLabel.setStyleSheet("font-size: 13px; color: #aaa;")
+        topLayout.addWidget(self.titleLabel)
+        topLayout.addStretch()
+
+        self.rankButton = QtWidgets.QPushButton("📊 排行榜")
+        self.rankButton.clicked.connect(self.show_leaderboard)
+        topLayout.addWidget(self.rankButton)
+        self.setButton = QtWidgets.QPushButton("⚙")
+        self.setButton.clicked.connect(self.open_settings)
+        topLayout.addWidget(self.setButton)
+
+        # ===== 座位网格 =====
+        grid = QtWidgets.QWidget()
+        gridLayout = QtWidgets.QGridLayout(grid)
+        gridLayout.setSpacing(6)
+        columns = max(1, math.ceil(math.sqrt(len(self.seats))))
+        self.tiles = []
+        for i, seat in enumerate(self.seats):
+            tile = SeatTile(seat.name)
+            gridLayout.addWidget(tile, i // columns, i % columns)
+            self.tiles.append(tile)
+        scroll = QtWidgets.QScrollArea()
+        scroll.setWidgetResizable(True)
+        scroll.setWidget(grid)
+
+        mainLayout = QtWidgets.QVBoxLayout(self)
+        mainLayout.addLayout(topLayout)
+        mainLayout.addWidget(scroll)
+        self.resize(min(1200, 160 * columns + 60), min(800, 90 * math.ceil(len(self.seats) / columns) + 90))
+
+        # ===== 启动 =====
+        self._shown_title = None
+        self.start_window((self.morningCheckBox, self.setButton, self.rankButton))
+
+    def render_frame(self):
+        manager = self.tree_manager
+        title = (manager.morning_mode, manager.threshold_high if manager.morning_mode else manager.threshold_low)
+        if title != self._shown_title:
+            self._shown_title = title
+            morning, threshold = title
+            self.titleLabel.setText(f"目标: {'>' if morning else '<'}{threshold} {'（早毒模式）' if morning else '（静以修身）'}")
+        # 每个座位自己记着有没有新树（Seat.trees_dirty）
+        self._trees_dirty = False
+        for seat, tile in zip(self.seats, self.tiles):
+            tile.show_seat(seat)
+
+    def open_settings(self):
+        """用第一个座位打开设置对话框，确定后把设置复制到所有座位"""
+        source = self.tree_manager
+        dialog = SettingsDialog(source, self)
+        if dialog.exec() == QtWidgets.QDialog.DialogCode.Accepted:
+            for seat in self.seats[1:]:
+                manager = seat.tree_manager
+                manager.threshold_low = source.threshold_low
+                manager.threshold_high = source.threshold_high
+                manager.growth_speed = source.growth_speed
+                manager.merge_count = source.merge_count
+            for seat in self.seats:
+                seat.trees_dirty = True
+            self.save_current_progress()
+            self.request_render()
+
+    def show_leaderboard(self):
+        board = self.store.top_scores(10)
+        if not board:
+            QtWidgets.QMessageBox.information(self, "排行榜", "还没有排行榜数据")
+            return
+        msg = "🏆 全 班 排 行 榜 🏆\n\n"
+        for i, item in enumerate(board, 1):
+            msg += f"{i}. {item['seat']}  {item['date']} — {item['score']} 分\n"
+        count = self.store.score_count()
+        if count > 10:
+            msg += f"\n... 共 {count} 条记录"
+        msg += class_leaderboard_text(self.uploader)
+        QtWidgets.QMessageBox.information(self, "排行榜", msg)
 
 # ======================
 # 启动
@@ -958,7 +1210,7 @@ if __name__ == "__main__":
 
     # 设置Qt应用ID（Wayland兼容）
     if platform.system() == "Linux":
-        os.environ["QT_QPA_PLATFORM"] = "xcb"  # 强制使用XCB，更好的兼容性
+        os.environ.setdefault("QT_QPA_PLATFORM", "xcb")  # 默认使用XCB，更好的兼容性（bench_startup.py会改用offscreen）
 
     app = QtWidgets.QApplication(sys.argv)
 
@@ -984,7 +1236,21 @@ if __name__ == "__main__":
     app.setApplicationName("PlanTree")
     app.setOrganizationName("imjumping")
 
-    window = LoudnessMonitor()
+    # 命令行参数见monitor.py
+    options = parse_options(sys.argv[1:])
+    apply_options(options)
+    if options["classroom"] is not None:
+        try:
+            seat_specs = parse_classroom_spec(options["classroom"])
+        except ValueError as e:
+            print(f"Invalid classroom: {e}")
+            sys.exit(2)
+        window = ClassroomWindow(seat_specs, options["front_end_options"], low_power=options["low_power"],
+                                 aggregate=options["aggregate"])
+    else:
+        window = LoudnessMonitor(forest_view=not options["label_forest"], **core_arguments(options))
+    if options["startup_probe"]:
+        StartupProbe(window)
     window.show()
 
     try:
@@ -1,38 +1,74 @@
 # -*- mode: python ; coding: utf-8 -*-
+# 生成两个可执行文件：
+#   main      窗口版（Windows上没有控制台，--stats、--startup-probe等打印的内容看不到）
+#   headless  无界面模式（python main.py --headless），带控制台，不打包Qt，状态和统计打印到终端
+import os
 
+# 程序只用到QtCore/QtGui/QtWidgets，其余Qt模块和用不到的库都不打包
+QT_EXCLUDES = [
+    'PySide6.' + module for module in (
+        'Qt3DAnimation', 'Qt3DCore', 'Qt3DExtras', 'Qt3DInput', 'Qt3DLogic', 'Qt3DRender',
+        'QtBluetooth', 'QtCharts', 'QtConcurrent', 'QtDataVisualization', 'QtDBus', 'QtDesigner',
+        'QtGraphs', 'QtHelp', 'QtHttpServer', 'QtLocation', 'QtMultimedia', 'QtMultimediaWidgets',
+        'QtNetwork', 'QtNetworkAuth', 'QtNfc', 'QtOpenGL', 'QtOpenGLWidgets', 'QtPdf', 'QtPdfWidgets',
+        'QtPositioning', 'QtPrintSupport', 'QtQml', 'QtQuick', 'QtQuick3D', 'QtQuickControls2',
+        'QtQuickWidgets', 'QtRemoteObjects', 'QtScxml', 'QtSensors', 'QtSerialBus', 'QtSerialPort',
+        'QtSpatialAudio', 'QtSql', 'QtStateMachine', 'QtSvg', 'QtSvgWidgets', 'QtTest', 'QtTextToSpeech',
+        'QtUiTools', 'QtWebChannel', 'QtWebEngineCore', 'QtWebEngineQuick', 'QtWebEngineWidgets',
+        'QtWebSockets', 'QtWebView', 'QtXml',
+    )
+]
+# unittest、pydoc不能排除：NumPy在部分路径上（如numpy.testing）会延迟导入它们
+OTHER_EXCLUDES = [
+    'tkinter', 'doctest',
+    'numpy.f2py', 'numpy.distutils',
+    'matplotlib', 'scipy', 'pandas', 'IPython',
+]
 
-a = Analysis(
-    ['main.py'],
-    pathex=[],
-    binaries=[],
-    datas=[],
-    hiddenimports=[],
-    hookspath=[],
-    hooksconfig={},
-    runtime_hooks=[],
-    excludes=[],
-    noarchive=False,
-    optimize=0,
-)
-pyz = PYZ(a.pure)
 
-exe = EXE(
-    pyz,
-    a.scripts,
-    a.binaries,
-    a.datas,
-    [],
-    name='main',
-    debug=False,
-    bootloader_ignore_signals=False,
-    strip=False,
-    upx=True,
-    upx_exclude=[],
-    runtime_tmpdir=None,
-    console=False,
-    disable_windowed_traceback=False,
-    argv_emulation=False,
-    target_arch=None,
-    codesign_identity=None,
-    entitlements_file=None,
-)
+def build(script, name, excludes, console):
+    a = Analysis(
+        [script],
+        pathex=[],
+        binaries=[],
+        datas=[],
+        hiddenimports=[],
+        hookspath=[],
+        hooksconfig={},
+        runtime_hooks=[],
+        excludes=excludes,
+        noarchive=False,
+        optimize=1,  # 去掉assert；不用2，NumPy和PySide6的部分功能依赖docstring
+    )
+    pyz = PYZ(a.pure)
+    return EXE(
+        pyz,
+        a.scripts,
+        a.binaries,
+        a.datas,
+        [],
+        name=name,
+        debug=False,
+        bootloader_ignore_signals=False,
+        strip=False,
+        upx=True,
+        upx_exclude=[],
+        runtime_tmpdir=None,
+        console=console,
+        disable_windowed_traceback=False,
+        argv_emulation=False,
+        target_arch=None,
+        codesign_identity=None,
+        entitlements_file=None,
+    )
+
+
+executables = [
+    build('main.py', 'main', QT_EXCLUDES + OTHER_EXCLUDES, console=False),
+    build('headless.py', 'headless', ['PySide6'] + OTHER_EXCLUDES, console=True),
+]
+
+# 打包完成后报告体积，方便发现体积回退
+for exe in executables:
+    if os.path.exists(exe.name):
+        print(f"Bundle size: {os.path.getsize(exe.name) / 1024 / 1024:.1f} MB ({exe.name})")
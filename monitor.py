@@ -0,0 +1,321 @@
+'''
+Apache license 2.0
+Version 2.0, January 2004
+Read https://www.apache.org/licenses/LICENSE-2.0
+Full License is in /LICENCE file
+'''
+# 单人模式的种树核心（不依赖Qt）和两种前端共用的命令行参数
+#
+# MonitorCore负责进度、阈值校准、采集配置、多实例同步、自动保存和退出；窗口版LoudnessMonitor（main.py）
+# 和无界面的HeadlessMonitor（headless.py）都继承它，只负责各自的显示和事件循环（Qt信号 / asyncio）。
+# 教室模式的ClassroomCore（classroom.py）也继承它，只重写按座位载入、采集、推进和保存的几个方法。
+#
+# 命令行参数（--key=value形式）：
+#   --weighting=a|speech|none   音量计权（默认不计权，与阈值的刻度一致）
+#   --dbfs                      音量显示为dBFS+100
+#   --smoothing=起,落           音量平滑时间常数（秒）
+#   --auto-calibrate            根据环境音量自动设置阈值
+#   --low-power                 一直使用省电采集配置（8 kHz、2048帧、int16），窗口版默认只在最小化时使用
+#   --sqlite                    使用SQLite存储（第一次运行时自动从JSON迁移）
+#   --record                    把每秒的音量记录到数据目录下的loudness/
+#   --aggregate=地址:端口       把分数推送到全班排行榜服务（aggregator.py），--client-id=名称 指定本机名称，
+#                               --aggregate-token=口令 与服务的--token相同
+#   --multi-instance            同一账户下同时运行多个实例时共享进度，只由一个实例写存档（shared.py）
+#   --stats                     开启热点路径耗时统计，退出时打印（窗口版运行中按F12显示浮层）
+#   --startup-probe             启动完成后打印时间和内存并直接退出（bench_startup.py）
+#   --headless                  无界面模式，不导入Qt，状态打印到标准输出（headless.py，在main.py开头处理）
+# 只有窗口版：
+#   --label-forest              使用每棵树一个QLabel的旧显示方式
+#   --classroom=座位描述        教室模式，一个窗口带多个座位（格式见classroom.py）
+# 只有无界面模式：
+#   --morning                   早读模式（窗口版里是复选框）
+#   --status-interval=秒        状态输出间隔（默认10秒，0表示不输出）
+import os
+import time
+from storage import APPDATA_PATH, BackgroundSaver, ProgressJournal, SqliteStore, share_leaderboard
+from tree_manager import SimClock, TreeManager
+from calibration import AutoCalibrator
+from perf import record_wake_latency, stats as perf_stats, timed
+# audio / dsp / recorder 依赖NumPy和PortAudio，在后台线程里导入
+
+AUTOSAVE_INTERVAL = 1.0   # 自动保存间隔（秒），只是在日志末尾追加一条记录
+STATUS_INTERVAL = 10.0    # 无界面模式默认的状态输出间隔（秒）
+
+# ======================
+# 单人模式核心
+# ======================
+class MonitorCore:
+    """一个麦克风、一份进度的种树进程：模拟步、自动保存、分数提交和退出时的清理
+
+    启动分两步：load_progress / load_audio在后台线程读取存档、导入音频库，
+    start_monitoring在前端的线程里载入进度并打开麦克风。之后每次音频线程唤醒前端时调用process_audio。
+    单人模式和教室模式不同的部分集中在tree_managers、load_saved、open_capture、close_capture、
+    advance和save_current_progress里。
+    """
+    def __init__(self, store=None, front_end_options=None, auto_calibrate=False, low_power=False,
+                 record=False, aggregate=None, multi_instance=False):
+        # 存储后端：默认是JSON文件+进度日志，写入都在后台线程进行
+        self.store = BackgroundSaver(store if store is not None else ProgressJournal())
+        self.tree_manager = TreeManager(self.store)
+        self.sim_clock = SimClock()
+        self.current_loudness = None  # 收到第一个音频block之前不显示音量
+        # 按音频时间每AUTOSAVE_INTERVAL秒保存一次；前端自己定时保存时设为False
+        self.autosave_with_audio = True
+        self._save_elapsed = AUTOSAVE_INTERVAL  # 启动后第一次更新即保存
+        # 可选的每秒音量记录，在前端的线程里汇总，不占用音频线程
+        self.record = record
+        self.recorder = None
+        self._wall_offset = time.time() - time.monotonic()
+        # 一直在估计环境音量，开启自动校准时据此调整阈值
+        self.calibrator = AutoCalibrator()
+        self.calibrator.enabled = auto_calibrate
+        # 音量前端的参数（计权、dBFS、平滑），切换采集配置时用同样的参数重建
+        self.front_end_options = front_end_options or {}
+        # 平时使用的采集配置；窗口版最小化时临时切换到省电配置
+        self.preferred_profile = "low_power" if low_power else "standard"
+        self.capture_profile = None
+        self.stream = None
+        self.ring = None
+        self.notify = None  # 音频线程有新block时调用，用来唤醒前端
+        # 可选的全班排行榜：("地址:端口", 本机名称, 口令)，客户端在后台线程创建
+        self.aggregate = aggregate
+        self.uploader = None
+        # 多实例模式：和同一账户下的其他实例共享进度（shared.py），在后台线程登记
+        self.multi_instance = multi_instance
+        self.shared = None
+
+    def load_progress(self):
+        """后台线程：登记多实例、读取进度、启动全班排行榜客户端，返回(主进度, 当日进度)"""
+        if self.multi_instance:
+            from shared import attach_store
+            self.shared = attach_store(self.store, APPDATA_PATH)
+        try:
+            if self.shared is None or self.shared.is_writer():
+                saved = self.store.load()
+            else:
+                # 别的实例是写入者：进度从共享段取，存档等接替写入者时再打开
+                self.store.start()
+                saved = ({}, {})
+        except Exception as e:
+            print(f"Loading progress failed: {e}")
+            saved = ({}, {})
+        if self.aggregate is not None:
+            from aggregator import start_uploader
+            self.uploader = start_uploader(self.store, self.aggregate)
+        return saved
+
+    @staticmethod
+    def load_audio():
+        """后台线程：导入NumPy和音频库（初始化PortAudio）"""
+        import audio
+        try:
+            audio.load_sounddevice()
+        except Exception as e:
+            print(f"Audio initialization error: {e}")
+
+    def start_monitoring(self, main_saved, daily_saved, notify, profile=None):
+        """载入进度并打开麦克风；notify在音频线程有新block时调用，用来唤醒前端"""
+        self.load_saved(main_saved, daily_saved)
+        self.notify = notify
+        if self.record:
+            from recorder import LoudnessRecorder
+            self.recorder = LoudnessRecorder(os.path.join(APPDATA_PATH, "loudness"))
+        self.set_capture_profile(profile or self.preferred_profile)
+
+    def set_capture_profile(self, profile):
+        """不重启程序切换采集配置（采样率、block大小、样本类型）"""
+        if profile == self.capture_profile:
+            return
+        if self.capture_profile is not None:
+            self.close_capture()
+            self.process_audio()  # 旧的流停止前到达的block
+        try:
+            self.open_capture(profile)
+        except ValueError as e:
+            print(f"Audio front end setup failed: {e}")
+            self.front_end_options.pop("weighting", None)
+            self.close_capture()  # 教室模式可能已经打开了一部分设备
+            self.open_capture(profile)
+        self.capture_profile = profile
+        self.sim_clock.reset()  # 从新的流开始计时，重启的间隔不算生长时间
+
+    @timed("process_audio")
+    def process_audio(self):
+        """模拟步：推进进度（advance），按音频时间每AUTOSAVE_INTERVAL秒保存一次
+
+        返回是否长出了新树（包括别的实例同步来的）。
+        """
+        changed, elapsed = self.advance()
+        if self.autosave_with_audio:
+            self._save_elapsed += elapsed
+            if self._save_elapsed >= AUTOSAVE_INTERVAL:
+                self._save_elapsed = 0.0
+                self.save_current_progress()
+        return changed
+
+    # ===== 单人模式和教室模式不同的部分，教室模式（classroom.py的ClassroomCore）按座位重写 =====
+    def tree_managers(self):
+        """所有的TreeManager（每个座位一个），提交分数、切换早读模式时逐个处理"""
+        return [self.tree_manager]
+
+    def load_saved(self, main_saved, daily_saved):
+        """载入load_progress读到的进度"""
+        self.tree_manager.load_from_data(main_saved, daily_saved)
+        if self.shared is not None:
+            self.shared.join(self.tree_manager)
+
+    def open_capture(self, profile):
+        """按采集配置打开麦克风；计权不支持该采样率时抛出ValueError，由set_capture_profile去掉计权重试"""
+        from audio import CAPTURE_PROFILES, loudness_ring, start_microphone_monitor
+        from dsp import LoudnessFrontEnd
+        samplerate, blocksize, _ = CAPTURE_PROFILES[profile]
+        self.calibrator.set_block_duration(blocksize / samplerate)  # 校准窗口按时间计
+        front_end = LoudnessFrontEnd(samplerate, blocksize, **self.front_end_options)
+        if self.ring is None:
+            self.ring = loudness_ring
+            self.ring.drain()  # 丢掉上次运行残留的数据
+        self.ring.notify = self.notify
+        self.stream = start_microphone_monitor(front_end, profile)
+
+    def close_capture(self):
+        """关闭麦克风，没有打开时什么都不做"""
+        from audio import stop_microphone_monitor
+        if self.stream is None:
+            return
+        self.ring.notify = None
+        stop_microphone_monitor(self.stream)
+        self.stream = None
+
+    def advance(self):
+        """取走两次唤醒之间到达的所有block，每个block按各自的到达时间积分
+
+        返回(是否长出了新树, 模拟经过的秒数)。
+        """
+        values, stamps = self.ring.drain()
+        if len(values) == 0:
+            return False, 0.0
+        if perf_stats.enabled:
+            record_wake_latency(float(stamps[0]))
+        self.calibrator.add(values.tolist())
+        self.calibrator.apply(self.tree_manager)
+
+        changed = False
+        elapsed = 0.0
+        for loudness, stamp in zip(values.tolist(), stamps.tolist()):
+            dt = self.sim_clock.tick(stamp)
+            elapsed += dt
+            if self.tree_manager.update(loudness, dt):
+                changed = True
+        self.current_loudness = int(values[-1])
+        if self.shared is not None and self.shared.sync(self.tree_manager):
+            changed = True  # 别的实例长了树
+        if self.recorder is not None:
+            self.recorder.add(values, stamps + self._wall_offset, self.tree_manager.growing_mask(values))
+        return changed, elapsed
+
+    @timed("save_current_progress")
+    def save_current_progress(self):
+        """把进度交给后台保存（没有变化时跳过），当天的分数同时交给全班排行榜客户端"""
+        if self.shared is not None:
+            self.shared.sync(self.tree_manager, focus=True)  # 专注时间只在保存时合并
+        main_data = self.tree_manager.save_main_progress()
+        daily_data = self.tree_manager.save_daily_progress()
+        self.store.save(main_data, daily_data, self.tree_manager.generation)
+        if self.uploader is not None:
+            # 客户端只发送有变化的部分
+            self.uploader.submit(daily_data["date"], daily_data["score"])
+
+    def shutdown(self):
+        """退出时：提交当日分数、保存进度，关闭存储、共享段、排行榜客户端、音量记录和麦克风"""
+        if self.shared is not None:
+            self.shared.sync(self.tree_manager)
+        for manager in self.tree_managers():
+            manager.submit_daily_score()
+        self.save_current_progress()
+        self.store.close()  # 等待后台写完，有超时
+        if self.shared is not None:
+            self.shared.close()  # 放开写入者锁，由别的实例接替
+        if self.uploader is not None:
+            self.uploader.close()
+        if self.recorder is not None:
+            self.recorder.close()
+        self.close_capture()
+
+def print_run_report(*lines):
+    """退出时打印每种采集配置下音频回调的耗时、前端自己的统计行和热点路径统计"""
+    from audio import capture_stats
+    for profile, (calls, cpu_us, wall_us, load) in capture_stats.report().items():
+        print(f"Capture {profile}: {calls} callbacks, {cpu_us:.0f} us CPU / {wall_us:.0f} us wall "
+              f"per callback, {load:.3%} of audio time")
+    for line in lines:
+        print(line)
+    if perf_stats.enabled or perf_stats.counters:
+        print(perf_stats.report())
+
+# ======================
+# 命令行
+# ======================
+def parse_options(argv):
+    """解析命令行参数（说明见文件开头），返回dict；无效的值打印提示后使用默认值"""
+    weighting = "none"
+    attack = release = 0.0
+    aggregate = None
+    client_id = None
+    aggregate_token = None
+    classroom = None
+    status_interval = STATUS_INTERVAL
+    for arg in argv:
+        if arg.startswith("--weighting="):
+            weighting = arg.split("=", 1)[1].lower()
+        elif arg.startswith("--smoothing="):
+            try:
+                attack, release = (float(v) for v in arg.split("=", 1)[1].split(","))
+            except ValueError:
+                print(f"Invalid smoothing: {arg}")
+        elif arg.startswith("--classroom="):
+            classroom = arg.split("=", 1)[1]
+        elif arg.startswith("--aggregate="):
+            aggregate = arg.split("=", 1)[1]
+        elif arg.startswith("--client-id="):
+            client_id = arg.split("=", 1)[1]
+        elif arg.startswith("--aggregate-token="):
+            aggregate_token = arg.split("=", 1)[1]
+        elif arg.startswith("--status-interval="):
+            try:
+                status_interval = float(arg.split("=", 1)[1])
+            except ValueError:
+                print(f"Invalid status interval: {arg}")
+    return {
+        "front_end_options": dict(weighting=weighting, dbfs="--dbfs" in argv, attack=attack, release=release),
+        "aggregate": None if aggregate is None else (aggregate, client_id, aggregate_token),
+        "classroom": classroom,
+        "status_interval": status_interval,
+        "sqlite": "--sqlite" in argv,
+        "record": "--record" in argv,
+        "auto_calibrate": "--auto-calibrate" in argv,
+        "low_power": "--low-power" in argv,
+        "multi_instance": "--multi-instance" in argv,
+        "stats": "--stats" in argv,
+        "startup_probe": "--startup-probe" in argv,
+        "label_forest": "--label-forest" in argv,
+        "morning": "--morning" in argv,
+    }
+
+def apply_options(options):
+    """设置进程范围的状态（热点统计、多实例共用的排行榜）；--multi-instance不能和教室模式、--sqlite一起用"""
+    perf_stats.enabled = options["stats"]
+    if options["multi_instance"] and (options["classroom"] is not None or options["sqlite"]):
+        print("--multi-instance works with the default JSON storage only, ignoring it")
+        options["multi_instance"] = False
+    if options["multi_instance"]:
+        share_leaderboard()
+
+def core_arguments(options):
+    """按参数创建MonitorCore的构造参数（--sqlite时打开数据库）"""
+    return dict(store=SqliteStore() if options["sqlite"] else None,
+                front_end_options=options["front_end_options"],
+                auto_calibrate=options["auto_calibrate"],
+                low_power=options["low_power"],
+                record=options["record"],
+                aggregate=options["aggregate"],
+                multi_instance=options["multi_instance"])
@@ -0,0 +1,129 @@
+'''
+Apache license 2.0
+Version 2.0, January 2004
+Read https://www.apache.org/licenses/LICENSE-2.0
+Full License is in /LICENCE file
+'''
+# 热点路径的耗时统计：固定分桶的延迟直方图和事件计数，默认关闭
+#
+# 关闭时被@timed包装的方法只多一次函数调用和一次属性判断；直方图只在开启时记录。
+# 计数器（音频xrun等）对应的是很少发生的事件，一直记录。
+import sys
+import time
+import bisect
+import functools
+import threading
+
+# 直方图的桶上界（秒）：10 us ~ 1 s，最后一个桶放更慢的
+BUCKET_EDGES = (
+    10e-6, 20e-6, 50e-6, 100e-6, 200e-6, 500e-6,
+    1e-3, 2e-3, 5e-3, 10e-3, 20e-3, 50e-3,
+    100e-3, 200e-3, 500e-3, 1.0,
+)
+LATE_WAKEUP = 0.1  # 音频block到达后超过这么久才被界面线程处理，计为一次迟到
+
+class LatencyHistogram:
+    """固定分桶的延迟直方图：记录是O(log 桶数)，内存固定，分位数精确到桶的上界"""
+    def __init__(self, edges=BUCKET_EDGES):
+        self.edges = edges
+        self.counts = [0] * (len(edges) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.counts[bisect.bisect_left(self.edges, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, p):
+        """第p（0~1）分位数所在桶的上界（不超过最大值）"""
+        if self.count == 0:
+            return 0.0
+        rank = p * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(self.edges[i], self.max) if i < len(self.edges) else self.max
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+class PerfStats:
+    """按名称保存直方图和计数器；直方图可以在任何线程记录（依靠GIL，统计用途不加锁）"""
+    def __init__(self):
+        self.enabled = False
+        self.histograms = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(name, LatencyHistogram())
+        histogram.record(seconds)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+            self.counters = {}
+
+    def report(self):
+        """返回多行文本：每个热点路径的调用次数、平均值、p50、p99和最大值，以及各计数器"""
+        lines = [f"{'hot path':<22}{'calls':>8}{'mean':>10}{'p50<=':>10}{'p99<=':>10}{'max':>10}"]
+        for name, h in sorted(self.histograms.items()):
+            lines.append(f"{name:<22}{h.count:>8}{format_seconds(h.mean()):>10}"
+                         f"{format_seconds(h.percentile(0.5)):>10}{format_seconds(h.percentile(0.99)):>10}"
+                         f"{format_seconds(h.max):>10}")
+        if self.counters:
+            lines.append("counters: " + ", ".join(f"{name} {value}" for name, value in sorted(self.counters.items())))
+        return "\n".join(lines)
+
+def format_seconds(seconds):
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.0f} us"
+    if seconds < 1.0:
+        return f"{seconds * 1e3:.1f} ms"
+    return f"{seconds:.2f} s"
+
+# 进程内共用的统计
+stats = PerfStats()
+
+def record_wake_latency(stamp):
+    """记录音频block从到达（time.monotonic()时间戳）到被界面线程处理的延迟，超过LATE_WAKEUP计为迟到"""
+    latency = time.monotonic() - stamp
+    stats.record("wake_latency", latency)
+    if latency > LATE_WAKEUP:
+        stats.count("late_wakeups")
+
+def peak_rss():
+    """进程的峰值常驻内存（字节），没有resource模块（Windows）时返回None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024  # Linux上单位是KB
+
+def timed(name):
+    """装饰器：开启统计时把每次调用的耗时记入名为name的直方图"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not stats.enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stats.record(name, time.perf_counter() - start)
+        return wrapper
+    return decorate
@@ -0,0 +1,161 @@
+'''
+Apache license 2.0
+Version 2.0, January 2004
+Read https://www.apache.org/licenses/LICENSE-2.0
+Full License is in /LICENCE file
+'''
+# 每秒音量记录：每天一个内存映射的定长记录文件，按当天的第几秒直接定位
+import os
+import time
+import datetime
+from pathlib import Path
+import numpy as np
+
+# 一天最多25小时（夏令时切换的那天）
+DAY_CAPACITY = 25 * 3600
+
+LOUDNESS_RECORD = np.dtype([
+    ('blocks', '<u2'),    # 这一秒内的音频block数，0表示没有数据
+    ('growing', '<u2'),   # 其中处于生长状态的block数
+    ('min', '<f4'),
+    ('mean', '<f4'),
+    ('max', '<f4'),
+])
+
+def day_file(directory, date):
+    return os.path.join(directory, f"loudness-{date.isoformat()}.bin")
+
+def open_day(directory, date):
+    """以只读内存映射打开某一天的记录（下标是当天0点起的秒数），文件不存在时返回None
+
+    返回的数组和各列（records['mean']等）都是文件的视图，不复制数据。
+    """
+    path = day_file(directory, date)
+    if not os.path.exists(path):
+        return None
+    return np.memmap(path, dtype=LOUDNESS_RECORD, mode='r', shape=(DAY_CAPACITY,))
+
+def replay_series(records):
+    """取出有数据的秒的平均音量，可直接交给TreeManager.update_batch(series, dt=1.0)回放"""
+    return records['mean'][records['blocks'] > 0]
+
+class LoudnessRecorder:
+    """把音频block的音量按秒汇总（最小/平均/最大、生长block数）写入当天的记录文件
+
+    add接收NumPy数组，用reduceat按秒分组，不为单个样本创建Python对象；
+    汇总好的秒先放在暂存数组里，攒够flush_every秒才批量写入内存映射。
+    """
+    def __init__(self, directory, flush_every=30):
+        self.directory = directory
+        self.flush_every = flush_every
+        self._staged = np.zeros(flush_every, dtype=LOUDNESS_RECORD)
+        self._staged_seconds = np.zeros(flush_every, dtype=np.int64)
+        self._staged_count = 0
+        self._date = None
+        self._day_start = 0.0
+        self._day_end = 0.0
+        self._records = None
+        # 当前还没结束的一秒：[秒, block数, 生长block数, 最小, 总和, 最大]
+        self._current = None
+
+    def add(self, values, stamps, growing):
+        """values：每个block的音量；stamps：对应的time.time()时间戳（递增）；growing：是否生长"""
+        if len(values) == 0:
+            return
+        values = np.asarray(values, dtype=np.float64)
+        stamps = np.asarray(stamps, dtype=np.float64)
+        growing = np.asarray(growing)
+
+        if self._date is None or stamps[0] >= self._day_end:
+            self._roll_over(stamps[0])
+        if stamps[-1] >= self._day_end:
+            # 跨过了0点，分成两段处理
+            split = int(np.searchsorted(stamps, self._day_end))
+            self.add(values[:split], stamps[:split], growing[:split])
+            self.add(values[split:], stamps[split:], growing[split:])
+            return
+
+        seconds = np.floor(stamps - self._day_start).astype(np.int64)
+        starts = np.flatnonzero(np.concatenate(([True], seconds[1:] != seconds[:-1])))
+        counts = np.diff(np.concatenate((starts, [len(values)])))
+        mins = np.minimum.reduceat(values, starts)
+        maxs = np.maximum.reduceat(values, starts)
+        sums = np.add.reduceat(values, starts)
+        grows = np.add.reduceat(growing.astype(np.int64), starts)
+        secs = seconds[starts]
+
+        first = 0
+        if self._current is not None and self._current[0] == secs[0]:
+            # 和上一批的最后一秒是同一秒，合并
+            current = self._current
+            current[1] += int(counts[0])
+            current[2] += int(grows[0])
+            current[3] = min(current[3], float(mins[0]))
+            current[4] += float(sums[0])
+            current[5] = max(current[5], float(maxs[0]))
+            first = 1
+        if len(secs) > first:
+            if self._current is not None:
+                self._stage_current()
+            last = len(secs) - 1
+            # 中间的秒已经完整，最后一秒可能还会有数据
+            self._stage(secs[first:last], counts[first:last], grows[first:last],
+                        mins[first:last], sums[first:last], maxs[first:last])
+            self._current = [int(secs[last]), int(counts[last]), int(grows[last]),
+                             float(mins[last]), float(sums[last]), float(maxs[last])]
+
+    def flush(self):
+        """把暂存的秒写入文件（未结束的一秒也一并写入）"""
+        if self._current is not None:
+            self._stage_current()
+            self._current = None
+        self._flush_staged()
+        if self._records is not None:
+            self._records.flush()
+
+    def close(self):
+        self.flush()
+        self._records = None
+
+    def _stage_current(self):
+        second, blocks, grows, low, total, high = self._current
+        self._stage(np.array([second]), np.array([blocks]), np.array([grows]),
+                    np.array([low]), np.array([total]), np.array([high]))
+
+    def _stage(self, secs, counts, grows, mins, sums, maxs):
+        offset = 0
+        while offset < len(secs):
+            n = min(len(secs) - offset, self.flush_every - self._staged_count)
+            dst = slice(self._staged_count, self._staged_count + n)
+            src = slice(offset, offset + n)
+            self._staged_seconds[dst] = secs[src]
+            staged = self._staged[dst]
+            staged['blocks'] = np.minimum(counts[src], 0xFFFF)
+            staged['growing'] = np.minimum(grows[src], 0xFFFF)
+            staged['min'] = mins[src]
+            staged['mean'] = sums[src] / counts[src]
+            staged['max'] = maxs[src]
+            self._staged_count += n
+            offset += n
+            if self._staged_count == self.flush_every:
+                self._flush_staged()
+
+    def _flush_staged(self):
+        if self._staged_count and self._records is not None:
+            count = self._staged_count
+            self._records[self._staged_seconds[:count]] = self._staged[:count]
+        self._staged_count = 0
+
+    def _roll_over(self, stamp):
+        """切换到stamp所在那天的文件"""
+        if self._records is not None:
+            self.flush()
+        date = datetime.date.fromtimestamp(stamp)
+        self._date = date
+        self._day_start = time.mktime(date.timetuple())
+        self._day_end = time.mktime((date + datetime.timedelta(days=1)).timetuple())
+
+        Path(self.directory).mkdir(parents=True, exist_ok=True)
+        path = day_file(self.directory, date)
+        mode = 'r+' if os.path.exists(path) else 'w+'
+        self._records = np.memmap(path, dtype=LOUDNESS_RECORD, mode=mode, shape=(DAY_CAPACITY,))
@@ -0,0 +1,277 @@
+'''
+Apache license 2.0
+Version 2.0, January 2004
+Read https://www.apache.org/licenses/LICENSE-2.0
+Full License is in /LICENCE file
+'''
+# 多实例模式（--multi-instance）：同一个账户下同时运行多个PlanTree时共享进度
+#
+#   instances.lock  每个实例持有共享锁；拿得到独占锁说明没有别的实例在运行，由它用存档初始化共享段
+#   shared_state    mmap共享内存段：当日/总分数（折算成树苗）、当日专注秒数、合并数量和修改序号，
+#                   每个实例把自己新长的树苗加进去，序号变了就同步回来，不需要重新读JSON；
+#                   专注时间每个block都在变，只在保存和退出时合并，不改修改序号
+#   writer.lock     选出唯一的写入者，只有它写进度存档；它退出后由下一个要保存的实例接替
+#
+# 都是建议锁（fcntl.flock），只在POSIX上可用。等待和持有的时间记入perf统计，需要等待时计一次争用。
+import os
+import mmap
+import time
+import struct
+import datetime
+import threading
+from perf import stats as perf_stats
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# ======================
+# 文件锁
+# ======================
+class FileLock:
+    """基于fcntl.flock的建议锁，同一进程内的线程之间再用threading.Lock互斥
+
+    with语句用于短暂的临界区，等待和持有时间记入lock_wait/name、lock_hold/name两个直方图；
+    acquire/release用于整个进程生命周期都持有的锁（实例锁、写入者锁），不经过线程锁。
+    需要等待别的进程时计数lock_contended/name。没有fcntl时只有进程内互斥。
+    """
+    def __init__(self, path, name):
+        self.path = path
+        self.name = name
+        self._fd = None
+        self._thread_lock = threading.Lock()
+        self._acquired_at = 0.0
+
+    def _open(self):
+        if self._fd is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        return self._fd
+
+    def acquire(self, exclusive=True, blocking=True):
+        """加锁（已持有时转换为独占/共享），返回是否成功；blocking为False且被别的进程占着时返回False"""
+        if fcntl is None:
+            return True
+        fd = self._open()
+        mode = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+        try:
+            fcntl.flock(fd, mode | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            if not blocking:
+                return False
+        perf_stats.count(f"lock_contended/{self.name}")
+        fcntl.flock(fd, mode)
+        return True
+
+    def release(self):
+        if fcntl is not None and self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)  # 同时释放flock
+            self._fd = None
+
+    def __enter__(self):
+        start = time.perf_counter()
+        self._thread_lock.acquire()
+        try:
+            self.acquire()
+        except BaseException:
+            self._thread_lock.release()
+            raise
+        self._acquired_at = time.perf_counter()
+        if perf_stats.enabled:
+            perf_stats.record(f"lock_wait/{self.name}", self._acquired_at - start)
+        return self
+
+    def __exit__(self, *exc):
+        held = time.perf_counter() - self._acquired_at
+        self.release()
+        self._thread_lock.release()
+        if perf_stats.enabled:
+            perf_stats.record(f"lock_hold/{self.name}", held)
+
+# ======================
+# 共享状态
+# ======================
+# 魔数、合并数量、修改序号、当日分数、总分数、当日专注秒数
+_SEGMENT = struct.Struct('<4sIQqqd')
+_SEQ = struct.Struct('<Q')
+_SEQ_OFFSET = 8
+_MAGIC = b"PTS2"
+# 之后是等待写入者提交的分数：(日期序号, 分数)，日期序号为0表示空位
+_SCORE = struct.Struct('<Iq')
+SCORE_SLOTS = 8
+_SIZE = _SEGMENT.size + SCORE_SLOTS * _SCORE.size
+
+class SharedState:
+    """多实例模式的共享状态：实例登记、共享内存段和写入者选举
+
+    共享段里的分数是int64；同步只在修改序号变化或本实例长了树、改了设置时加锁。
+    """
+    def __init__(self, directory):
+        self.path = os.path.join(directory, "shared_state")
+        self.lock = FileLock(self.path + ".lock", "state")
+        self.instances = FileLock(os.path.join(directory, "instances.lock"), "instances")
+        self.writer = FileLock(os.path.join(directory, "writer.lock"), "writer")
+        self.on_score = None     # 写入者收到别的实例交来的分数时调用：on_score(日期, 分数)
+        self._map = None
+        self._file = None
+        self._alone = False
+        self._writer = False
+        self._seq = None
+        self._seen = None        # 上次同步时共享段的(当日分数, 总分数, 合并数量)
+        self._focus_seen = 0.0   # 上次合并专注时间时共享段的专注秒数
+
+    @staticmethod
+    def available():
+        return fcntl is not None
+
+    def attach(self):
+        """登记本实例并映射共享段，返回是否是唯一运行的实例
+
+        第一个实例在join之前一直持有独占的实例锁，后来的实例在这里等它用存档初始化完共享段。
+        """
+        self._alone = self.instances.acquire(blocking=False)
+        if not self._alone:
+            self.instances.acquire(exclusive=False)
+        self._file = open(self.path, 'a+b')
+        if os.path.getsize(self.path) < _SIZE:
+            self._file.truncate(_SIZE)
+        self._map = mmap.mmap(self._file.fileno(), _SIZE)
+        self.is_writer()
+        return self._alone
+
+    def join(self, manager):
+        """载入存档之后调用：第一个实例把自己的进度写进共享段，其余实例采用共享段里的进度"""
+        local = self._local(manager)
+        focus = manager.daily_focus_seconds
+        with self.lock:
+            magic, _, seq = _SEGMENT.unpack_from(self._map)[:3]
+            if self._alone or magic != _MAGIC:
+                if magic != _MAGIC:
+                    self._map[:] = bytes(_SIZE)
+                # 上次运行留下的待提交分数保留下来，由写入者在下面的sync里提交
+                daily, total, merge = local
+                self._write(seq + 1, daily, total, focus, merge)
+            else:
+                focus = 0.0  # 采用共享段里的专注时间，本实例还没有贡献
+        if self._alone:
+            self.instances.acquire(exclusive=False)  # 降级为共享锁，放行后来的实例
+        self._seen = local
+        self._focus_seen = focus
+        manager.daily_focus_seconds = focus
+        self._seq = None  # 强制同步一次
+        self.sync(manager, focus=True)
+
+    def is_writer(self):
+        """是否是写入者；原来的写入者退出后，第一个来问的实例接替"""
+        if not self._writer:
+            self._writer = self.writer.acquire(blocking=False)
+        return self._writer
+
+    def sync(self, manager, focus=False):
+        """把本实例自上次同步以来的新进度加进共享段，再采用共享段的结果；返回是否带回了别的实例的进度
+
+        focus为True时（保存、退出时）同时合并专注时间。只有专注时间变化时不加锁、不改修改序号，
+        否则生长中的实例每个block都要加锁，别的实例也要跟着同步。
+        """
+        local = self._local(manager)
+        if not focus and local == self._seen and _SEQ.unpack_from(self._map, _SEQ_OFFSET)[0] == self._seq:
+            return False
+        pending = []
+        with self.lock:
+            _, merge, seq, daily, total, shared_focus = _SEGMENT.unpack_from(self._map)
+            seen = self._seen
+            changed = local != seen
+            if changed:
+                daily = max(0, daily + local[0] - seen[0])
+                total = max(0, total + local[1] - seen[1])
+                if local[2] != seen[2]:
+                    merge = local[2]  # 本实例改了设置
+            if focus:
+                shared_focus = max(0.0, shared_focus + manager.daily_focus_seconds - self._focus_seen)
+            if self._writer:
+                pending = self._take_scores()
+                changed |= bool(pending)
+            if changed:
+                seq += 1
+            if changed or focus:
+                self._write(seq, daily, total, shared_focus, merge)
+            self._seq = seq
+        self._seen = (daily, total, merge)
+        if focus:
+            self._focus_seen = shared_focus
+            manager.daily_focus_seconds = shared_focus
+        if self.on_score is not None:
+            for date_str, score in pending:
+                self.on_score(date_str, score)
+        if self._seen == local:
+            return False
+        manager.merge_count = merge
+        manager.set_scores(daily, total)
+        return True
+
+    def submit_score(self, date_str, score):
+        """不是写入者时，把要提交的分数放进共享段，由写入者下次同步时提交（同一天只留最高分）"""
+        ordinal = datetime.date.fromisoformat(date_str).toordinal()
+        with self.lock:
+            slots = [_SCORE.unpack_from(self._map, _SEGMENT.size + i * _SCORE.size) for i in range(SCORE_SLOTS)]
+            dates = [date for date, _ in slots]
+            if ordinal in dates:
+                i = dates.index(ordinal)
+                if score <= slots[i][1]:
+                    return
+            elif 0 in dates:
+                i = dates.index(0)
+            else:
+                # 写入者很久没有同步（通常不会发生）：挤掉最低的分数
+                i = min(range(SCORE_SLOTS), key=lambda k: slots[k][1])
+                if score <= slots[i][1]:
+                    return
+                print(f"Dropping pending score of {datetime.date.fromordinal(slots[i][0])}: {slots[i][1]}")
+            _SCORE.pack_into(self._map, _SEGMENT.size + i * _SCORE.size, ordinal, score)
+            _SEQ.pack_into(self._map, _SEQ_OFFSET, _SEQ.unpack_from(self._map, _SEQ_OFFSET)[0] + 1)
+
+    def close(self):
+        """退出时调用（在存储关闭之后）：解除映射并关闭锁文件，写入者锁随之交给下一个实例"""
+        if self._map is not None:
+            self._map.close()
+            self._file.close()
+            self._map = None
+        for lock in (self.lock, self.writer, self.instances):
+            lock.close()
+
+    @staticmethod
+    def _local(manager):
+        return (manager.daily.score, manager.total.score, manager.merge_count)
+
+    def _write(self, seq, daily, total, focus, merge):
+        _SEGMENT.pack_into(self._map, 0, _MAGIC, merge, seq, daily, total, focus)
+
+    def _take_scores(self):
+        """取出并清空待提交的分数（持有self.lock时调用）"""
+        scores = []
+        for i in range(SCORE_SLOTS):
+            offset = _SEGMENT.size + i * _SCORE.size
+            ordinal, score = _SCORE.unpack_from(self._map, offset)
+            if ordinal:
+                scores.append((str(datetime.date.fromordinal(ordinal)), score))
+                _SCORE.pack_into(self._map, offset, 0, 0)
+        return scores
+
+def attach_store(store, directory):
+    """按--multi-instance登记本实例并参加写入者选举，挂到存储（BackgroundSaver）上；平台不支持时返回None
+
+    有别的实例正在启动时会等它初始化完共享段，应在后台线程调用。
+    """
+    if not SharedState.available():
+        print("Multi-instance mode needs POSIX file locks, running as a single instance")
+        return None
+    shared = SharedState(directory)
+    shared.attach()
+    shared.on_score = store.submit_score
+    store.writer = shared
+    return shared
@@ -0,0 +1,1041 @@
+'''
+Apache license 2.0
+Version 2.0, January 2004
+Read https://www.apache.org/licenses/LICENSE-2.0
+Full License is in /LICENCE file
+'''
+import os
+import json
+import zlib
+import sqlite3
+import struct
+import datetime
+import platform
+import bisect
+import time
+import threading
+import contextlib
+from pathlib import Path
+from perf import stats as perf_stats
+
+# ======================
+# POSIX兼容的数据路径处理
+# ======================
+def get_app_data_path(create=True):
+    """获取跨平台的应用数据目录；create为False时只计算路径，不访问文件系统"""
+    system = platform.system()
+
+    if system == "Windows":
+        # Windows: APPDATA
+        base_path = os.getenv('APPDATA', os.path.expanduser('~'))
+        app_data_path = os.path.join(base_path, "PlanTree")
+
+    elif system == "Linux":
+        # Linux: 遵循XDG规范
+        xdg_data_home = os.getenv('XDG_DATA_HOME')
+        if xdg_data_home:
+            base_path = xdg_data_home
+        else:
+            base_path = os.path.join(os.path.expanduser('~'), '.local', 'share')
+        app_data_path = os.path.join(base_path, "plantree")
+
+    elif system == "Darwin":  # macOS
+        base_path = os.path.join(os.path.expanduser('~'), 'Library', 'Application Support')
+        app_data_path = os.path.join(base_path, "PlanTree")
+
+    else:  # 其他Unix-like系统
+        base_path = os.path.expanduser('~')
+        app_data_path = os.path.join(base_path, ".plantree")
+
+    if not create:
+        return app_data_path
+
+    # 创建目录（递归创建）
+    Path(app_data_path).mkdir(parents=True, exist_ok=True)
+
+    # 设置适当的权限（仅限Unix-like系统）
+    if system != "Windows":
+        try:
+            os.chmod(app_data_path, 0o755)  # rwxr-xr-x
+        except:
+            pass
+
+    return app_data_path
+
+# 初始化数据路径（导入时不创建目录，第一次写入时各自创建，加快启动）
+APPDATA_PATH = get_app_data_path(create=False)
+SAVE_FILE = os.path.join(APPDATA_PATH, "progress.json")
+LEADERBOARD_FILE = os.path.join(APPDATA_PATH, "leaderboard.json")
+DAILY_PROGRESS_FILE = os.path.join(APPDATA_PATH, "daily_progress.json")
+JOURNAL_FILE = os.path.join(APPDATA_PATH, "progress.journal")
+DATABASE_FILE = os.path.join(APPDATA_PATH, "plantree.db")
+LEADERBOARD_HISTORY_FILE = os.path.join(APPDATA_PATH, "leaderboard_history.jsonl")
+LEADERBOARD_TOP = 30
+HISTORY_FILE = os.path.join(APPDATA_PATH, "history.bin")
+CLASSROOM_DATABASE_FILE = os.path.join(APPDATA_PATH, "classroom.db")
+
+def load_progress():
+    """加载主进度（永久积累）"""
+    try:
+        with open(SAVE_FILE, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+            # 向后兼容性检查
+            if "merge_count" not in data:
+                data["merge_count"] = 10
+            if "total_seedlings" not in data:
+                data["total_seedlings"] = 0
+            if "total_trees" not in data:
+                data["total_trees"] = 0
+            if "total_giants" not in data:
+                data["total_giants"] = 0
+
+            return data
+    except (FileNotFoundError, json.JSONDecodeError, IOError) as e:
+        print(f"Loading progress failed: {e}, using defaults")
+        return {
+            "total_seedlings": 0,
+            "total_trees": 0,
+            "total_giants": 0,
+            "merge_count": 10
+        }
+
+def save_progress(data):
+    """保存主进度"""
+    try:
+        # 确保目录存在
+        Path(APPDATA_PATH).mkdir(parents=True, exist_ok=True)
+
+        # 原子写入（使用临时文件）
+        temp_file = SAVE_FILE + '.tmp'
+        with open(temp_file, 'w', encoding='utf-8', errors='replace') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+        # POSIX兼容的原子重命名
+        os.replace(temp_file, SAVE_FILE)
+
+        # 设置适当的文件权限（仅限Unix-like系统）
+        if platform.system() != "Windows":
+            try:
+                os.chmod(SAVE_FILE, 0o644)  # rw-r--r--
+            except:
+                pass
+
+    except Exception as e:
+        print(f"Saving progress failed: {e}")
+
+def load_daily_progress():
+    """加载每日独立进度"""
+    today = str(datetime.date.today())
+
+    try:
+        with open(DAILY_PROGRESS_FILE, 'r', encoding='utf-8') as f:
+            all_data = json.load(f)
+
+            # 获取今天的数据，如果不存在则创建新的
+            if today in all_data:
+                return all_data[today]
+    except (FileNotFoundError, json.JSONDecodeError, IOError) as e:
+        print(f"Loading daily progress failed: {e}")
+
+    # 返回今天的初始数据
+    return {
+        "date": today,
+        "progress": 0.0,
+        "seedlings": 0,
+        "trees": 0,
+        "giants": 0
+    }
+
+def save_daily_progress(data, merge_count=10):
+    """保存每日进度；merge_count用于给没有score字段的旧记录计算归档分数"""
+    try:
+        today = str(datetime.date.today())
+        day = data.get("date", today)
+        all_data = {}
+
+        # 读取现有数据
+        try:
+            with open(DAILY_PROGRESS_FILE, 'r', encoding='utf-8') as f:
+                all_data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+
+        # 更新当天的数据
+        all_data[day] = data
+
+        # 已经结束的日子写入长期历史档案，再清理旧数据（保留最近7天）
+        today_date = datetime.date.today()
+        get_history_archive().append_days(all_data, before=today_date, merge_count=merge_count)
+        to_delete = []
+        for date_str in list(all_data.keys()):
+            try:
+                date_obj = datetime.datetime.strptime(date_str, "%Y-%m-%d").date()
+                if (today_date - date_obj).days > 7:
+                    to_delete.append(date_str)
+            except ValueError:
+                to_delete.append(date_str)
+
+        for key in to_delete:
+            all_data.pop(key, None)
+
+        # 确保目录存在
+        Path(APPDATA_PATH).mkdir(parents=True, exist_ok=True)
+
+        # 原子写入
+        temp_file = DAILY_PROGRESS_FILE + '.tmp'
+        with open(temp_file, 'w', encoding='utf-8', errors='replace') as f:
+            json.dump(all_data, f, ensure_ascii=False, indent=2)
+
+        os.replace(temp_file, DAILY_PROGRESS_FILE)
+
+        # 设置文件权限（仅限Unix-like系统）
+        if platform.system() != "Windows":
+            try:
+                os.chmod(DAILY_PROGRESS_FILE, 0o644)
+            except:
+                pass
+
+    except Exception as e:
+        print(f"Saving daily progress failed: {e}")
+
+_history_archive = None
+
+def get_history_archive():
+    """进程内共用的每日历史档案"""
+    global _history_archive
+    if _history_archive is None:
+        from history import HistoryArchive  # 用到NumPy，跨天归档时才导入
+        _history_archive = HistoryArchive(HISTORY_FILE)
+    return _history_archive
+
+def load_leaderboard():
+    try:
+        with open(LEADERBOARD_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError, IOError) as e:
+        print(f"Loading leaderboard failed: {e}")
+        return []
+
+def save_leaderboard(board):
+    try:
+        # 确保目录存在
+        Path(APPDATA_PATH).mkdir(parents=True, exist_ok=True)
+
+        # 原子写入
+        temp_file = LEADERBOARD_FILE + '.tmp'
+        with open(temp_file, 'w', encoding='utf-8', errors='replace') as f:
+            json.dump(board, f, ensure_ascii=False, indent=2)
+
+        os.replace(temp_file, LEADERBOARD_FILE)
+
+        # 设置文件权限
+        if platform.system() != "Windows":
+            try:
+                os.chmod(LEADERBOARD_FILE, 0o644)
+            except:
+                pass
+
+    except Exception as e:
+        print(f"Saving leaderboard failed: {e}")
+
+def bubble_sort_leaderboard(board):
+    n = len(board)
+    for i in range(n):
+        for j in range(0, n - i - 1):
+            if board[j]["score"] < board[j + 1]["score"]:
+                board[j], board[j + 1] = board[j + 1], board[j]
+    return board
+
+class Leaderboard:
+    """排行榜索引：日期->分数的字典加一个按分数从高到低保持有序的列表（bisect维护）
+
+    完整历史追加写入 leaderboard_history.jsonl，leaderboard.json 只保存前30名的视图。
+    每个进程只在第一次使用时读取一次；shared为True时（多实例模式）写入时加文件锁，
+    并且每次使用前读入别的进程追加的记录。
+    """
+    def __init__(self, history_file=LEADERBOARD_HISTORY_FILE, view_file=LEADERBOARD_FILE, top=LEADERBOARD_TOP,
+                 shared=False):
+        self.history_file = history_file
+        self.view_file = view_file
+        self.top_count = top
+        self._scores = {}    # 日期 -> 分数
+        self._ordered = []   # (-分数, 日期)，升序即分数从高到低
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._file_lock = None
+        self._offset = 0     # 历史文件已经读到的位置
+        self._inode = None
+        if shared:
+            from shared import FileLock
+            self._file_lock = FileLock(history_file + ".lock", "leaderboard")
+
+    def _load(self):
+        if self._loaded:
+            if self._file_lock is not None:
+                self._read_history(incremental=True)
+            return
+        self._loaded = True
+
+        lines = self._read_history(incremental=False)
+        if lines is None:
+            # 第一次运行：从旧的前30名排行榜导入
+            for item in load_leaderboard():
+                if item["score"] > self._scores.get(item["date"], item["score"] - 1):
+                    self._scores[item["date"]] = item["score"]
+            lines = -1
+
+        self._ordered = sorted((-score, date_str) for date_str, score in self._scores.items())
+        if lines < 0 or lines > 2 * len(self._scores) + 100:
+            self._rewrite_history()
+
+    def _read_history(self, incremental):
+        """读入历史文件里还没读过的完整行，返回行数；文件不存在时返回None
+
+        incremental为True时同时维护有序列表（读入别的进程追加的少量记录）。
+        文件被别的进程重写过时从头再读一遍，同一天只取最高分，重复读入没有影响。
+        """
+        try:
+            if incremental:
+                stat = os.stat(self.history_file)
+                if stat.st_ino == self._inode and stat.st_size == self._offset:
+                    return 0
+            with open(self.history_file, 'rb') as f:
+                stat = os.fstat(f.fileno())
+                if stat.st_ino != self._inode or stat.st_size < self._offset:
+                    self._inode, self._offset = stat.st_ino, 0
+                f.seek(self._offset)
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        except IOError as e:
+            print(f"Loading leaderboard history failed: {e}")
+            return 0
+
+        end = data.rfind(b"\n") + 1  # 写了一半的行留到下次
+        self._offset += end
+        lines = 0
+        for line in data[:end].splitlines():
+            lines += 1
+            try:
+                item = json.loads(line)
+                date_str, score = item["date"], item["score"]
+            except (ValueError, KeyError, TypeError):
+                continue
+            if incremental:
+                self._insert(date_str, score)
+            elif score > self._scores.get(date_str, score - 1):
+                self._scores[date_str] = score
+        return lines
+
+    def _rewrite_history(self):
+        try:
+            Path(os.path.dirname(self.history_file)).mkdir(parents=True, exist_ok=True)
+            temp_file = self.history_file + '.tmp'
+            with self._locked():
+                if self._file_lock is not None:
+                    self._read_history(incremental=True)  # 别的实例刚追加的记录
+                with open(temp_file, 'w', encoding='utf-8') as f:
+                    for date_str, score in self._scores.items():
+                        f.write(json.dumps({"date": date_str, "score": score}) + "\n")
+                os.replace(temp_file, self.history_file)
+                self._inode, self._offset = os.stat(self.history_file).st_ino, os.path.getsize(self.history_file)
+        except Exception as e:
+            print(f"Saving leaderboard history failed: {e}")
+
+    def _locked(self):
+        return self._file_lock if self._file_lock is not None else contextlib.nullcontext()
+
+    def _insert(self, date_str, score):
+        """同一天只保留最高分，返回新分数的名次；没有变化时返回None"""
+        old = self._scores.get(date_str)
+        if old is not None and score <= old:
+            return None
+        if old is not None:
+            del self._ordered[bisect.bisect_left(self._ordered, (-old, date_str))]
+        rank = bisect.bisect_left(self._ordered, (-score, date_str))
+        self._ordered.insert(rank, (-score, date_str))
+        self._scores[date_str] = score
+        return rank
+
+    def submit(self, date_str, score):
+        """同一天只保留最高分，返回是否有变化"""
+        with self._lock:
+            self._load()
+            with self._locked():
+                if self._file_lock is not None:
+                    self._read_history(incremental=True)
+                rank = self._insert(date_str, score)
+                if rank is None:
+                    return False
+
+                line = (json.dumps({"date": date_str, "score": score}) + "\n").encode('utf-8')
+                try:
+                    with open(self.history_file, 'ab') as f:
+                        at_end = f.tell() == self._offset
+                        f.write(line)
+                    if at_end:
+                        self._offset += len(line)  # 自己追加的记录不用再读一遍
+                except Exception as e:
+                    print(f"Saving leaderboard history failed: {e}")
+                if rank < self.top_count:
+                    # 前30名有变化才重写视图文件
+                    save_leaderboard(self._top(self.top_count))
+                return True
+
+    def top(self, limit):
+        with self._lock:
+            self._load()
+            return self._top(limit)
+
+    def _top(self, limit):
+        return [{"date": date_str, "score": -neg_score} for neg_score, date_str in self._ordered[:limit]]
+
+    def get(self, date_str):
+        with self._lock:
+            self._load()
+            return self._scores.get(date_str)
+
+    def __len__(self):
+        with self._lock:
+            self._load()
+            return len(self._scores)
+
+_leaderboard = None
+_leaderboard_shared = False
+
+def share_leaderboard():
+    """多实例模式：进程内共用的排行榜加文件锁，并读入别的实例提交的分数（在第一次使用排行榜之前调用）"""
+    global _leaderboard_shared
+    _leaderboard_shared = True
+
+def get_leaderboard():
+    """进程内共用的排行榜索引（第一次调用时创建）"""
+    global _leaderboard
+    if _leaderboard is None:
+        _leaderboard = Leaderboard(shared=_leaderboard_shared)
+    return _leaderboard
+
+def submit_score(date_str, score):
+    """把当天分数写入排行榜（同一天只保留最高分）"""
+    get_leaderboard().submit(date_str, score)
+
+# ======================
+# 追加写入的进度日志
+# ======================
+# 每条记录定长：日期序号、合并数量、当日进度、当日三级树数量、总三级树数量、当日专注秒数、CRC32
+_JOURNAL_RECORD = struct.Struct('<IId6qdI')
+
+class ProgressJournal:
+    """进度日志：每次保存只在日志末尾追加一条定长记录，定期在后台合并回JSON快照
+
+    progress.json 和 daily_progress.json 仍然是快照，日志里最后一条有效记录就是最新状态。
+    合并时先把日志改名为 .compacting 并在新日志里写入最新记录，再写快照，最后删除旧日志，
+    任何一步中断都不会丢失进度。
+    """
+    def __init__(self, path=JOURNAL_FILE, compact_every=720):
+        self.path = path
+        self.compacting_path = path + '.compacting'
+        self.compact_every = compact_every
+        self._lock = threading.Lock()
+        self._file = None
+        self._records = 0
+        self._last = None
+        self._compactor = None
+        self._queued = []  # 合并线程忙时排队等待写入快照的状态
+
+    def load(self):
+        """返回(主进度, 当日进度)：读取快照，再用日志里最新的记录覆盖"""
+        main_data = load_progress()
+        daily_data = load_daily_progress()
+
+        state = self._read_last(self.path) or self._read_last(self.compacting_path)
+        if state is not None:
+            record_main, record_daily = state
+            main_data.update(record_main)
+            if record_daily["date"] == daily_data["date"]:
+                daily_data = record_daily
+            self._last = state
+
+        Path(os.path.dirname(self.path)).mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, 'ab')
+        size = os.path.getsize(self.path)
+        aligned = size - size % _JOURNAL_RECORD.size
+        if aligned != size:
+            self._file.truncate(aligned)  # 丢掉写了一半的记录，保证后续记录对齐
+        self._records = aligned // _JOURNAL_RECORD.size
+        if state is not None and (state[1]["date"] != daily_data["date"]
+                                  or os.path.exists(self.compacting_path)):
+            # 上次运行留下了别的日期的记录或未完成的合并，先写回快照
+            self.compact(wait=True)
+        return main_data, daily_data
+
+    def save(self, main_data, daily_data):
+        """追加一条记录（O(1)），记录数过多时在后台合并"""
+        if self._last is not None and self._last[1]["date"] != daily_data["date"]:
+            self.compact()  # 跨天了，先把前一天的进度写回快照
+        record = self._pack(main_data, daily_data)
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(record)
+            self._file.flush()
+            self._records += 1
+            self._last = (dict(main_data), dict(daily_data))
+        if self._records >= self.compact_every:
+            self.compact()
+
+    def compact(self, wait=False):
+        """把日志合并进JSON快照；wait为False时在后台线程进行
+
+        上一次合并还没结束时不能再改名日志，这时把当前状态排队，由合并线程写完后接着合并，
+        跨天时前一天的最终进度不会被跳过。
+        """
+        with self._lock:
+            if self._compactor is not None:
+                if self._last is not None:
+                    if self._queued and self._queued[-1][1]["date"] == self._last[1]["date"]:
+                        self._queued[-1] = self._last
+                    else:
+                        self._queued.append(self._last)
+                compactor = self._compactor
+            else:
+                state = self._rotate()
+                if state is None:
+                    return
+                compactor = self._compactor = threading.Thread(target=self._compact_loop, args=([state],),
+                                                               daemon=True)
+                compactor.start()
+        if wait:
+            compactor.join()
+
+    def _rotate(self):
+        """把日志改名为.compacting，新日志以最新记录开头，返回要写入快照的状态（持有self._lock时调用）"""
+        if self._last is None or self._file is None:
+            return None
+        state = self._last
+        self._file.close()
+        os.replace(self.path, self.compacting_path)
+        self._file = open(self.path, 'ab')
+        self._file.write(self._pack(*state))
+        self._file.flush()
+        self._records = 1
+        return state
+
+    def _compact_loop(self, states):
+        """合并线程：写快照，期间又有合并请求时接着合并排队的状态"""
+        try:
+            while states:
+                self._write_snapshot(states)
+                with self._lock:
+                    states = []
+                    if self._queued:
+                        latest = self._rotate()
+                        # 同一天只需写最新的状态
+                        states = [state for state in self._queued
+                                  if latest is None or state[1]["date"] != latest[1]["date"]]
+                        if latest is not None:
+                            states.append(latest)
+                        self._queued = []
+                    if not states:
+                        self._compactor = None
+        finally:
+            with self._lock:
+                if self._compactor is threading.current_thread():
+                    self._compactor = None  # 写快照出错时也要让之后的合并能开始
+
+    def close(self):
+        """写回快照并关闭日志"""
+        self.compact(wait=True)
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def submit_score(self, date_str, score):
+        submit_score(date_str, score)
+
+    def top_scores(self, limit):
+        return get_leaderboard().top(limit)
+
+    def score_count(self):
+        return len(get_leaderboard())
+
+    def _write_snapshot(self, states):
+        for main_data, daily_data in states:
+            save_progress(main_data)
+            save_daily_progress(daily_data, main_data["merge_count"])
+        try:
+            os.remove(self.compacting_path)
+        except OSError as e:
+            print(f"Removing compacted journal failed: {e}")
+
+    @staticmethod
+    def _pack(main_data, daily_data):
+        date_ordinal = datetime.date.fromisoformat(daily_data["date"]).toordinal()
+        body = _JOURNAL_RECORD.pack(
+            date_ordinal, main_data["merge_count"], daily_data["progress"],
+            daily_data["seedlings"], daily_data["trees"], daily_data["giants"],
+            main_data["total_seedlings"], main_data["total_trees"], main_data["total_giants"],
+            daily_data.get("focus_seconds", 0.0), 0)[:-4]
+        return body + struct.pack('<I', zlib.crc32(body))
+
+    @staticmethod
+    def _read_last(path):
+        """返回日志中最后一条有效记录，文件末尾写了一半的记录会被跳过"""
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+
+        size = _JOURNAL_RECORD.size
+        for end in range(len(data) // size * size, 0, -size):
+            chunk = data[end - size:end]
+            fields = _JOURNAL_RECORD.unpack(chunk)
+            if zlib.crc32(chunk[:-4]) != fields[-1]:
+                continue
+            (date_ordinal, merge_count, progress, seedlings, trees, giants,
+             total_seedlings, total_trees, total_giants, focus_seconds, _) = fields
+            main_data = {
+                "total_seedlings": total_seedlings,
+                "total_trees": total_trees,
+                "total_giants": total_giants,
+                "merge_count": merge_count
+            }
+            daily_data = {
+                "date": str(datetime.date.fromordinal(date_ordinal)),
+                "progress": progress,
+                "seedlings": seedlings,
+                "trees": trees,
+                "giants": giants,
+                "focus_seconds": focus_seconds
+            }
+            return main_data, daily_data
+        return None
+
+# ======================
+# SQLite存储（可选）
+# ======================
+DAILY_COLUMNS = ("date", "progress", "seedlings", "trees", "giants", "focus_seconds")
+
+class SqliteStore:
+    """把主进度、每日进度和排行榜存在同一个SQLite数据库里（WAL模式）
+
+    接口与ProgressJournal相同；每日进度按日期、排行榜按分数建索引，
+    查询前N名、某一天、一段日期都不需要读取全部数据。第一次打开时从JSON文件迁移。
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+        CREATE TABLE IF NOT EXISTS progress (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            total_seedlings INTEGER NOT NULL,
+            total_trees INTEGER NOT NULL,
+            total_giants INTEGER NOT NULL,
+            merge_count INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS daily_progress (
+            date TEXT PRIMARY KEY,
+            progress REAL NOT NULL,
+            seedlings INTEGER NOT NULL,
+            trees INTEGER NOT NULL,
+            giants INTEGER NOT NULL,
+            focus_seconds REAL NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS leaderboard (
+            date TEXT PRIMARY KEY,
+            score INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS leaderboard_score ON leaderboard (score DESC, date);
+    """
+
+    def __init__(self, path=DATABASE_FILE):
+        self.path = path
+        self._db = None
+        self._lock = threading.RLock()
+        self._archived_date = None  # 上次归档时的日期，跨天后再检查
+
+    def load(self):
+        """打开数据库（必要时先迁移JSON），返回(主进度, 当日进度)"""
+        Path(os.path.dirname(self.path)).mkdir(parents=True, exist_ok=True)
+        # 连接可能在后台保存线程中使用，由_lock串行化
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(self.SCHEMA)
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(daily_progress)")]
+        if "focus_seconds" not in columns:
+            self._db.execute("ALTER TABLE daily_progress ADD COLUMN focus_seconds REAL NOT NULL DEFAULT 0")
+        if self._db.execute("SELECT 1 FROM meta WHERE key = 'migrated_json'").fetchone() is None:
+            self.migrate_json()
+
+        row = self._db.execute(
+            "SELECT total_seedlings, total_trees, total_giants, merge_count FROM progress WHERE id = 1"
+        ).fetchone()
+        if row is None:
+            main_data = {"total_seedlings": 0, "total_trees": 0, "total_giants": 0, "merge_count": 10}
+        else:
+            main_data = dict(zip(("total_seedlings", "total_trees", "total_giants", "merge_count"), row))
+        self._archive_finished_days(main_data["merge_count"])
+
+        today = str(datetime.date.today())
+        daily_data = self.day(today) or {
+            "date": today,
+            "progress": 0.0,
+            "seedlings": 0,
+            "trees": 0,
+            "giants": 0,
+            "focus_seconds": 0.0
+        }
+        return main_data, daily_data
+
+    def migrate_json(self):
+        """一次性把JSON文件（含进度日志）导入数据库"""
+        # 先把进度日志合并回JSON快照，load_progress负责旧版本数据的默认值
+        journal = ProgressJournal()
+        journal.load()
+        journal.close()
+        main_data = load_progress()
+
+        all_daily = {}
+        try:
+            with open(DAILY_PROGRESS_FILE, 'r', encoding='utf-8') as f:
+                all_daily = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError, IOError) as e:
+            print(f"Loading daily progress for migration failed: {e}")
+
+        with self._db:
+            self._write_main(main_data)
+            for date_str, data in all_daily.items():
+                self._write_daily(dict(data, date=date_str))
+            board = get_leaderboard()
+            for item in board.top(len(board)):
+                self.submit_score(item["date"], item["score"], commit=False)
+            self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_json', ?)",
+                             (datetime.datetime.now().isoformat(timespec='seconds'),))
+        print(f"Migrated {len(all_daily)} days from JSON into {self.path}")
+
+    def save(self, main_data, daily_data):
+        with self._lock, self._db:
+            self._write_main(main_data)
+            self._write_daily(daily_data)
+        if daily_data["date"] != self._archived_date:
+            self._archive_finished_days(main_data["merge_count"])
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def submit_score(self, date_str, score, commit=True):
+        """同一天只保留最高分"""
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO leaderboard (date, score) VALUES (?, ?) "
+                "ON CONFLICT(date) DO UPDATE SET score = MAX(score, excluded.score)",
+                (date_str, score))
+            if commit:
+                self._db.commit()
+
+    def top_scores(self, limit):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT date, score FROM leaderboard ORDER BY score DESC, date LIMIT ?", (limit,)).fetchall()
+        return [{"date": date_str, "score": score} for date_str, score in rows]
+
+    def score_count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM leaderboard").fetchone()[0]
+
+    def day(self, date_str):
+        """返回某一天的进度，没有记录时返回None"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT date, progress, seedlings, trees, giants, focus_seconds FROM daily_progress WHERE date = ?",
+                (date_str,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(DAILY_COLUMNS, row))
+
+    def history(self, start, end):
+        """返回[start, end]日期范围内（含两端）的每日进度，按日期排序"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT date, progress, seedlings, trees, giants, focus_seconds FROM daily_progress "
+                "WHERE date BETWEEN ? AND ? ORDER BY date", (str(start), str(end))).fetchall()
+        return [dict(zip(DAILY_COLUMNS, row)) for row in rows]
+
+    def _archive_finished_days(self, merge_count):
+        """已经结束、还没归档的日子写入长期历史档案，与JSON存储共用同一个档案"""
+        today = datetime.date.today()
+        try:
+            archive = get_history_archive()
+            last = archive.last_day()
+            start = "" if last is None else str(last + datetime.timedelta(days=1))
+            with self._lock:
+                rows = self._db.execute(
+                    "SELECT date, progress, seedlings, trees, giants, focus_seconds FROM daily_progress "
+                    "WHERE date >= ? AND date < ? ORDER BY date", (start, str(today))).fetchall()
+            archive.append_days({row[0]: dict(zip(DAILY_COLUMNS, row)) for row in rows},
+                                before=today, merge_count=merge_count)
+        except Exception as e:
+            print(f"Archiving daily history failed: {e}")
+        self._archived_date = str(today)
+
+    def _write_main(self, main_data):
+        self._db.execute(
+            "INSERT OR REPLACE INTO progress (id, total_seedlings, total_trees, total_giants, merge_count) "
+            "VALUES (1, ?, ?, ?, ?)",
+            (main_data["total_seedlings"], main_data["total_trees"],
+             main_data["total_giants"], main_data["merge_count"]))
+
+    def _write_daily(self, daily_data):
+        self._db.execute(
+            "INSERT OR REPLACE INTO daily_progress (date, progress, seedlings, trees, giants, focus_seconds) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (daily_data["date"], daily_data.get("progress", 0.0), daily_data.get("seedlings", 0),
+             daily_data.get("trees", 0), daily_data.get("giants", 0), daily_data.get("focus_seconds", 0.0)))
+
+# ======================
+# 教室模式存储
+# ======================
+class ClassroomStore:
+    """教室模式（一个进程带多个座位）的存储：所有座位存在同一个SQLite数据库里，按座位名区分
+
+    load/save一次读写所有座位，save在一个事务里完成；分数提交的键是(座位, 日期)。
+    可以直接用BackgroundSaver包装，generation传入各座位generation组成的元组。
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS seat_progress (
+            seat TEXT PRIMARY KEY,
+            total_seedlings INTEGER NOT NULL,
+            total_trees INTEGER NOT NULL,
+            total_giants INTEGER NOT NULL,
+            merge_count INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS seat_daily (
+            seat TEXT NOT NULL,
+            date TEXT NOT NULL,
+            progress REAL NOT NULL,
+            seedlings INTEGER NOT NULL,
+            trees INTEGER NOT NULL,
+            giants INTEGER NOT NULL,
+            focus_seconds REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (seat, date)
+        );
+        CREATE TABLE IF NOT EXISTS seat_scores (
+            seat TEXT NOT NULL,
+            date TEXT NOT NULL,
+            score INTEGER NOT NULL,
+            PRIMARY KEY (seat, date)
+        );
+        CREATE INDEX IF NOT EXISTS seat_scores_score ON seat_scores (score DESC, date, seat);
+    """
+
+    def __init__(self, seats, path=CLASSROOM_DATABASE_FILE):
+        self.seats = list(seats)
+        self.path = path
+        self._db = None
+        self._lock = threading.RLock()
+
+    def load(self):
+        """打开数据库，返回({座位: 主进度}, {座位: 当日进度})，没有记录的座位用默认值"""
+        Path(os.path.dirname(self.path)).mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(self.SCHEMA)
+
+        today = str(datetime.date.today())
+        mains = {}
+        dailies = {}
+        for row in self._db.execute(
+                "SELECT seat, total_seedlings, total_trees, total_giants, merge_count FROM seat_progress"):
+            mains[row[0]] = dict(zip(("total_seedlings", "total_trees", "total_giants", "merge_count"), row[1:]))
+        for row in self._db.execute(
+                "SELECT seat, date, progress, seedlings, trees, giants, focus_seconds FROM seat_daily "
+                "WHERE date = ?", (today,)):
+            dailies[row[0]] = dict(zip(DAILY_COLUMNS, row[1:]))
+        for seat in self.seats:
+            mains.setdefault(seat, {"total_seedlings": 0, "total_trees": 0, "total_giants": 0, "merge_count": 10})
+            dailies.setdefault(seat, {
+                "date": today,
+                "progress": 0.0,
+                "seedlings": 0,
+                "trees": 0,
+                "giants": 0,
+                "focus_seconds": 0.0
+            })
+        return mains, dailies
+
+    def save(self, mains, dailies):
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO seat_progress (seat, total_seedlings, total_trees, total_giants, merge_count) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(seat, data["total_seedlings"], data["total_trees"], data["total_giants"], data["merge_count"])
+                 for seat, data in mains.items()])
+            self._db.executemany(
+                "INSERT OR REPLACE INTO seat_daily (seat, date, progress, seedlings, trees, giants, focus_seconds) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(seat, data["date"], data.get("progress", 0.0), data.get("seedlings", 0), data.get("trees", 0),
+                  data.get("giants", 0), data.get("focus_seconds", 0.0))
+                 for seat, data in dailies.items()])
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def submit_score(self, key, score):
+        """key为(座位, 日期)，同一座位同一天只保留最高分"""
+        seat, date_str = key
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO seat_scores (seat, date, score) VALUES (?, ?, ?) "
+                "ON CONFLICT(seat, date) DO UPDATE SET score = MAX(score, excluded.score)",
+                (seat, date_str, score))
+            self._db.commit()
+
+    def top_scores(self, limit):
+        """全班的前limit名，每项含座位、日期和分数"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT seat, date, score FROM seat_scores ORDER BY score DESC, date, seat LIMIT ?",
+                (limit,)).fetchall()
+        return [{"seat": seat, "date": date_str, "score": score} for seat, date_str, score in rows]
+
+    def score_count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM seat_scores").fetchone()[0]
+
+# ======================
+# 后台保存
+# ======================
+class BackgroundSaver:
+    """包装一个存储后端，把写入放到后台线程
+
+    save只保留最新的一份快照（写入前来了多份时合并为一次写入），与排队中或已经写入成功的快照
+    generation相同时直接跳过，写入失败的快照下次保存时会重新排队；分数提交同样排队。
+    界面线程只在关闭时等待，而且有超时；读排行榜不等待排队的写入。
+    """
+    def __init__(self, store, close_timeout=3.0):
+        self.store = store
+        self.close_timeout = close_timeout
+        self._cond = threading.Condition()
+        self._pending = None      # 最新的(主进度, 当日进度)
+        self._scores = {}         # 待提交的分数：日期 -> 分数
+        self._generation = None   # 排队中的快照的generation
+        self._written_generation = None  # 最近一次写入成功的快照的generation
+        self._busy = False
+        self._closing = False
+        self._thread = None
+        self.uploader = None      # 可选的全班排行榜客户端（aggregator.AggregatorClient），分数同时交给它
+        self.writer = None        # 多实例模式（shared.SharedState）：只有选出的写入者写存档，其余实例的分数交给它
+        self._store_loaded = False
+        self.written = 0
+        self.skipped = 0
+
+    def load(self):
+        result = self.store.load()
+        self._store_loaded = True
+        self.start()
+        return result
+
+    def start(self):
+        """只启动后台线程、不读取存档（多实例模式下还不是写入者时）"""
+        self._thread = threading.Thread(target=self._run, name="PlanTreeSaver", daemon=True)
+        self._thread.start()
+
+    def _writable(self):
+        """是否可以写存档；多实例模式下刚接替写入者时先打开存档（进度以共享段为准，读到的内容不用）"""
+        if self.writer is not None and not self.writer.is_writer():
+            return False
+        if not self._store_loaded:
+            self.store.load()
+            self._store_loaded = True
+        return True
+
+    def save(self, main_data, daily_data, generation=None):
+        with self._cond:
+            if generation is not None and generation == (
+                    self._generation if self._pending is not None else self._written_generation):
+                self.skipped += 1
+                return
+            self._generation = generation
+            self._pending = (main_data, daily_data)
+            self._cond.notify()
+
+    def submit_score(self, date_str, score):
+        with self._cond:
+            self._scores[date_str] = max(score, self._scores.get(date_str, score))
+            self._cond.notify()
+        if self.uploader is not None:
+            self.uploader.submit(date_str, score)
+
+    def flush(self, timeout=None):
+        """等待已排队的写入完成，超时返回False"""
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: self._pending is None and not self._scores and not self._busy, timeout)
+
+    def top_scores(self, limit):
+        """直接读存储后端（界面线程调用，不等待排队的写入；刚提交的分数在后台写完后出现）"""
+        return self.store.top_scores(limit)
+
+    def score_count(self):
+        return self.store.score_count()
+
+    def close(self, timeout=None):
+        """写完排队的数据并关闭存储后端，最多等待timeout秒"""
+        timeout = self.close_timeout if timeout is None else timeout
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        if self._thread is None:
+            return True
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            print(f"Saving did not finish within {timeout:.1f}s")
+            return False
+        return True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending is not None or self._scores or self._closing)
+                pending, self._pending = self._pending, None
+                generation = self._generation
+                scores, self._scores = self._scores, {}
+                closing = self._closing and pending is None and not scores
+                self._busy = True
+
+            try:
+                if pending is not None and self._writable():
+                    start = time.perf_counter()
+                    self.store.save(*pending)
+                    self.written += 1
+                    with self._cond:
+                        self._written_generation = generation
+                    if perf_stats.enabled:
+                        perf_stats.record("background_save", time.perf_counter() - start)
+                for date_str, score in scores.items():
+                    if self._writable():
+                        self.store.submit_score(date_str, score)
+                    else:
+                        self.writer.submit_score(date_str, score)
+                if closing and self._store_loaded:
+                    self.store.close()
+            except Exception as e:
+                print(f"Background saving failed: {e}")
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+            if closing:
+                return
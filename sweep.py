@@ -0,0 +1,223 @@
+'''
+Apache license 2.0
+Version 2.0, January 2004
+Read https://www.apache.org/licenses/LICENSE-2.0
+Full License is in /LICENCE file
+'''
+# 无界面的参数扫描工具：用录制好的音量序列离线回放TreeManager，比较不同参数组合
+#
+# 用法示例：
+#   python sweep.py day1.wav day2.npy --low 40:100:10 --speed 10,25,50 --merge 5,10 -o result.csv
+import os
+import sys
+import csv
+import copy
+import wave
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from tree_manager import TreeManager
+from recorder import LOUDNESS_RECORD, replay_series
+from dsp import WEIGHTINGS, LoudnessFrontEnd
+
+BLOCK_SIZE = 512          # 与start_microphone_monitor一致
+DEFAULT_DT = 512 / 16000  # .npy音量序列默认每个值代表一个音频block
+CHUNK_SECONDS = 60.0      # 回放时每次批量处理的时长，用于定位第一棵大树
+
+RESULT_FIELDS = [
+    "morning_mode", "threshold_low", "threshold_high", "growth_speed", "merge_count",
+    "hours", "seedlings", "seedlings_per_hour", "first_tree_s", "traces_with_tree",
+    "decay_loss_per_hour",
+]
+
+# ======================
+# 读取音量序列
+# ======================
+def load_wav_loudness(path, block_size=BLOCK_SIZE, weighting="none"):
+    """按block计算wav文件的音量（与audio_callback相同的音量前端），返回(音量数组, 每个值的秒数)"""
+    with wave.open(path, 'rb') as f:
+        channels = f.getnchannels()
+        width = f.getsampwidth()
+        rate = f.getframerate()
+        raw = f.readframes(f.getnframes())
+
+    if width == 1:
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif width == 2:
+        samples = np.frombuffer(raw, dtype='<i2').astype(np.float32) / 32768
+    elif width == 4:
+        samples = np.frombuffer(raw, dtype='<i4').astype(np.float32) / 2147483648
+    else:
+        raise ValueError(f"Unsupported sample width: {width * 8} bit")
+
+    # 只取第一个声道，和单声道采集保持一致
+    samples = samples.reshape(-1, channels)[:, 0]
+    blocks = len(samples) // block_size
+    samples = np.ascontiguousarray(samples[:blocks * block_size].reshape(blocks, block_size))
+    front_end = LoudnessFrontEnd(rate, block_size, weighting)
+    loudness = np.fromiter((front_end.process(block) for block in samples), dtype=np.int64, count=blocks)
+    return loudness, block_size / rate
+
+
+def load_trace(path, dt=DEFAULT_DT, weighting="none"):
+    """读取一个音量序列文件（.npy为音量值，.wav为原始录音，.bin为LoudnessRecorder的每秒记录）"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".npy":
+        return np.load(path).ravel(), dt
+    if ext == ".bin":
+        records = np.memmap(path, dtype=LOUDNESS_RECORD, mode='r')
+        return np.array(replay_series(records)), 1.0
+    if ext == ".wav":
+        return load_wav_loudness(path, weighting=weighting)
+    raise ValueError(f"Unsupported trace file: {path}")
+
+# ======================
+# 回放
+# ======================
+def replay_trace(manager, loudness, dt):
+    """从空的当日进度开始回放一段音量，返回(新增树苗数, 第一棵大树出现的秒数或None, 衰减损失的进度%)"""
+    manager.daily_progress = 0.0
+    manager.daily_seedlings = manager.daily_trees = manager.daily_giants = 0
+    manager.daily_focus_seconds = 0.0
+
+    growing = np.count_nonzero(manager.growing_mask(loudness))
+
+    chunk = max(1, int(CHUNK_SECONDS / dt))
+    seedlings = 0
+    first_tree = None
+    for start in range(0, len(loudness), chunk):
+        part = loudness[start:start + chunk]
+        if first_tree is None:
+            before = copy.copy(manager)
+            seedlings += manager.update_batch(part, dt)
+            if manager.daily_trees or manager.daily_giants:
+                # 这一段里长出了第一棵大树，逐个样本重放定位具体时间
+                for i, value in enumerate(part):
+                    before.update(value, dt)
+                    if before.daily_trees or before.daily_giants:
+                        first_tree = (start + i + 1) * dt
+                        break
+        else:
+            seedlings += manager.update_batch(part, dt)
+
+    # 生长总量 = 变成树苗的部分 + 剩余进度 + 被衰减掉的部分
+    grown = manager.growth_speed * dt * growing
+    decay_loss = grown - seedlings * 100 - manager.daily_progress
+    return seedlings, first_tree, decay_loss
+
+
+_traces = []
+
+def _init_worker(paths, dt, weighting):
+    # 每个进程只读取一次音量序列，任务之间只传递参数
+    global _traces
+    _traces = [load_trace(path, dt, weighting) for path in paths]
+
+
+def run_combo(params):
+    """在所有音量序列上评估一组参数"""
+    morning_mode, low, high, speed, merge = params
+    manager = TreeManager()
+    manager.morning_mode = morning_mode
+    manager.threshold_low = low
+    manager.threshold_high = high
+    manager.growth_speed = speed
+    manager.merge_count = merge
+
+    hours = 0.0
+    seedlings = 0
+    decay_loss = 0.0
+    first_trees = []
+    for loudness, dt in _traces:
+        count, first_tree, loss = replay_trace(manager, loudness, dt)
+        hours += len(loudness) * dt / 3600
+        seedlings += count
+        decay_loss += loss
+        if first_tree is not None:
+            first_trees.append(first_tree)
+
+    return {
+        "morning_mode": morning_mode,
+        "threshold_low": low,
+        "threshold_high": high,
+        "growth_speed": speed,
+        "merge_count": merge,
+        "hours": round(hours, 4),
+        "seedlings": seedlings,
+        "seedlings_per_hour": round(seedlings / hours, 3) if hours else 0.0,
+        "first_tree_s": round(float(np.mean(first_trees)), 2) if first_trees else "",
+        "traces_with_tree": f"{len(first_trees)}/{len(_traces)}",
+        # 以树苗数计（100%进度 = 1棵树苗）
+        "decay_loss_per_hour": round(decay_loss / 100 / hours, 3) if hours else 0.0,
+    }
+
+# ======================
+# 命令行
+# ======================
+def parse_values(text, cast):
+    """解析 "1,2,3" 或 "start:stop:step"（包含stop）形式的参数列表"""
+    values = []
+    for part in text.split(','):
+        if ':' in part:
+            start, stop, step = (cast(v) for v in part.split(':'))
+            value = start
+            while value <= stop:
+                values.append(value)
+                value = cast(round(value + step, 9))
+        else:
+            values.append(cast(part))
+    return values
+
+
+def build_grid(args):
+    defaults = TreeManager()
+    lows = parse_values(args.low, int) if args.low else [defaults.threshold_low]
+    highs = parse_values(args.high, int) if args.high else [defaults.threshold_high]
+    speeds = parse_values(args.speed, float) if args.speed else [defaults.growth_speed]
+    merges = parse_values(args.merge, int) if args.merge else [defaults.merge_count]
+
+    # 只扫描当前模式用得到的阈值
+    if args.morning:
+        lows = [defaults.threshold_low]
+    else:
+        highs = [defaults.threshold_high]
+    return list(itertools.product([args.morning], lows, highs, speeds, merges))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PlanTree headless parameter sweep")
+    parser.add_argument("traces", nargs="+", help="loudness traces (.npy loudness values, .wav recordings or --record .bin files)")
+    parser.add_argument("--morning", action="store_true", help="simulate morning-reading mode")
+    parser.add_argument("--low", help="threshold_low values, e.g. 40,60 or 40:100:10")
+    parser.add_argument("--high", help="threshold_high values")
+    parser.add_argument("--speed", help="growth_speed values (%%/s)")
+    parser.add_argument("--merge", help="merge_count values")
+    parser.add_argument("--dt", type=float, default=DEFAULT_DT,
+                        help="seconds per value in .npy traces (default: one 512-frame block at 16 kHz)")
+    parser.add_argument("--weighting", choices=WEIGHTINGS, default="none",
+                        help="frequency weighting applied to .wav traces (default: none)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("-o", "--output", help="write the results table as CSV to this file")
+    args = parser.parse_args(argv)
+
+    grid = build_grid(args)
+    print(f"Evaluating {len(grid)} combinations over {len(args.traces)} traces...", file=sys.stderr)
+
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                             initargs=(args.traces, args.dt, args.weighting)) as pool:
+        rows = list(pool.map(run_combo, grid))
+    rows.sort(key=lambda row: row["seedlings_per_hour"], reverse=True)
+
+    out = open(args.output, 'w', newline='', encoding='utf-8') if args.output else sys.stdout
+    try:
+        writer = csv.DictWriter(out, fieldnames=RESULT_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
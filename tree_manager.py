@@ -0,0 +1,441 @@
+'''
+Apache license 2.0
+Version 2.0, January 2004
+Read https://www.apache.org/licenses/LICENSE-2.0
+Full License is in /LICENCE file
+'''
+import time
+import datetime
+from storage import submit_score
+# NumPy只在批量回放的方法里导入，界面启动时不需要加载
+
+# ======================
+# 模拟时钟
+# ======================
+TIME_STEP = 0.01          # 原始的固定步长（秒），decay 系数以此为基准
+MAX_CATCH_UP = 1.0        # 单次tick最多补算的时间（秒），防止长时间卡顿后暴涨
+BATCH_MIN_RUN = 32        # update_batch里短于这么多步的段逐个样本计算，更长的交给NumPy
+
+class SimClock:
+    """用单调时钟测量两次tick之间的真实时间"""
+    def __init__(self, max_catch_up=MAX_CATCH_UP, clock=time.monotonic):
+        self.max_catch_up = max_catch_up
+        self._clock = clock
+        self._last = None
+
+    def reset(self):
+        self._last = self._clock()
+
+    def tick(self, now=None):
+        """返回距上次tick经过的秒数（超过max_catch_up的部分被丢弃）
+
+        now为None时读取时钟；也可以传入同一时钟下的时间戳（如音频block的到达时间）。
+        """
+        if now is None:
+            now = self._clock()
+        if self._last is None:
+            self._last = now
+            return 0.0
+        elapsed = max(0.0, now - self._last)
+        self._last = now
+        return min(elapsed, self.max_catch_up)
+
+# ======================
+# 分级计数
+# ======================
+TIER_DEPTH = 3  # 树苗、大树、巨树；界面和存档按这三级显示和保存
+
+class TierCounter:
+    """混合进制的分级计数器：每base个低一级合成一个高一级，最高一级不再合并
+
+    counts[0]是树苗，counts[1]是大树……整数不限大小。score是折算成树苗的总数，
+    随每次修改增量维护；合成不改变score。
+    """
+    def __init__(self, base=10, depth=TIER_DEPTH):
+        if depth < 1:
+            raise ValueError(f"Invalid tier depth: {depth}")
+        self.counts = [0] * depth
+        self.score = 0
+        self._set_base(base)
+
+    def _set_base(self, base):
+        if base < 1:
+            raise ValueError(f"Invalid merge count: {base}")
+        self.base = base
+        self.weights = [base ** i for i in range(len(self.counts))]
+
+    def copy(self):
+        clone = TierCounter(self.base, len(self.counts))
+        clone.counts = list(self.counts)
+        clone.score = self.score
+        return clone
+
+    def add(self, n):
+        """加入n个树苗并逐级进位，耗时只与级数有关"""
+        counts = self.counts
+        carry = n
+        for i in range(len(counts) - 1):
+            carry, counts[i] = divmod(counts[i] + carry, self.base)
+        counts[-1] += carry
+        self.score += n
+
+    def normalize(self):
+        """把超过base的级进位到上一级，返回是否有变化"""
+        old = list(self.counts)
+        self.add(0)
+        return self.counts != old
+
+    def set(self, tier, value):
+        """直接设置某一级的数量（不进位），返回是否有变化"""
+        old = self.counts[tier]
+        if old == value:
+            return False
+        self.counts[tier] = value
+        self.score += (value - old) * self.weights[tier]
+        return True
+
+    def set_from(self, tier, value):
+        """设置某一级并清空更高的级，用于按三级存档加载和重置"""
+        changed = any(self.counts[tier + 1:])
+        for i in range(tier + 1, len(self.counts)):
+            self.set(i, 0)
+        return self.set(tier, value) or changed
+
+    def value_from(self, tier):
+        """把tier及以上各级折算成tier级的数量（存档只有三级时用它保存最高一级）"""
+        return sum(count * weight for count, weight in zip(self.counts[tier:], self.weights))
+
+    def rebase(self, base):
+        """合并数量改变：总分不变，按新的进制重新分级，返回是否有变化"""
+        if base == self.base:
+            return False
+        self._set_base(base)
+        return self.reset(self.score)
+
+    def reset(self, score):
+        """按分数（折算成树苗的数量）重新分级，返回是否有变化"""
+        old = list(self.counts)
+        value = self.score = score
+        for i in range(len(self.counts) - 1):
+            value, self.counts[i] = divmod(value, self.base)
+        self.counts[-1] = value
+        return self.counts != old
+
+def _tier_property(counter, tier, top=False):
+    """TreeManager上daily_seedlings等属性：读写对应计数器的一级，有变化时递增generation
+
+    top为True时对应存档里的最高一级（巨树），写入时同时清空更高的级。
+    """
+    def get(self):
+        return getattr(self, counter).counts[tier]
+
+    def set(self, value):
+        target = getattr(self, counter)
+        if target.set_from(tier, value) if top else target.set(tier, value):
+            self.__dict__["generation"] += 1
+    return property(get, set)
+
+class TreeManager:
+    # 会被保存的字段，改变时递增generation，保存时据此跳过没有变化的快照（树的数量在计数器里，见_tier_property）
+    _SAVED_FIELDS = frozenset(("merge_count",))
+
+    def __init__(self, store=None, tiers=TIER_DEPTH):
+        if tiers < TIER_DEPTH:
+            raise ValueError(f"Tree manager needs at least {TIER_DEPTH} tiers, got {tiers}")
+        self.generation = 0
+        self.store = store  # 存储后端（ProgressJournal/SqliteStore），None时直接读写JSON排行榜
+        self.morning_mode = False
+        self.threshold_low = 60
+        self.threshold_high = 60
+        self.growth_speed = 25.0  # %/秒
+
+        # 每日独立进度和总进度（永久积累），共用同一种分级计数
+        self.daily = TierCounter(10, tiers)
+        self.total = TierCounter(10, tiers)
+        self.daily_progress = 0.0
+        self.daily_focus_seconds = 0.0  # 当日处于生长状态的累计秒数
+
+    daily_seedlings = _tier_property("daily", 0)
+    daily_trees = _tier_property("daily", 1)
+    daily_giants = _tier_property("daily", 2, top=True)
+    total_seedlings = _tier_property("total", 0)
+    total_trees = _tier_property("total", 1)
+    total_giants = _tier_property("total", 2, top=True)
+
+    @property
+    def merge_count(self):
+        return self.daily.base
+
+    @merge_count.setter
+    def merge_count(self, value):
+        # 分数不变，已有的树按新的合并数量重新分级
+        self.daily.rebase(value)
+        self.total.rebase(value)
+
+    def __setattr__(self, name, value):
+        if name in self._SAVED_FIELDS:
+            if getattr(self, name, None) != value:
+                self.__dict__["generation"] += 1
+        elif name == "daily_progress":
+            # 衰减时进度每次只变化一点点，精确到0.01%才算有变化
+            old = self.__dict__.get(name)
+            if old is None or round(old, 2) != round(value, 2):
+                self.__dict__["generation"] += 1
+        object.__setattr__(self, name, value)
+
+    def __copy__(self):
+        # 浅拷贝也要复制计数器，否则副本和原对象会一起长树
+        clone = type(self).__new__(type(self))
+        clone.__dict__.update(self.__dict__)
+        clone.__dict__["daily"] = self.daily.copy()
+        clone.__dict__["total"] = self.total.copy()
+        return clone
+
+    def load_from_data(self, main_data, daily_data):
+        # 加载主进度
+        self.merge_count = main_data.get("merge_count", 10)
+        self.total_seedlings = main_data.get("total_seedlings", 0)
+        self.total_trees = main_data.get("total_trees", 0)
+        self.total_giants = main_data.get("total_giants", 0)
+
+        # 加载每日进度
+        self.daily_progress = daily_data.get("progress", 0.0)
+        self.daily_seedlings = daily_data.get("seedlings", 0)
+        self.daily_trees = daily_data.get("trees", 0)
+        self.daily_giants = daily_data.get("giants", 0)
+        self.daily_focus_seconds = daily_data.get("focus_seconds", 0.0)
+        # 旧存档可能有没合并完的树苗；级数多于三级时，巨树的数量在这里进位到更高的级
+        self._merge_trees()
+
+    def save_main_progress(self):
+        """保存主进度"""
+        return {
+            "total_seedlings": self.total_seedlings,
+            "total_trees": self.total_trees,
+            "total_giants": self.total.value_from(2),
+            "merge_count": self.merge_count
+        }
+
+    def save_daily_progress(self):
+        """保存每日进度"""
+        return {
+            "date": str(datetime.date.today()),
+            "progress": self.daily_progress,
+            "seedlings": self.daily_seedlings,
+            "trees": self.daily_trees,
+            "giants": self.daily.value_from(2),
+            "score": self.get_daily_score(),
+            "focus_seconds": self.daily_focus_seconds
+        }
+
+    def update(self, loudness, dt=TIME_STEP):
+        """按真实经过的时间dt（秒）推进进度，返回是否长出了新树苗"""
+        if dt <= 0:
+            return False
+        steps = dt / TIME_STEP  # 相当于多少个原始的10ms步长
+
+        if self.morning_mode:
+            if loudness > self.threshold_high:
+                self.daily_progress += self.growth_speed * dt
+                self.daily_focus_seconds += dt
+            else:
+                self.daily_progress = max(0.0, self.daily_progress - 0.1 * steps)
+        else:
+            if loudness < self.threshold_low:
+                self.daily_progress += self.growth_speed * dt
+                self.daily_focus_seconds += dt
+            else:
+                self.daily_progress *= 0.92 ** steps
+
+        tree_changed = False
+        if self.daily_progress >= 100:
+            # 与原来一样满100%后从0重新开始；补算时一次跨过多个100%的部分各算一棵
+            new_seedlings = int(self.daily_progress // 100)
+            self.daily_progress = 0.0
+            self.add_seedlings(new_seedlings)
+            tree_changed = True
+
+        return tree_changed
+
+    def update_batch(self, loudness_array, dt=TIME_STEP):
+        """一次处理一整段音量序列（每个样本间隔dt秒），结果与逐个调用update完全相同
+
+        按阈值把序列切成连续的生长段和衰减段。长段用NumPy的accumulate按顺序累加/累乘，
+        短段（音量在阈值附近来回跳时几乎都是短段）在局部变量上逐个样本计算，
+        运算顺序与update相同，保证浮点结果逐位一致。返回新增的树苗数。
+        dt也可以是与音量等长的数组（实时采集时各block的实际间隔），见_update_steps。
+        """
+        import numpy as np
+        loudness = np.asarray(loudness_array)
+        if isinstance(dt, np.ndarray):
+            return self._update_steps(loudness.ravel(), dt.ravel())
+        if dt <= 0 or loudness.size == 0:
+            return 0
+        growing = self.growing_mask(loudness.ravel())
+
+        # 连续相同状态的段：[start, end)
+        bounds = np.flatnonzero(growing[1:] != growing[:-1]) + 1
+        lengths = np.diff(np.concatenate(([0], bounds, [growing.size]))).tolist()
+
+        steps = dt / TIME_STEP
+        increment = self.growth_speed * dt
+        morning = self.morning_mode
+        decay = 0.1 * steps if morning else 0.92 ** steps
+        progress = self.daily_progress
+        focus = self.daily_focus_seconds
+        new_seedlings = 0
+        grow = bool(growing[0])
+        for length in lengths:
+            if grow and length >= BATCH_MIN_RUN:
+                progress, credited = self._grow_run(progress, length, increment)
+                new_seedlings += credited
+                # 与逐次 += dt 的累加顺序相同
+                acc = np.full(length + 1, dt)
+                acc[0] = focus
+                focus = float(np.add.accumulate(acc)[-1])
+            elif grow:
+                for _ in range(length):
+                    progress += increment
+                    focus += dt
+                    if progress >= 100:
+                        credited = int(progress // 100)
+                        progress = 0.0
+                        self.add_seedlings(credited)
+                        new_seedlings += credited
+            else:
+                # 衰减不会让进度变大，只有第一步可能遇到超过100%的旧进度
+                progress = max(0.0, progress - decay) if morning else progress * decay
+                if progress >= 100:
+                    credited = int(progress // 100)
+                    progress = 0.0
+                    self.add_seedlings(credited)
+                    new_seedlings += credited
+                if length >= BATCH_MIN_RUN:
+                    progress = self._decay_run(progress, length - 1, decay)
+                elif morning:
+                    for _ in range(length - 1):
+                        progress = max(0.0, progress - decay)
+                else:
+                    for _ in range(length - 1):
+                        progress *= decay
+            grow = not grow
+
+        self.daily_progress = progress
+        self.daily_focus_seconds = focus
+        return new_seedlings
+
+    def _update_steps(self, loudness, dts):
+        """每个样本有自己的间隔dts时逐个样本计算，返回新增的树苗数
+
+        实时采集每次只有几个到几十个block，很少出现值得交给NumPy的长段，NumPy的固定开销反而更大；
+        这里在局部变量上按update的运算顺序计算，省掉每个样本一次方法调用和属性读写。
+        """
+        speed = self.growth_speed
+        morning = self.morning_mode
+        high = self.threshold_high
+        low = self.threshold_low
+        progress = self.daily_progress
+        focus = self.daily_focus_seconds
+        new_seedlings = 0
+        for value, dt in zip(loudness.tolist(), dts.tolist()):
+            if dt <= 0:
+                continue
+            if (value > high) if morning else (value < low):
+                progress += speed * dt
+                focus += dt
+            elif morning:
+                progress = max(0.0, progress - 0.1 * (dt / TIME_STEP))
+            else:
+                progress *= 0.92 ** (dt / TIME_STEP)
+            if progress >= 100:
+                credited = int(progress // 100)
+                progress = 0.0
+                self.add_seedlings(credited)
+                new_seedlings += credited
+
+        self.daily_progress = progress
+        self.daily_focus_seconds = focus
+        return new_seedlings
+
+    def growing_mask(self, loudness_array):
+        """按当前模式和阈值，返回每个音量样本是否处于生长状态"""
+        import numpy as np
+        loudness = np.asarray(loudness_array)
+        if self.morning_mode:
+            return loudness > self.threshold_high
+        return loudness < self.threshold_low
+
+    def _grow_run(self, progress, length, increment):
+        """从progress开始连续生长length步，处理中途的100%翻转，返回(新进度, 新增树苗数)"""
+        import numpy as np
+        credited = 0
+        while length > 0:
+            # 估算到下一次翻转需要的步数，只累加这一小段；不生长（速度为0）时一次累加完
+            if increment > 0:
+                chunk = min(length, max(1, int((100 - progress) / increment) + 2))
+            else:
+                chunk = length
+            acc = np.full(chunk + 1, increment)
+            acc[0] = progress
+            acc = np.add.accumulate(acc)[1:]
+            over = np.flatnonzero(acc >= 100)
+            if over.size == 0:
+                progress = float(acc[-1])
+                length -= chunk
+                continue
+            value = float(acc[over[0]])
+            n = int(value // 100)
+            progress = 0.0
+            self.add_seedlings(n)
+            credited += n
+            length -= int(over[0]) + 1
+        return progress, credited
+
+    def _decay_run(self, progress, length, decay):
+        """从progress开始连续衰减length步（进度已低于100%，不会翻转），返回新进度"""
+        import numpy as np
+        if length <= 0:
+            return progress
+        acc = np.full(length + 1, decay)
+        acc[0] = progress
+        if self.morning_mode:
+            acc = np.subtract.accumulate(acc)[1:]
+            return 0.0 if (acc <= 0).any() else float(acc[-1])
+        return float(np.multiply.accumulate(acc)[-1])
+
+    def add_seedlings(self, count):
+        """同时计入每日和总进度并逐级合并；一次加入很多树苗（导入、补算、回放）也只需O(级数)"""
+        if count <= 0:
+            return
+        self.daily.add(count)
+        self.total.add(count)
+        self.__dict__["generation"] += 1
+
+    def set_scores(self, daily_score, total_score):
+        """按分数重新设置当日和总进度（多实例模式下采用别的实例同步来的进度）"""
+        if self.daily.reset(daily_score) | self.total.reset(total_score):
+            self.__dict__["generation"] += 1
+
+    def _merge_trees(self):
+        """直接改了各级数量之后，把超过合并数量的部分进位"""
+        if self.daily.normalize() | self.total.normalize():
+            self.__dict__["generation"] += 1
+
+    def submit_daily_score(self):
+        daily_score = self.get_daily_score()
+        if daily_score == 0:
+            return
+
+        today_str = str(datetime.date.today())
+        if self.store is not None:
+            self.store.submit_score(today_str, daily_score)
+        else:
+            submit_score(today_str, daily_score)
+
+    def get_daily_score(self):
+        """返回当日分数（折算成树苗的数量）"""
+        return self.daily.score
+
+    def get_total_score(self):
+        """返回总分数"""
+        return self.total.score